@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.bulkimport - Subscribe to many podcasts at once
+#
+#  Used when importing OPML files (or podcast lists from a directory):
+#  the URLs are checked against the existing subscriptions, all new
+#  podcasts are created in one transaction, and their feeds are then
+#  fetched for the first time by a pool of worker threads.
+#
+
+import concurrent.futures
+import logging
+import threading
+
+import gpodder
+from gpodder import util, youtube
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+# Number of feeds fetched at the same time (per-host limits still apply)
+WORKERS = 8
+
+
+class BulkImport(object):
+    """Subscribe to a list of podcasts.
+
+    After run(), worked is the list of new podcasts, existing the URLs
+    that were already subscribed to, and failed maps URLs to the
+    exception that made the subscription fail.
+    """
+
+    def __init__(self, model, max_episodes=0, workers=WORKERS):
+        self.model = model
+        self.max_episodes = max_episodes
+        self.workers = max(1, workers)
+        self.worked = []
+        self.existing = []
+        self.failed = {}
+        self.cancelled = False
+        # Finishing subscriptions picks unique download folders
+        self._lock = threading.Lock()
+
+    def cancel(self):
+        """Don't fetch any more feeds (podcasts already fetched are kept)."""
+        self.cancelled = True
+
+    def _create(self, items, auth_tokens):
+        """Create the new podcasts in one transaction.
+
+        Returns a list of (podcast, title, section) tuples.
+        """
+        existing_urls = {podcast.url for podcast in self.model.get_podcasts()}
+        created = []
+        for item in items:
+            input_url = item['url']
+            url = youtube.parse_youtube_url(util.normalize_feed_url(input_url))
+            if url is None:
+                self.failed[input_url] = ValueError(_('Invalid URL'))
+                continue
+
+            if url in existing_urls:
+                self.existing.append(url)
+                continue
+            existing_urls.add(url)
+
+            podcast = self.model.PodcastClass(self.model)
+            podcast.url = url
+            tokens = auth_tokens.get(url) or auth_tokens.get(input_url)
+            if tokens is not None:
+                podcast.auth_username, podcast.auth_password = tokens
+            podcast.save()
+            created.append((podcast, item.get('title'), item.get('section')))
+
+        self.model.db.commit()
+        return created
+
+    def _subscribe(self, podcast, title, section):
+        if self.cancelled:
+            podcast.delete()
+            return False
+
+        podcast.first_update(self.max_episodes)
+
+        with self._lock:
+            podcast.finish_subscription()
+
+            if title:
+                # Prefer title from subscription source (bug 1711)
+                podcast.rename(title)
+            if section:
+                podcast.section = section
+
+            try:
+                username, password = util.username_password_from_url(podcast.url)
+            except ValueError:
+                username, password = (None, None)
+
+            if username is not None and podcast.auth_username is None and \
+                    password is not None and podcast.auth_password is None:
+                podcast.auth_username = username
+                podcast.auth_password = password
+
+            podcast.save()
+        return True
+
+    def run(self, items, auth_tokens=None, progress=None):
+        """Subscribe to items (dicts with url, and optionally title and section).
+
+        auth_tokens maps URLs to (username, password) tuples. progress is
+        called with (number of feeds done, total, url, exception or None)
+        after each feed.
+        """
+        created = self._create(items, auth_tokens or {})
+        total = len(created)
+        logger.info('Subscribing to %d podcasts (%d already subscribed)', total, len(self.existing))
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers) as executor:
+            futures = {executor.submit(self._subscribe, *args): args[0] for args in created}
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                podcast = futures[future]
+                error = None
+                try:
+                    if future.result():
+                        self.worked.append(podcast)
+                except Exception as e:
+                    logger.warning('Subscription error: %s: %s', podcast.url, e, exc_info=True)
+                    # use e.url because there might have been a redirection (#571)
+                    self.failed[getattr(e, 'url', None) or podcast.url] = error = e
+
+                if progress is not None:
+                    progress(done, total, podcast.url, error)
+
+        self.model.db.commit()
+        return self
@@ -26,7 +26,7 @@ import logging
 import os
 
 import gpodder
-from gpodder import util
+from gpodder import download, util
 
 logger = logging.getLogger(__name__)
 
@@ -77,6 +77,7 @@ def find_partial_downloads(channels, start_progress_callback, progress_callback,
                         # The file has already been downloaded;
                         # remove the leftover partial file
                         util.delete_file(filename + '.partial')
+                        download.ResumeInfo.delete(filename + '.partial')
                     else:
                         resumable_episodes.append(episode)
 
@@ -91,6 +92,7 @@ def find_partial_downloads(channels, start_progress_callback, progress_callback,
         for f in partial_files:
             logger.warning('Partial file without episode: %s', f)
             util.delete_file(f)
+            download.ResumeInfo.delete(f)
 
     # never delete partial: either we can't clean them up because we offer to
     # resume download or there are none to delete in the first place.
@@ -52,6 +52,10 @@ defaults = {
             'type': 'desktop',
             'caption': _('gPodder on %s') % util.get_hostname(),
         },
+        'upload': {
+            'chunk_size': 100,  # actions per request
+            'compress': False,  # gzip request bodies (only if the server accepts them)
+        },
     },
 
     # Various limits (downloading, updating, etc..)
@@ -66,11 +70,25 @@ defaults = {
             'concurrent_max': 16,
         },
         'episodes': 200,  # max episodes per feed
+        'free_space': {
+            'enabled': True,  # hold back downloads that would fill the download disk
+            'reserve': 256,  # MiB to keep free on the download disk
+            'cleanup': False,  # delete expired episodes when downloads are held back
+        },
+        'hosts': {
+            'adaptive': True,  # adapt concurrent connections per host to throttling
+            'connections': 4,  # max concurrent connections per host
+        },
+        'parse': {
+            'processes': 0,  # parse large feeds in this many processes (0: in the calling thread)
+            'min_size': 512,  # KiB, smaller feeds are always parsed in the calling thread
+        },
     },
 
     # Behavior of downloads
     'downloads': {
         'chronological_order': True,  # download older episodes first
+        'deduplicate': False,  # link identical enclosures of other podcasts instead of downloading them
     },
 
     # Automatic feed updates, download removal and retry on download timeout
@@ -78,6 +96,8 @@ defaults = {
         'update': {
             'enabled': False,
             'frequency': 20,  # minutes
+            'adaptive': True,  # check feeds less often if they publish rarely
+            'max_interval': 24,  # hours between checks of rarely updated feeds
         },
 
         'cleanup': {
@@ -88,6 +108,14 @@ defaults = {
         },
 
         'retries': 3,  # number of retries when downloads time out
+
+        # Retry failed downloads and feed updates later, with exponential backoff
+        'backoff': {
+            'enabled': True,
+            'attempts': 8,  # give up after this many failed attempts
+            'initial': 60,  # seconds
+            'maximum': 21600,  # seconds (6 hours)
+        },
     },
 
     'check_connection': True,
@@ -205,6 +233,24 @@ defaults = {
 
         'compare_episode_filesize': True,
 
+        # Number of files copied at the same time
+        'copy_streams': {
+            'local': 2,  # local file systems (USB storage, SD cards, SSDs)
+            'gio': 1,  # MTP and other GVFS locations
+        },
+
+        # Transcode audio episodes when syncing (see gpodder.transcode)
+        'transcode': {
+            'enabled': False,
+            'profile': 'mp3',  # 'mp3', 'ogg' or 'opus'
+            'cache_size': 2048,  # MiB of transcoded files to keep
+        },
+
+        # Write the iPod database after this many tracks have been added or
+        # removed, so an interrupted sync keeps most of its work (0 = only
+        # at the end of the sync)
+        'ipod_commit_interval': 25,
+
         'custom_sync_name': '{episode.sortdate}_{episode.title}',
         'custom_sync_name_enabled': False,
         'use_title_as_filename': False,
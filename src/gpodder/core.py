@@ -22,7 +22,8 @@
 
 
 import gpodder
-from gpodder import config, dbsqlite, extensions, model, util
+from gpodder import (config, dbsqlite, extensions, hosthealth, model,
+                     parsepool, util, youtube)
 
 
 class Core(object):
@@ -38,6 +39,14 @@ class Core(object):
         self.model = model_class(self.db)
         self.config = config_class(gpodder.config_file)
 
+        # Per-host statistics and connection limits learned in earlier sessions
+        hosthealth.hosts.configure(self.config)
+        hosthealth.hosts.load(hosthealth.hosts_file())
+        youtube.duration_lookups.load(youtube.duration_lookups_file())
+
+        # Large feeds can be parsed in worker processes
+        parsepool.pool.configure(self.config)
+
         # Load extension modules and install the extension manager
         gpodder.user_extensions = extensions.ExtensionManager(self)
 
@@ -51,5 +60,10 @@ class Core(object):
         # Notify all extensions that we are being shut down
         gpodder.user_extensions.shutdown()
 
+        # Remember host statistics and connection limits
+        hosthealth.hosts.save(hosthealth.hosts_file())
+        youtube.duration_lookups.save(youtube.duration_lookups_file())
+        parsepool.pool.shutdown()
+
         # Close the database and store outstanding changes
         self.db.close()
@@ -24,7 +24,9 @@
 # 2010-04-24 Thomas Perl <thp@gpodder.org>
 #
 
+import json
 import logging
+import os
 import threading
 from sqlite3 import dbapi2 as sqlite
 
@@ -39,6 +41,14 @@ logger = logging.getLogger(__name__)
 class Database(object):
     TABLE_PODCAST = 'podcast'
     TABLE_EPISODE = 'episode'
+    TABLE_ENCLOSURE = 'enclosure'
+    TABLE_RETRY = 'retry'
+    TABLE_UPDATE_SCHEDULE = 'update_schedule'
+    TABLE_UPDATE_TIMING = 'update_timing'
+    TABLE_FEED_PAGE = 'feed_page'
+
+    # Weight of the latest update in the moving average of update timings
+    TIMING_WEIGHT = 0.2
 
     def __init__(self, filename):
         self.database_file = filename
@@ -76,6 +86,9 @@ class Database(object):
                 (SELECT id FROM %s WHERE podcast_id = ?
                 ORDER BY published DESC LIMIT ?)""" % (self.TABLE_EPISODE, self.TABLE_EPISODE)
             cur.execute(sql, (podcast_id, gpodder.STATE_DOWNLOADED, podcast_id, max_episodes))
+            if cur.rowcount:
+                cur.execute("DELETE FROM %s WHERE kind = 'episode' AND object_id NOT IN (SELECT id FROM %s)"
+                        % (self.TABLE_RETRY, self.TABLE_EPISODE))
 
             cur.close()
 
@@ -189,6 +202,14 @@ class Database(object):
             logger.debug('delete_podcast: %d (%s)', podcast.id, podcast.url)
 
             cur.execute("DELETE FROM %s WHERE id = ?" % self.TABLE_PODCAST, (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE episode_id IN (SELECT id FROM %s WHERE podcast_id = ?)"
+                    % (self.TABLE_ENCLOSURE, self.TABLE_EPISODE), (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE kind = 'episode' AND object_id IN (SELECT id FROM %s WHERE podcast_id = ?)"
+                    % (self.TABLE_RETRY, self.TABLE_EPISODE), (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE kind = 'podcast' AND object_id = ?" % self.TABLE_RETRY, (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE podcast_id = ?" % self.TABLE_UPDATE_SCHEDULE, (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE podcast_id = ?" % self.TABLE_UPDATE_TIMING, (podcast.id, ))
+            cur.execute("DELETE FROM %s WHERE podcast_id = ?" % self.TABLE_FEED_PAGE, (podcast.id, ))
             cur.execute("DELETE FROM %s WHERE podcast_id = ?" % self.TABLE_EPISODE, (podcast.id, ))
 
             cur.close()
@@ -273,5 +294,239 @@ class Database(object):
 
         with self.lock:
             cur = self.cursor()
+            cur.execute("DELETE FROM %s WHERE kind = 'episode' AND object_id IN (SELECT id FROM %s WHERE podcast_id = ? AND guid = ?)"
+                    % (self.TABLE_RETRY, self.TABLE_EPISODE), (podcast_id, guid))
             cur.execute('DELETE FROM %s WHERE podcast_id = ? AND guid = ?' %
                     self.TABLE_EPISODE, (podcast_id, guid))
+
+    def get_downloaded_files_by_url(self, url, exclude_episode_id=None):
+        """Find downloaded episodes with the given enclosure URL.
+
+        Returns a list of (episode_id, filename) tuples, where the
+        filename is relative to the downloads folder.
+        """
+        url = util.convert_bytes(url)
+
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT e.id, p.download_folder, e.download_filename '
+                        'FROM %s e JOIN %s p ON e.podcast_id = p.id '
+                        'WHERE e.url = ? AND e.state = ? AND e.download_filename IS NOT NULL AND e.id IS NOT ?'
+                        % (self.TABLE_EPISODE, self.TABLE_PODCAST),
+                        (url, gpodder.STATE_DOWNLOADED, exclude_episode_id))
+            result = [(episode_id, os.path.join(folder, filename)) for episode_id, folder, filename in cur]
+            cur.close()
+
+        return result
+
+    def get_downloaded_files(self):
+        """Return (episode_id, filename, file_size) for all downloaded episodes.
+
+        The filename is relative to the downloads folder.
+        """
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT e.id, p.download_folder, e.download_filename, e.file_size '
+                        'FROM %s e JOIN %s p ON e.podcast_id = p.id '
+                        'WHERE e.state = ? AND e.download_filename IS NOT NULL'
+                        % (self.TABLE_EPISODE, self.TABLE_PODCAST), (gpodder.STATE_DOWNLOADED,))
+            result = [(episode_id, os.path.join(folder, filename), file_size)
+                      for episode_id, folder, filename, file_size in cur]
+            cur.close()
+
+        return result
+
+    def get_enclosure_hash(self, episode_id, file_size, mtime):
+        """Return the stored content hash, if the file has not changed since."""
+        return self.get('SELECT content_hash FROM %s WHERE episode_id = ? AND file_size = ? AND mtime = ?'
+                        % self.TABLE_ENCLOSURE, (episode_id, file_size, mtime))
+
+    def save_enclosure_hash(self, episode_id, file_size, mtime, content_hash, linked_to=None):
+        """Store the content hash of a file.
+
+        linked_to is the episode whose file this one shares its data with.
+        """
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('INSERT OR REPLACE INTO %s (episode_id, file_size, mtime, content_hash, linked_to) '
+                        'VALUES (?, ?, ?, ?, ?)'
+                        % self.TABLE_ENCLOSURE, (episode_id, file_size, mtime, content_hash, linked_to))
+            cur.close()
+
+    def get_enclosure_link(self, episode_id):
+        """Return the episode a deduplicated file was linked to, or None."""
+        return self.get('SELECT linked_to FROM %s WHERE episode_id = ?' % self.TABLE_ENCLOSURE, (episode_id,))
+
+    def get_downloaded_files_by_hash(self, content_hash, file_size, exclude_episode_id=None):
+        """Find downloaded episodes with the given content hash.
+
+        Returns a list of (episode_id, filename) tuples, where the
+        filename is relative to the downloads folder.
+        """
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT e.id, p.download_folder, e.download_filename '
+                        'FROM %s x JOIN %s e ON x.episode_id = e.id JOIN %s p ON e.podcast_id = p.id '
+                        'WHERE x.content_hash = ? AND x.file_size = ? AND e.state = ? '
+                        'AND e.download_filename IS NOT NULL AND e.id IS NOT ?'
+                        % (self.TABLE_ENCLOSURE, self.TABLE_EPISODE, self.TABLE_PODCAST),
+                        (content_hash, file_size, gpodder.STATE_DOWNLOADED, exclude_episode_id))
+            result = [(episode_id, os.path.join(folder, filename)) for episode_id, folder, filename in cur]
+            cur.close()
+
+        return result
+
+    def purge_enclosure_hashes(self):
+        """Forget content hashes of episodes that are no longer downloaded."""
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('DELETE FROM %s WHERE episode_id NOT IN (SELECT id FROM %s WHERE state = ?)'
+                        % (self.TABLE_ENCLOSURE, self.TABLE_EPISODE), (gpodder.STATE_DOWNLOADED,))
+            cur.close()
+
+    def get_retry_attempts(self, kind, object_id):
+        return self.get('SELECT attempts FROM %s WHERE kind = ? AND object_id = ?'
+                        % self.TABLE_RETRY, (kind, object_id))
+
+    def get_retry_time(self, kind, object_id):
+        return self.get('SELECT next_attempt FROM %s WHERE kind = ? AND object_id = ?'
+                        % self.TABLE_RETRY, (kind, object_id))
+
+    def get_due_retries(self, kind, now):
+        """Return the ids of all objects of a kind whose next attempt is due.
+
+        Objects without a next attempt (given up on) are never due.
+        """
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT object_id FROM %s WHERE kind = ? AND next_attempt <= ? ORDER BY next_attempt'
+                        % self.TABLE_RETRY, (kind, now))
+            result = [object_id for (object_id,) in cur]
+            cur.close()
+
+        return result
+
+    def get_episode_podcast_ids(self, episode_ids):
+        """Return a dict that maps the given episode ids to their podcast ids."""
+        episode_ids = list(episode_ids)
+        result = {}
+        with self.lock:
+            cur = self.cursor()
+            # Stay below SQLite's limit of host parameters per statement
+            for i in range(0, len(episode_ids), 500):
+                chunk = episode_ids[i:i + 500]
+                cur.execute('SELECT id, podcast_id FROM %s WHERE id IN (%s)'
+                            % (self.TABLE_EPISODE, ', '.join('?' * len(chunk))), chunk)
+                result.update(cur)
+            cur.close()
+
+        return result
+
+    def postpone_retry(self, kind, object_id, next_attempt):
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('UPDATE %s SET next_attempt = ? WHERE kind = ? AND object_id = ? AND next_attempt IS NOT NULL'
+                        % self.TABLE_RETRY, (next_attempt, kind, object_id))
+            if cur.rowcount:
+                self.db.commit()
+            cur.close()
+
+    def save_retry(self, kind, object_id, attempts, next_attempt, error):
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('INSERT OR REPLACE INTO %s (kind, object_id, attempts, next_attempt, error) VALUES (?, ?, ?, ?, ?)'
+                        % self.TABLE_RETRY, (kind, object_id, attempts, next_attempt, error))
+            cur.close()
+            # The schedule has to survive a crash or kill, too
+            self.db.commit()
+
+    def delete_retry(self, kind, object_id):
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('DELETE FROM %s WHERE kind = ? AND object_id = ?' % self.TABLE_RETRY, (kind, object_id))
+            if cur.rowcount:
+                self.db.commit()
+            cur.close()
+
+    def get_publish_times(self, podcast_id, limit):
+        """Return the publish times of the most recent episodes, newest first."""
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT published FROM %s WHERE podcast_id = ? AND published > 0 ORDER BY published DESC LIMIT ?'
+                        % self.TABLE_EPISODE, (podcast_id, limit))
+            result = [published for (published,) in cur]
+            cur.close()
+
+        return result
+
+    def get_update_schedule(self, podcast_id):
+        """Return (next_check, unchanged) of a podcast, or None."""
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT next_check, unchanged FROM %s WHERE podcast_id = ?'
+                        % self.TABLE_UPDATE_SCHEDULE, (podcast_id,))
+            row = cur.fetchone()
+            cur.close()
+
+        return row
+
+    def save_update_schedule(self, podcast_id, next_check, unchanged):
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('INSERT OR REPLACE INTO %s (podcast_id, next_check, unchanged) VALUES (?, ?, ?)'
+                        % self.TABLE_UPDATE_SCHEDULE, (podcast_id, next_check, unchanged))
+            cur.close()
+
+    def save_update_timing(self, podcast_id, phases):
+        """Add the seconds spent in each phase of an update to the moving averages."""
+        with self.lock:
+            cur = self.cursor()
+            for phase, seconds in phases.items():
+                cur.execute('SELECT samples, average, maximum FROM %s WHERE podcast_id = ? AND phase = ?'
+                            % self.TABLE_UPDATE_TIMING, (podcast_id, phase))
+                row = cur.fetchone()
+                if row is None:
+                    samples, average, maximum = 1, seconds, seconds
+                else:
+                    samples, average, maximum = row
+                    samples += 1
+                    average += self.TIMING_WEIGHT * (seconds - average)
+                    maximum = max(maximum, seconds)
+                cur.execute('INSERT OR REPLACE INTO %s (podcast_id, phase, samples, average, last, maximum) '
+                            'VALUES (?, ?, ?, ?, ?, ?)' % self.TABLE_UPDATE_TIMING,
+                            (podcast_id, phase, samples, average, seconds, maximum))
+            cur.close()
+
+    def get_update_timing(self):
+        """Return (podcast_id, phase, samples, average, last, maximum) rows of all podcasts."""
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT podcast_id, phase, samples, average, last, maximum FROM %s'
+                        % self.TABLE_UPDATE_TIMING)
+            result = cur.fetchall()
+            cur.close()
+
+        return result
+
+    def get_feed_page(self, podcast_id, url):
+        """Return (max_episodes, etag, last_modified, next_url, guids) of a feed page, or None."""
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('SELECT max_episodes, etag, last_modified, next_url, guids FROM %s WHERE podcast_id = ? AND url = ?'
+                        % self.TABLE_FEED_PAGE, (podcast_id, url))
+            row = cur.fetchone()
+            cur.close()
+
+        if row is None:
+            return None
+
+        max_episodes, etag, last_modified, next_url, guids = row
+        return max_episodes, etag, last_modified, next_url, json.loads(guids)
+
+    def save_feed_page(self, podcast_id, url, max_episodes, etag, last_modified, next_url, guids):
+        with self.lock:
+            cur = self.cursor()
+            cur.execute('INSERT OR REPLACE INTO %s (podcast_id, url, max_episodes, etag, last_modified, next_url, guids) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)' % self.TABLE_FEED_PAGE,
+                        (podcast_id, url, max_episodes, etag, last_modified, next_url, json.dumps(guids)))
+            cur.close()
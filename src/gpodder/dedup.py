@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.dedup - Deduplication of identical enclosures across podcasts
+#
+#  Episodes with the same enclosure URL (network feeds, "best-of" feeds,
+#  premium/free twins) are linked to the already downloaded file instead
+#  of being downloaded again. After a download, files are indexed by their
+#  content hash, and byte-identical files are replaced by links as well.
+#  The episode a file was linked to is recorded, because reflinked files
+#  cannot be told apart from copies by their inode.
+#
+
+import collections
+import hashlib
+import logging
+import os
+import shutil
+
+import gpodder
+from gpodder import util
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+# ioctl request for cloning a file (btrfs, XFS, ...), see ioctl_ficlone(2)
+FICLONE = 0x40049409
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def content_hash(filename):
+    """Return the SHA-256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        for block in iter(lambda: fp.read(HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def normalize_url(url):
+    """Normalize an enclosure URL for duplicate lookups.
+
+    Authentication is never part of the index key.
+    """
+    return util.url_strip_authentication(url.strip())
+
+
+def reflink(src, dst):
+    """Create dst as a copy-on-write clone of src.
+
+    Raises OSError if the file system does not support it.
+    """
+    if fcntl is None:
+        raise OSError('Reflinks are not supported on this platform')
+
+    with open(src, 'rb') as src_fp, open(dst, 'wb') as dst_fp:
+        try:
+            fcntl.ioctl(dst_fp.fileno(), FICLONE, src_fp.fileno())
+        except OSError:
+            dst_fp.close()
+            util.delete_file(dst)
+            raise
+
+
+def link_file(src, dst, hardlink=True):
+    """Make dst share its data with src (replacing dst, if it exists).
+
+    A reflink is preferred, because the copy can then be modified
+    (e.g. by the tagging extension) without affecting src. A hardlink is
+    used otherwise, or a plain copy if hardlink is False. Raises OSError
+    if nothing works (e.g. the files are on different file systems).
+    Returns the method used ('reflink', 'hardlink' or 'copy').
+    """
+    tmp = dst + '.dedup'
+    util.delete_file(tmp)
+    try:
+        reflink(src, tmp)
+        method = 'reflink'
+    except OSError:
+        if hardlink:
+            os.link(src, tmp)
+            method = 'hardlink'
+        else:
+            shutil.copyfile(src, tmp)
+            method = 'copy'
+
+    util.atomic_rename(tmp, dst)
+    logger.debug('Linked %s to %s (%s)', dst, src, method)
+    return method
+
+
+def same_file(a, b):
+    try:
+        return os.path.samefile(a, b)
+    except OSError:
+        return False
+
+
+class EnclosureIndex(object):
+    """Index of downloaded enclosures by URL and by content hash."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def _path(self, filename):
+        return os.path.join(gpodder.downloads, filename)
+
+    def find_by_url(self, episode):
+        """Return (episode_id, path) of an existing download of the episode's enclosure, or None."""
+        if not episode.url:
+            return None
+
+        for episode_id, filename in self.db.get_downloaded_files_by_url(normalize_url(episode.url), episode.id):
+            path = self._path(filename)
+            if os.path.isfile(path) and os.path.getsize(path) > 0:
+                return episode_id, path
+
+        return None
+
+    def get_hash(self, episode_id, filename):
+        """Return the content hash of a downloaded file, hashing it if necessary."""
+        st = os.stat(filename)
+        mtime = int(st.st_mtime)
+        result = self.db.get_enclosure_hash(episode_id, st.st_size, mtime)
+        if result is None:
+            result = content_hash(filename)
+            self.db.save_enclosure_hash(episode_id, st.st_size, mtime, result)
+        return result
+
+    def add(self, episode, filename, cloned_from=None):
+        """Index a finished download and link it to an identical file.
+
+        This must be called after the extensions have processed the file,
+        because a hardlinked file cannot be modified in place. cloned_from
+        is the episode whose file has been reflinked to filename already.
+        Returns the number of bytes reclaimed.
+        """
+        try:
+            digest = self.get_hash(episode.id, filename)
+            size = os.path.getsize(filename)
+        except OSError:
+            logger.warning('Cannot hash %s', filename, exc_info=True)
+            return 0
+
+        for episode_id, other in self.db.get_downloaded_files_by_hash(digest, size, episode.id):
+            other = self._path(other)
+            if not os.path.isfile(other):
+                continue
+
+            if episode_id == cloned_from or same_file(filename, other):
+                self.db.save_enclosure_hash(episode.id, size, int(os.path.getmtime(filename)), digest, episode_id)
+                return 0
+
+            try:
+                link_file(other, filename)
+            except OSError:
+                logger.info('Cannot link %s to %s', filename, other, exc_info=True)
+                return 0
+
+            self.db.save_enclosure_hash(episode.id, size, int(os.path.getmtime(filename)), digest, episode_id)
+            logger.info('Deduplicated %s (%s reclaimed)', filename, util.format_filesize(size))
+            return size
+
+        return 0
+
+    def deduplicate(self, progress_callback=None):
+        """Link all byte-identical downloaded files in the library.
+
+        Only files of the same size are hashed. progress_callback(done, total)
+        is called while hashing. Returns (files_linked, bytes_reclaimed).
+        """
+        self.db.purge_enclosure_hashes()
+
+        by_size = collections.defaultdict(list)
+        for episode_id, filename, file_size in self.db.get_downloaded_files():
+            path = self._path(filename)
+            try:
+                size = os.path.getsize(path)
+            except OSError:
+                continue
+            if size > 0:
+                by_size[size].append((episode_id, path))
+
+        candidates = [group for group in by_size.values() if len(group) > 1]
+        total = sum(len(group) for group in candidates)
+        done = 0
+
+        files_linked, bytes_reclaimed = 0, 0
+        for group in candidates:
+            by_hash = collections.defaultdict(list)
+            for episode_id, path in group:
+                try:
+                    by_hash[self.get_hash(episode_id, path)].append((episode_id, path))
+                except OSError:
+                    logger.warning('Cannot hash %s', path, exc_info=True)
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, total)
+
+            for digest, files in by_hash.items():
+                # Reflinked files have their own inode, so their recorded link
+                # tells whether they already share their data with the group
+                ids = set(episode_id for episode_id, path in files)
+                linked = set(episode_id for episode_id, path in files
+                             if self.db.get_enclosure_link(episode_id) in ids)
+                files.sort(key=lambda f: f[0] in linked)
+                original_id, original = files[0]
+                for episode_id, path in files[1:]:
+                    if episode_id in linked or same_file(original, path):
+                        continue
+                    try:
+                        size = os.path.getsize(path)
+                        link_file(original, path)
+                        self.db.save_enclosure_hash(episode_id, size, int(os.path.getmtime(path)), digest, original_id)
+                    except OSError:
+                        logger.warning('Cannot link %s to %s', path, original, exc_info=True)
+                        continue
+                    files_linked += 1
+                    bytes_reclaimed += size
+
+        self.db.commit()
+        logger.info('Deduplicated %d files (%s reclaimed)', files_linked, util.format_filesize(bytes_reclaimed))
+        return files_linked, bytes_reclaimed
@@ -34,6 +34,9 @@ _ = gpodder.gettext
 
 logger = logging.getLogger(__name__)
 
+# playlist URI -> (_query_file() result, entries) of playlists we have read or written
+_playlist_cache = {}
+
 
 class gPodderDevicePlaylist(object):
     def __init__(self, config, playlist_name):
@@ -42,7 +45,7 @@ class gPodderDevicePlaylist(object):
         self.playlist_file = (
             util.sanitize_filename(playlist_name, self._config.device_sync.max_filename_length)
             + '.' + self._config.device_sync.playlists.extension)
-        device_folder = util.new_gio_file(self._config.device_sync.device_folder)
+        device_folder = self.device_folder = util.new_gio_file(self._config.device_sync.device_folder)
         self.playlist_folder = device_folder.resolve_relative_path(self._config.device_sync.playlists.folder)
         self.playlist_to_device_relpath = os.path.relpath(device_folder, self.playlist_folder)
 
@@ -90,68 +93,135 @@ class gPodderDevicePlaylist(object):
 
         return "#EXTINF:0,%s%s" % (title.strip(), self.linebreak)
 
+    def _query_file(self):
+        """Return the (modification time, microseconds, size) of the playlist file, or None if it doesn't exist."""
+        try:
+            info = self.playlist_absolute_filename.query_info(
+                ','.join((Gio.FILE_ATTRIBUTE_TIME_MODIFIED, Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC,
+                          Gio.FILE_ATTRIBUTE_STANDARD_SIZE)),
+                Gio.FileQueryInfoFlags.NONE, None)
+        except GLib.Error:
+            return None
+        return (info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED),
+                info.get_attribute_uint32(Gio.FILE_ATTRIBUTE_TIME_MODIFIED_USEC),
+                info.get_size())
+
+    def read_entries(self):
+        """Read the (#EXTINF line, filename) entries of the existing playlist.
+
+        Returns None if the playlist doesn't exist. The #EXTINF line is None
+        if a file has no #EXTINF line. Playlists that haven't changed since
+        we last read or wrote them are not read again.
+        """
+        uri = self.playlist_absolute_filename.get_uri()
+        stat = self._query_file()
+        if stat is None:
+            return None
+
+        cached = _playlist_cache.get(uri)
+        if cached is not None and cached[0] == stat:
+            return cached[1]
+
+        logger.info("Read data from the playlistfile %s" % uri)
+        try:
+            contents = self.playlist_absolute_filename.load_contents(None)[1]
+        except GLib.Error as err:
+            logger.warning('Reading playlist file %s failed: %s', uri, err.message)
+            return []
+
+        entries = []
+        extinf = None
+        for line in contents.decode('utf-8', errors='replace').splitlines():
+            if not line:
+                continue
+            if line.startswith('#EXTINF'):
+                extinf = line + self.linebreak
+            elif not line.startswith('#EXT'):
+                entries.append((extinf, line))
+                extinf = None
+
+        _playlist_cache[uri] = (stat, entries)
+        return entries
+
     def read_m3u(self):
         """Read all files from the existing playlist."""
-        tracks = []
-        logger.info("Read data from the playlistfile %s" % self.playlist_absolute_filename.get_uri())
-        if self.playlist_absolute_filename.query_exists():
-            stream = Gio.DataInputStream.new(self.playlist_absolute_filename.read())
-            while True:
-                line = stream.read_line_utf8()[0]
-                if not line:
-                    break
-                if not line.startswith('#EXT'):
-                    tracks.append(line.rstrip('\r\n'))
-            stream.close()
-        return tracks
+        return [filename for extinf, filename in self.read_entries() or []]
 
     def get_filename_for_playlist(self, episode):
         """Get the filename for the given episode for the playlist."""
         return episode_filename_on_device(self._config, episode)
 
-    def get_path_to_filename_for_playlist(self, episode):
+    def get_path_to_filename_for_playlist(self, episode, filename=None):
         """Get the filename including full path for the given episode for the playlist."""
-        filename = self.get_filename_for_playlist(episode)
+        if filename is None:
+            filename = self.get_filename_for_playlist(episode)
         foldername = episode_foldername_on_device(self._config, episode)
         if foldername:
             filename = os.path.join(foldername, filename)
         if self._config.device_sync.playlists.use_absolute_path:
-            device_folder = util.new_gio_file(self._config.device_sync.device_folder)
-            file_ = device_folder.resolve_relative_path(filename)
+            file_ = self.device_folder.resolve_relative_path(filename)
             filename = "/" + util.relpath(file_.get_path(), self.mountpoint.get_path())
         else:
             filename = os.path.join(self.playlist_to_device_relpath, filename)
         return filename
 
+    def build_entries(self, episodes):
+        """Return the (#EXTINF line, filename) entries of the playlist for episodes."""
+        entries = []
+        for episode in episodes:
+            filename = self.get_filename_for_playlist(episode)
+            entries.append((self.build_extinf(filename, episode=episode),
+                            self.get_path_to_filename_for_playlist(episode, filename)))
+        return entries
+
     def write_m3u(self, episodes):
-        """Write the list into the playlist on the device."""
-        logger.info('Writing playlist file: %s', self.playlist_file)
+        """Write the list into the playlist on the device.
+
+        The playlist is only written if its entries have changed. Returns
+        True if the playlist was written.
+        """
+        entries = self.build_entries(episodes)
+        existing = self.read_entries()
+        if entries == existing:
+            logger.info('Playlist file is up to date: %s', self.playlist_file)
+            return False
+
+        old, new = set(existing or []), set(entries)
+        logger.info('Writing playlist file: %s (%d added, %d removed)',
+                    self.playlist_file, len(new - old), len(old - new))
         if not util.make_directory(self.playlist_folder):
             raise IOError(_('Folder %s could not be created.') % self.playlist_folder, _('Error writing playlist'))
-        else:
+
+        contents = ['#EXTM3U%s' % self.linebreak]
+        for extinf, filename in entries:
+            if extinf is not None:
+                contents.append(extinf)
+            contents.append(filename)
+            contents.append(self.linebreak)
+        contents = ''.join(contents).encode('utf-8')
+
+        try:
             # work around libmtp devices potentially having limited capabilities for partial writes
-            is_mtp = self.playlist_folder.get_uri().startswith("mtp://")
-            tempfile = None
-            if is_mtp:
+            if self.playlist_folder.get_uri().startswith("mtp://"):
                 tempfile = Gio.File.new_tmp()
-                fs = tempfile[1].get_output_stream()
-            else:
-                fs = self.playlist_absolute_filename.replace(None, False, Gio.FileCreateFlags.NONE)
-
-            os = Gio.DataOutputStream.new(fs)
-            os.put_string('#EXTM3U%s' % self.linebreak)
-            for current_episode in episodes:
-                filename = self.get_filename_for_playlist(current_episode)
-                os.put_string(self.build_extinf(filename, episode=current_episode))
-                filename = self.get_path_to_filename_for_playlist(current_episode)
-                os.put_string(filename)
-                os.put_string(self.linebreak)
-            os.close()
-
-            if is_mtp:
                 try:
+                    fs = tempfile[1].get_output_stream()
+                    fs.write_all(contents, None)
+                    fs.close()
                     tempfile[0].copy(self.playlist_absolute_filename, Gio.FileCopyFlags.OVERWRITE)
-                except GLib.Error as err:
-                    logger.error('copying playlist to mtp device file %s failed: %s',
-                        self.playlist_absolute_filename.get_uri(), err.message)
-                tempfile[0].delete()
+                finally:
+                    tempfile[0].delete()
+            else:
+                # written to a temporary file that replaces the playlist when complete
+                self.playlist_absolute_filename.replace_contents(contents, None, False,
+                                                                 Gio.FileCreateFlags.NONE, None)
+        except GLib.Error as err:
+            logger.error('writing playlist file %s failed: %s',
+                         self.playlist_absolute_filename.get_uri(), err.message)
+            _playlist_cache.pop(self.playlist_absolute_filename.get_uri(), None)
+            raise IOError(err.message, _('Error writing playlist'))
+
+        stat = self._query_file()
+        if stat is not None:
+            _playlist_cache[self.playlist_absolute_filename.get_uri()] = (stat, entries)
+        return True
@@ -26,6 +26,7 @@
 #
 
 import glob
+import json
 import logging
 import mimetypes
 import os
@@ -40,10 +41,9 @@ import requests
 from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError, RequestException
 from requests.packages.urllib3.exceptions import MaxRetryError
-from requests.packages.urllib3.util.retry import Retry
 
 import gpodder
-from gpodder import config, registry, util
+from gpodder import config, dedup, hosthealth, registry, retry, util
 
 logger = logging.getLogger(__name__)
 
@@ -198,6 +198,109 @@ class ContentRange(object):
             return cls(start, end - 1, length)
 
 
+class ResumeInfo(object):
+    """Validators of a partially downloaded file.
+
+    Stored as JSON next to the partial file ("<tempname>.resume") when
+    the response headers arrive, and sent back as If-Range on resume,
+    so that a changed enclosure restarts the download instead of being
+    spliced onto the old partial data (RFC 7233, Section 3.2).
+    """
+
+    EXTENSION = '.resume'
+
+    def __init__(self, url=None, etag=None, last_modified=None, length=None):
+        self.url = url
+        self.etag = etag
+        self.last_modified = last_modified
+        self.length = length
+
+    def __repr__(self):
+        return '<%s etag=%r last_modified=%r length=%r>' % (
+            self.__class__.__name__, self.etag, self.last_modified, self.length)
+
+    @classmethod
+    def filename_for(cls, tempname):
+        return tempname + cls.EXTENSION
+
+    @classmethod
+    def from_response(cls, url, headers, offset):
+        """Create resume info from the headers of a (partial) response."""
+        length = None
+        conrange = ContentRange.parse(headers.get('content-range', ''))
+        if conrange is not None and conrange.length is not None:
+            length = conrange.length
+        elif 'content-length' in headers:
+            try:
+                length = int(headers['content-length']) + offset
+            except ValueError:
+                length = None
+        return cls(url, headers.get('etag'), headers.get('last-modified'), length)
+
+    @classmethod
+    def load(cls, tempname):
+        """Load resume info for tempname, or None if not available."""
+        filename = cls.filename_for(tempname)
+        if not os.path.exists(filename):
+            return None
+
+        try:
+            with open(filename, 'r') as fp:
+                data = json.load(fp)
+            return cls(data.get('url'), data.get('etag'), data.get('last_modified'), data.get('length'))
+        except (IOError, ValueError, AttributeError):
+            logger.warning('Cannot read resume info: %s', filename, exc_info=True)
+            return None
+
+    def save(self, tempname):
+        if not (self.etag or self.last_modified or self.length):
+            # Nothing to validate against
+            self.delete(tempname)
+            return
+
+        filename = self.filename_for(tempname)
+        try:
+            with open(filename + '.tmp', 'w') as fp:
+                json.dump({
+                    'url': self.url,
+                    'etag': self.etag,
+                    'last_modified': self.last_modified,
+                    'length': self.length,
+                }, fp)
+            util.atomic_rename(filename + '.tmp', filename)
+        except IOError:
+            logger.warning('Cannot write resume info: %s', filename, exc_info=True)
+            util.delete_file(filename + '.tmp')
+
+    @classmethod
+    def delete(cls, tempname):
+        filename = cls.filename_for(tempname)
+        if os.path.exists(filename):
+            util.delete_file(filename)
+
+    def if_range(self):
+        """Return the validator for the If-Range header, or None.
+
+        Weak entity tags must not be used with If-Range.
+        """
+        if self.etag and not self.etag.startswith('W/'):
+            return self.etag
+        return self.last_modified
+
+    def matches(self, other):
+        """Check that other describes the same remote file as self.
+
+        Only validators known on both sides are compared.
+        """
+        if self.etag and other.etag:
+            return self.etag == other.etag
+        if self.last_modified and other.last_modified and self.last_modified != other.last_modified:
+            return False
+        if self.length is not None and other.length is not None and self.length != other.length:
+            return False
+        return True
+
+
 class DownloadCancelledException(Exception):
     pass
 
@@ -207,10 +310,12 @@ class DownloadNoURLException(Exception):
 
 
 class gPodderDownloadHTTPError(Exception):
-    def __init__(self, url, error_code, error_message):
+    def __init__(self, url, error_code, error_message, retry_after=None):
         self.url = url
         self.error_code = error_code
         self.error_message = error_message
+        # Delay (seconds) requested by the server with Retry-After, if any
+        self.retry_after = retry_after
 
 
 class DownloadURLOpener:
@@ -229,13 +334,12 @@ class DownloadURLOpener:
         """Init a session with our own retry codes + retry count."""
         # I add a few retries for redirects but it means that I will allow max_retries + REDIRECT_RETRIES
         # if encountering max_retries connect and REDIRECT_RETRIES read for instance
-        retry_strategy = Retry(
+        retry_strategy = util.RetryStrategy(
             total=self.max_retries + REDIRECT_RETRIES,
             connect=self.max_retries,
             read=self.max_retries,
             redirect=max(REDIRECT_RETRIES, self.max_retries),
-            status=self.max_retries,
-            status_forcelist=Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,)))
+            status=self.max_retries)
         adapter = HTTPAdapter(max_retries=retry_strategy)
         http = requests.Session()
         http.mount("https://", adapter)
@@ -249,10 +353,13 @@ class DownloadURLOpener:
         """Download files from an URL; return (headers, real_url).
 
         Resumes a download if the local filename exists and
-        the server supports download resuming.
+        the server supports download resuming. The validators of
+        the previous response are sent as If-Range, so the server
+        sends the whole file again if it has changed in the meantime.
         """
         current_size = 0
         tfp = None
+        resume_info = None
         headers = {
             'User-agent': gpodder.user_agent
         }
@@ -266,12 +373,19 @@ class DownloadURLOpener:
         if os.path.exists(filename):
             try:
                 current_size = os.path.getsize(filename)
-                tfp = open(filename, 'ab')
+                # Not opened in append mode, so we can seek back on resume
+                tfp = open(filename, 'r+b')
+                tfp.seek(current_size)
                 # If the file exists, then only download the remainder
                 if current_size > 0:
                     headers['Range'] = 'bytes=%s-' % (current_size)
+                    resume_info = ResumeInfo.load(filename)
+                    if resume_info is not None and resume_info.if_range():
+                        headers['If-Range'] = resume_info.if_range()
             except:
                 logger.warning('Cannot resume download: %s', filename, exc_info=True)
+                if tfp is not None:
+                    tfp.close()
                 tfp = None
                 current_size = 0
 
@@ -284,59 +398,99 @@ class DownloadURLOpener:
         proxies = config._proxies
         session = self.init_session()
         logger.debug(f"DownloadURLOpener.retrieve_resume(): url: {url}, proxies: {proxies}")
-        with session.get(url,
-                         headers=headers,
-                         stream=True,
-                         auth=auth,
-                         proxies=proxies,
-                         timeout=gpodder.SOCKET_TIMEOUT) as resp:
+        restart = False
+        with hosthealth.hosts.request(url, transfer=True) as host_request, \
+                session.get(url,
+                            headers=headers,
+                            stream=True,
+                            auth=auth,
+                            proxies=proxies,
+                            timeout=gpodder.SOCKET_TIMEOUT) as resp:
+            host_request.response(resp.status_code)
             try:
                 resp.raise_for_status()
             except HTTPError as e:
+                tfp.close()
                 if auth is not None:
                     # Try again without authentication (bug 1296)
                     return self.retrieve_resume(url, filename, reporthook, data, True)
+                elif resp.status_code == 416 and current_size > 0:
+                    # Range Not Satisfiable: the partial file is not a prefix of the remote file
+                    logger.warning('Cannot resume: Range not satisfiable, restarting download.')
+                    restart = True
                 else:
-                    raise gPodderDownloadHTTPError(url, resp.status_code, str(e))
-
-            headers = resp.headers
-
-            if current_size > 0:
-                # We told the server to resume - see if she agrees
-                # See RFC2616 (206 Partial Content + Section 14.16)
-                # XXX check status code here, too...
-                conrange = ContentRange.parse(headers.get('content-range', ''))
-                if conrange is None or conrange.start != current_size:
-                    # Ok, that did not work. Reset the download
-                    # TODO: seek and truncate if content-range differs from request
-                    tfp.close()
-                    tfp = open(filename, 'wb')
-                    current_size = 0
-                    logger.warning('Cannot resume: Invalid Content-Range (RFC2616).')
-
-            result = headers, resp.url
-            bs = 1024 * 8
-            size = -1
-            read = current_size
-            blocknum = current_size // bs
-            if reporthook:
-                if "content-length" in headers:
-                    size = int(headers['content-length']) + current_size
-                reporthook(blocknum, bs, size)
-            for block in resp.iter_content(bs):
-                read += len(block)
-                tfp.write(block)
-                blocknum += 1
+                    retry_after = None
+                    if resp.status_code in (429, 503):
+                        retry_after = retry.parse_retry_after(resp.headers.get('retry-after'))
+                    raise gPodderDownloadHTTPError(url, resp.status_code, str(e), retry_after)
+
+            if not restart:
+                headers = resp.headers
+
+                if current_size > 0:
+                    # We told the server to resume - see if she agrees
+                    # See RFC7233 (206 Partial Content + Section 4.2)
+                    conrange = ContentRange.parse(headers.get('content-range', ''))
+                    new_info = ResumeInfo.from_response(resp.url, headers, current_size)
+                    if resp.status_code != 206 or conrange is None:
+                        # Range not supported or If-Range did not match: this is the whole file
+                        tfp.seek(0)
+                        tfp.truncate()
+                        current_size = 0
+                        logger.warning('Cannot resume: Server sent the whole file.')
+                    elif resume_info is not None and not resume_info.matches(new_info):
+                        # Server ignored If-Range, but the file has changed
+                        logger.warning('Cannot resume: Remote file has changed (%r != %r).',
+                                resume_info, new_info)
+                        restart = True
+                    elif conrange.start > current_size:
+                        logger.warning('Cannot resume: Content-Range starts after partial file (%d > %d).',
+                                conrange.start, current_size)
+                        restart = True
+                    elif conrange.start < current_size:
+                        # Overlapping range: drop the bytes we are going to receive again
+                        logger.info('Resuming at %d instead of %d', conrange.start, current_size)
+                        tfp.seek(conrange.start)
+                        tfp.truncate()
+                        current_size = conrange.start
+
+            if restart:
+                tfp.close()
+                ResumeInfo.delete(filename)
+                # Truncate the partial file, so we don't send a Range header again
+                open(filename, 'wb').close()
+            else:
+                ResumeInfo.from_response(resp.url, headers, current_size).save(filename)
+
+                result = headers, resp.url
+                bs = 1024 * 8
+                size = -1
+                read = current_size
+                blocknum = current_size // bs
                 if reporthook:
+                    if "content-length" in headers:
+                        size = int(headers['content-length']) + current_size
                     reporthook(blocknum, bs, size)
-            tfp.close()
-            del tfp
+                for block in resp.iter_content(bs):
+                    read += len(block)
+                    tfp.write(block)
+                    blocknum += 1
+                    if reporthook:
+                        reporthook(blocknum, bs, size)
+                tfp.close()
+                del tfp
+
+        if restart:
+            return self.retrieve_resume(url, filename, reporthook, data, disable_auth)
 
         # raise exception if actual size does not match content-length header
         if size >= 0 and read < size:
             raise urllib.error.ContentTooShortError("retrieval incomplete: got only %i out "
                                        "of %i bytes" % (read, size), result)
 
+        # The download is complete, no need to validate a resume anymore
+        ResumeInfo.delete(filename)
+
         return result
 
 # end code based on urllib.py
@@ -365,10 +519,10 @@ class DefaultDownload(CustomDownload):
         self.partial_filename = tempname
 
         # Retry the download on incomplete download (other retries are done by the Retry strategy)
-        for retry in range(max_retries + 1):
-            if retry > 0:
-                logger.info('Retrying download of %s (%d)', url, retry)
-                time.sleep(1)
+        for attempt in range(max_retries + 1):
+            if attempt > 0:
+                logger.info('Retrying download of %s (%d)', url, attempt)
+                time.sleep(retry.backoff_delay(attempt, 1, 30))
 
             try:
                 headers, real_url = downloader.retrieve_resume(url,
@@ -376,7 +530,7 @@ class DefaultDownload(CustomDownload):
                 # If we arrive here, the download was successful
                 break
             except urllib.error.ContentTooShortError:
-                if retry < max_retries:
+                if attempt < max_retries:
                     logger.info('Content too short: %s - will retry.',
                             url)
                     continue
@@ -400,35 +554,167 @@ class DefaultDownloader(CustomDownloader):
         return DefaultDownload(config, episode, url)
 
 
+class LinkDownload(CustomDownload):
+    """Satisfy a download by linking to an identical enclosure of another podcast."""
+
+    def __init__(self, episode, source_id, source):
+        self.__episode = episode
+        self._source_id = source_id
+        self._source = source
+        self.__partial_filename = None
+        # Episode whose file has been reflinked, see EnclosureIndex.add()
+        self.cloned_from = None
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self._source)
+
+    @classmethod
+    def for_episode(cls, config, episode):
+        """Return a LinkDownload if the enclosure has already been downloaded, or None."""
+        if not config.downloads.deduplicate:
+            return None
+
+        source = dedup.EnclosureIndex(episode.db).find_by_url(episode)
+        if source is None:
+            return None
+
+        return cls(episode, *source)
+
+    @property
+    def partial_filename(self):
+        return self.__partial_filename
+
+    @partial_filename.setter
+    def partial_filename(self, val):
+        self.__partial_filename = val
+
+    def retrieve_resume(self, tempname, reporthook):
+        self.partial_filename = tempname
+        size = os.path.getsize(self._source)
+        # Extensions may still modify the file in place, so don't hardlink it yet
+        if dedup.link_file(self._source, tempname, hardlink=False) == 'reflink':
+            self.cloned_from = self._source_id
+        ResumeInfo.delete(tempname)
+        logger.info('Linked %s to existing download %s (%s reclaimed)',
+                self.__episode.url, self._source, util.format_filesize(size))
+        reporthook(1, size, size)
+        mime_type, encoding = mimetypes.guess_type(self._source)
+        return {'content-type': mime_type or self.__episode.mime_type}, self.__episode.url
+
+
+class DiskSpaceAdmission(object):
+    """Admission control for downloads based on free disk space.
+
+    A task is held back (it stays queued) if its expected size plus the
+    bytes still to be written by running downloads would not leave the
+    configured reserve free on the download disk.
+    """
+
+    def __init__(self, config):
+        self._config = config
+        self._lock = threading.Lock()
+        self._running = set()
+
+    @staticmethod
+    def remaining_bytes(task):
+        """Return the number of bytes the task is still expected to write."""
+        if task.total_size <= 0 or task.activity == DownloadTask.ACTIVITY_SYNCHRONIZE:
+            # Sync tasks write to the device, not the download disk
+            return 0
+        return max(0, int(task.total_size * (1. - task.progress)))
+
+    def bytes_in_flight(self, exclude=None):
+        with self._lock:
+            return sum(self.remaining_bytes(task) for task in self._running if task is not exclude)
+
+    def start(self, task):
+        with self._lock:
+            self._running.add(task)
+
+    def finish(self, task):
+        with self._lock:
+            self._running.discard(task)
+
+    def running_count(self, activity):
+        """Return the number of running tasks of an activity (download or sync)."""
+        with self._lock:
+            return sum(1 for task in self._running if task.activity == activity)
+
+    def admit(self, task):
+        """Return True if there is enough free disk space to start the task."""
+        if not self._config.limit.free_space.enabled or gpodder.downloads is None:
+            return True
+
+        needed = self.remaining_bytes(task)
+        if not needed:
+            return True
+
+        free = util.get_free_disk_space(gpodder.downloads)
+        if free < 0:
+            # Cannot determine free disk space
+            return True
+
+        reserve = self._config.limit.free_space.reserve * 1024 * 1024
+        in_flight = self.bytes_in_flight(exclude=task)
+        if free - in_flight - needed < reserve:
+            logger.info('Holding back download of %s: needs %s, %s free, %s in flight',
+                    task, util.format_filesize(needed), util.format_filesize(free),
+                    util.format_filesize(in_flight))
+            return False
+
+        return True
+
+    def run(self, task):
+        """Run the task, accounting for its bytes in flight."""
+        self.start(task)
+        try:
+            task.run()
+        finally:
+            self.finish(task)
+
+
 class DownloadQueueWorker(object):
-    def __init__(self, queue, exit_callback, continue_check_callback):
+    def __init__(self, queue, exit_callback, continue_check_callback, admission, stream_check_callback):
         self.queue = queue
         self.exit_callback = exit_callback
         self.continue_check_callback = continue_check_callback
+        self.admission = admission
+        self.stream_check_callback = stream_check_callback
 
     def __repr__(self):
         return threading.current_thread().getName()
 
+    def admit(self, task):
+        # Leave tasks for busy hosts to other workers, if the host frees up
+        if (self.stream_check_callback(task) and hosthealth.hosts.has_capacity(task.url, transfer=True)
+                and self.admission.admit(task)):
+            # The task is dequeued for this worker: count it as running now,
+            # so the next worker doesn't exceed the limits
+            self.admission.start(task)
+            return True
+        return False
+
     def run(self):
         logger.info('Starting new thread: %s', self)
         while True:
             if not self.continue_check_callback(self):
                 return
 
-            task = self.queue.get_next() if self.queue.enabled else None
+            task = self.queue.get_next(self.admit) if self.queue.enabled else None
             if not task:
                 logger.info('No more tasks for %s to carry out.', self)
                 break
             logger.info('%s is processing: %s', self, task)
-            task.run()
+            self.admission.run(task)
             task.recycle()
 
         self.exit_callback(self)
 
 
 class ForceDownloadWorker(object):
-    def __init__(self, task):
+    def __init__(self, task, admission):
         self.task = task
+        self.admission = admission
 
     def __repr__(self):
         return threading.current_thread().getName()
@@ -436,17 +722,30 @@ class ForceDownloadWorker(object):
     def run(self):
         logger.info('Starting new thread: %s', self)
         logger.info('%s is processing: %s', self, self.task)
-        self.task.run()
+        self.admission.run(self.task)
         self.task.recycle()
 
 
 class DownloadQueueManager(object):
-    def __init__(self, config, queue):
+    # Seconds to wait before checking again if held back tasks can be started
+    RECHECK_INTERVAL = 60
+
+    def __init__(self, config, queue, cleanup_callback=None):
+        """Create a download queue manager.
+
+        cleanup_callback is called (in the UI thread) when downloads are held
+        back for lack of disk space and limit.free_space.cleanup is enabled.
+        """
         self._config = config
         self.tasks = queue
+        self.admission = DiskSpaceAdmission(config)
+        self._cleanup_callback = cleanup_callback
+        self._recheck_timer = None
 
         self.worker_threads_access = threading.RLock()
         self.worker_threads = []
+        # Concurrent copies of the device of the latest queued sync task
+        self._sync_streams = 0
 
     def disable(self):
         self.tasks.enabled = False
@@ -458,16 +757,52 @@ class DownloadQueueManager(object):
     def __exit_callback(self, worker_thread):
         with self.worker_threads_access:
             self.worker_threads.remove(worker_thread)
+            if not self.worker_threads and self.tasks.enabled and self.tasks.has_work():
+                # Queued tasks are left, but none has been admitted
+                self.__schedule_recheck()
+
+    def __schedule_recheck(self):
+        if self._recheck_timer is not None:
+            return
+
+        logger.info('Downloads held back (disk space or host limits), checking again in %d seconds',
+                self.RECHECK_INTERVAL)
+        if self._config.limit.free_space.cleanup and self._cleanup_callback is not None:
+            util.idle_add(self._cleanup_callback)
+
+        self._recheck_timer = threading.Timer(self.RECHECK_INTERVAL, self.__recheck)
+        self._recheck_timer.daemon = True
+        self._recheck_timer.start()
+
+    def __recheck(self):
+        with self.worker_threads_access:
+            self._recheck_timer = None
+        self.__spawn_threads()
 
     def __continue_check_callback(self, worker_thread):
         with self.worker_threads_access:
-            if len(self.worker_threads) > self._config.limit.downloads.concurrent and \
+            if len(self.worker_threads) > self.__download_limit() + self._sync_streams and \
                     self._config.limit.downloads.enabled:
                 self.worker_threads.remove(worker_thread)
                 return False
             else:
                 return True
 
+    def __download_limit(self):
+        if self._config.limit.downloads.enabled:
+            # always allow at least 1 download
+            return max(int(self._config.limit.downloads.concurrent), 1)
+        else:
+            return self._config.limit.downloads.concurrent_max
+
+    def __stream_check_callback(self, task):
+        """Return True if another task of this kind (download or sync) may run."""
+        if task.activity == DownloadTask.ACTIVITY_SYNCHRONIZE:
+            limit = task.device.copy_streams
+        else:
+            limit = self.__download_limit()
+        return self.admission.running_count(task.activity) < max(1, limit)
+
     def __spawn_threads(self):
         """Spawn new worker threads if necessary."""
         if not self.tasks.enabled:
@@ -475,11 +810,8 @@ class DownloadQueueManager(object):
 
         with self.worker_threads_access:
             work_count = self.tasks.available_work_count()
-            if self._config.limit.downloads.enabled:
-                # always allow at least 1 download
-                spawn_limit = max(int(self._config.limit.downloads.concurrent), 1)
-            else:
-                spawn_limit = self._config.limit.downloads.concurrent_max
+            # Downloads and syncs have separate limits (see __stream_check_callback)
+            spawn_limit = self.__download_limit() + self._sync_streams
             running = len(self.worker_threads)
             logger.info('%r tasks to do, can start at most %r threads, %r threads currently running', work_count, spawn_limit, running)
             for i in range(0, min(work_count, spawn_limit - running)):
@@ -487,7 +819,7 @@ class DownloadQueueManager(object):
                 logger.info('Starting new worker thread.')
 
                 worker = DownloadQueueWorker(self.tasks, self.__exit_callback,
-                        self.__continue_check_callback)
+                        self.__continue_check_callback, self.admission, self.__stream_check_callback)
                 self.worker_threads.append(worker)
                 util.run_in_background(worker.run)
 
@@ -498,11 +830,14 @@ class DownloadQueueManager(object):
         with task:
             if task.status in (task.QUEUED, task.PAUSED, task.CANCELLED, task.FAILED):
                 task.status = task.DOWNLOADING
-                worker = ForceDownloadWorker(task)
+                worker = ForceDownloadWorker(task, self.admission)
                 util.run_in_background(worker.run)
 
     def queue_task(self, task):
         """Mark a task as queued."""
+        if task.activity == DownloadTask.ACTIVITY_SYNCHRONIZE:
+            with self.worker_threads_access:
+                self._sync_streams = max(1, task.device.copy_streams)
         self.tasks.queue_task(task)
         self.__spawn_threads()
 
@@ -727,6 +1062,7 @@ class DownloadTask(object):
         self.progress = 0.0
         self.error_message = None
         self.custom_downloader = None
+        self.retry_schedule = retry.RetrySchedule(self.__episode.db, self._config)
 
         # Have we already shown this task in a notification?
         self._notification_shown = False
@@ -894,6 +1230,7 @@ class DownloadTask(object):
 
         url = self.__episode.url
         result = DownloadTask.DOWNLOADING
+        retry_after = None
         try:
             if url == '':
                 raise DownloadNoURLException()
@@ -906,7 +1243,8 @@ class DownloadTask(object):
             if downloader:
                 logger.info('Downloading %s with %s', url, downloader)
             else:
-                downloader = DefaultDownloader.custom_downloader(self._config, self.episode)
+                downloader = (LinkDownload.for_episode(self._config, self.episode)
+                        or DefaultDownloader.custom_downloader(self._config, self.episode))
 
             self.custom_downloader = downloader
             headers, real_url = downloader.retrieve_resume(self.tempname, self.status_updated)
@@ -1016,6 +1354,7 @@ class DownloadTask(object):
             result = DownloadTask.FAILED
             d = {'code': gdhe.error_code, 'message': gdhe.error_message}
             self.error_message = _('HTTP Error %(code)s: %(message)s') % d
+            retry_after = gdhe.retry_after
         except Exception as e:
             result = DownloadTask.FAILED
             logger.error('Download failed: %s', str(e), exc_info=True)
@@ -1030,7 +1369,14 @@ class DownloadTask(object):
                     self.total_size = util.calculate_size(self.filename)
                     logger.info('Total size updated to %d', self.total_size)
                 self.progress = 1.0
+                self.retry_schedule.succeeded(retry.KIND_EPISODE, self.__episode.id)
                 gpodder.user_extensions.on_episode_downloaded(self.__episode)
+                if self._config.downloads.deduplicate:
+                    # Replace the file by a link, if another podcast has the same file
+                    # (after the extensions, which may modify it in place)
+                    cloned_from = (self.custom_downloader.cloned_from
+                            if isinstance(self.custom_downloader, LinkDownload) else None)
+                    dedup.EnclosureIndex(self.__episode.db).add(self.__episode, self.filename, cloned_from)
                 return True
 
             self.speed = 0.0
@@ -1038,12 +1384,15 @@ class DownloadTask(object):
             if result == DownloadTask.FAILED:
                 self.status = DownloadTask.FAILED
                 self.__episode._download_error = self.error_message
+                self.retry_schedule.failed(retry.KIND_EPISODE, self.__episode.id,
+                        self.error_message, retry_after)
 
             # cancelled/paused -- update state to mark it as safe to manipulate this task again
             elif self.status == DownloadTask.PAUSING:
                 self.status = DownloadTask.PAUSED
             elif self.status == DownloadTask.CANCELLING:
                 self.status = DownloadTask.CANCELLED
+                self.retry_schedule.succeeded(retry.KIND_EPISODE, self.__episode.id)
 
         # We finished, but not successfully (at least not really)
         return False
@@ -431,6 +431,10 @@ class ExtensionManager(object):
     # "call_extension" decorator to forward all calls to extension scripts that have
     # the same function defined in them. If the handler functions here contain
     # any code, it will be called after all the extensions have been called.
+    #
+    # Podcasts can be updated in several threads at once (e.g. when importing
+    # OPML files). The podcast hooks (on_podcast_*, on_episode_removed_from_podcast)
+    # are called from these threads, but never at the same time.
 
     @call_extensions
     def on_ui_initialized(self, model, update_podcast_callback,
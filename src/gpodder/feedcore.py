@@ -27,7 +27,7 @@ import urllib.parse
 from html.parser import HTMLParser
 from io import BytesIO
 
-from gpodder import util, youtube
+from gpodder import retry, timing, util, youtube
 
 logger = logging.getLogger(__name__)
 
@@ -44,11 +44,18 @@ class ExceptionWithData(Exception):
 
 
 # Temporary errors
-class BadRequest(Exception):
+class TemporaryError(Exception):
+    def __init__(self, msg, retry_after=None):
+        super().__init__(msg)
+        # Delay (seconds) requested by the server with Retry-After, if any
+        self.retry_after = retry_after
+
+
+class BadRequest(TemporaryError):
     pass
 
 
-class InternalServerError(Exception):
+class InternalServerError(TemporaryError):
     pass
 
 
@@ -117,9 +124,21 @@ class FeedAutodiscovery(HTMLParser):
 
 
 class FetcherFeedData:
-    def __init__(self, text, content):
-        self.text = text
-        self.content = content
+    """Body of a fetched feed, the text is only decoded when needed."""
+
+    def __init__(self, response):
+        self._response = response
+        self._text = None
+
+    @property
+    def content(self):
+        return self._response.content
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self._response.text
+        return self._text
 
 
 class Fetcher(object):
@@ -141,7 +160,7 @@ class Fetcher(object):
         return None
 
     @staticmethod
-    def _check_statuscode(status, url):
+    def _check_statuscode(status, url, headers=None):
         if status >= 200 and status < 300:
             return UPDATED_FEED
         elif status == 304:
@@ -149,6 +168,10 @@ class Fetcher(object):
         # redirects are handled by requests directly
         # => the status should never be 301, 302, 303, 307, 308
 
+        retry_after = None
+        if headers is not None and status in (429, 503):
+            retry_after = retry.parse_retry_after(headers.get('retry-after'))
+
         if status == 401:
             raise AuthenticationRequired('authentication required', url)
         elif status == 403:
@@ -158,9 +181,9 @@ class Fetcher(object):
         elif status == 410:
             raise Unsubscribe('resource is gone')
         elif status >= 400 and status < 500:
-            raise BadRequest('bad request')
+            raise BadRequest('bad request', retry_after)
         elif status >= 500 and status < 600:
-            raise InternalServerError('internal server error')
+            raise InternalServerError('internal server error', retry_after)
         else:
             raise UnknownStatusCode(status)
 
@@ -176,22 +199,31 @@ class Fetcher(object):
         """
         raise NotImplementedError("Implement parse_feed()")
 
-    def fetch(self, url, etag=None, modified=None, autodiscovery=True, **kwargs):
-        """Use kwargs to pass extra data to parse_feed in Fetcher subclasses."""
-        # handle local file first
-        if url.startswith('file://'):
-            url = url[len('file://'):]
-            stream = open(url)
-            return self.parse_feed(url, None, stream, {}, UPDATED_FEED, **kwargs)
-
-        # remote feed
+    @staticmethod
+    def request(url, etag=None, modified=None):
+        """Request a remote feed, conditionally if etag or modified are given."""
         headers = {}
         if modified is not None:
             headers['If-Modified-Since'] = modified
         if etag is not None:
             headers['If-None-Match'] = etag
 
-        stream = util.urlopen(url, headers)
+        return util.urlopen(url, headers)
+
+    def fetch(self, url, etag=None, modified=None, autodiscovery=True, response=None, **kwargs):
+        """Use kwargs to pass extra data to parse_feed in Fetcher subclasses.
+
+        response is the result of request() for url, if it has already been
+        requested (e.g. prefetched in the background).
+        """
+        # handle local file first
+        if url.startswith('file://'):
+            url = url[len('file://'):]
+            with open(url, 'rb') as stream:
+                return self.parse_feed(url, None, stream, {}, UPDATED_FEED, **kwargs)
+
+        # remote feed
+        stream = response if response is not None else self.request(url, etag, modified)
 
         responses = stream.history + [stream]
         for i, resp in enumerate(responses):
@@ -200,14 +232,15 @@ class Fetcher(object):
                 # If max redirects is reached, TooManyRedirects is raised
                 # TODO: since we've got the end contents anyway, modify model.py to accept contents on NEW_LOCATION
                 return Result(NEW_LOCATION, responses[i + 1].url)
-        res = self._check_statuscode(stream.status_code, stream.url)
+        res = self._check_statuscode(stream.status_code, stream.url, stream.headers)
         if res == NOT_MODIFIED:
             return Result(NOT_MODIFIED, stream.url)
 
         if autodiscovery and stream.headers.get('content-type', '').startswith('text/html'):
             ad = FeedAutodiscovery(url)
             # response_text() will assume utf-8 if no charset specified
-            ad.feed(util.response_text(stream))
+            with timing.span('autodiscovery'):
+                ad.feed(util.response_text(stream))
             if ad._resolved_url and ad._resolved_url != url:
                 try:
                     self.fetch(ad._resolved_url, etag=None, modified=None, autodiscovery=False, **kwargs)
@@ -223,5 +256,5 @@ class Fetcher(object):
         # xml documents specify the encoding inline so better pass encoded body.
         # Especially since requests will use ISO-8859-1 for content-type 'text/xml'
         # if the server doesn't specify a charset.
-        return self.parse_feed(url, FetcherFeedData(stream.text, stream.content), BytesIO(stream.content), stream.headers,
-                            UPDATED_FEED, **kwargs)
+        # BytesIO shares the (immutable) body instead of copying it.
+        return self.parse_feed(url, FetcherFeedData(stream), BytesIO(stream.content), stream.headers, UPDATED_FEED, **kwargs)
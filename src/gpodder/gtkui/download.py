@@ -179,9 +179,9 @@ class DownloadStatusModel(Gtk.ListStore):
     def available_work_count(self):
         return len(list(self._work_gen()))
 
-    def __get_next(self, dqr):
+    def __get_next(self, dqr, admit):
         try:
-            task = next(self._work_gen())
+            task = next(task for task in self._work_gen() if admit is None or admit(task))
             # this is the only thread accessing the list store, so it's safe
             # to assume a) the task is still queued and b) we can transition to downloading
             task.status = task.DOWNLOADING
@@ -192,9 +192,10 @@ class DownloadStatusModel(Gtk.ListStore):
 
     # get the next task to download. this proxies the request to the main thread,
     # as only the main thread is allowed to manipulate the list store.
-    def get_next(self):
+    # admit(task) can hold back queued tasks (e.g. for lack of disk space).
+    def get_next(self, admit=None):
         dqr = DequeueRequest()
-        util.idle_add(self.__get_next, dqr)
+        util.idle_add(self.__get_next, dqr, admit)
         return dqr.dequeue()
 
     def _work_gen(self):
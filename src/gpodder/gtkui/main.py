@@ -33,8 +33,8 @@ import requests.exceptions
 import urllib3.exceptions
 
 import gpodder
-from gpodder import (common, download, feedcore, my, opml, registry, util,
-                     youtube)
+from gpodder import (bulkimport, common, download, feedcore, my, opml,
+                     registry, retry, schedule, util, youtube)
 from gpodder.dbusproxy import DBusPodcastsProxy
 from gpodder.model import Model, PodcastEpisode, episode_object_by_uri
 from gpodder.player import MyGPOClientObserver, PlayerInterface
@@ -147,7 +147,8 @@ class gPodder(BuilderWidget):
         self.new_episodes_window = None
 
         self.download_status_model = DownloadStatusModel()
-        self.download_queue_manager = download.DownloadQueueManager(self.config, self.download_status_model)
+        self.download_queue_manager = download.DownloadQueueManager(self.config, self.download_status_model,
+                self.delete_expired_episodes)
 
         self.config.connect_gtk_spinbutton('limit.downloads.concurrent', self.spinMaxDownloads,
                                            self.config.limit.downloads.concurrent_max)
@@ -242,16 +243,21 @@ class gPodder(BuilderWidget):
         util.run_in_background(self.find_partial_downloads)
 
         # Start the auto-update procedure
+        self.update_schedule = schedule.UpdateSchedule(self.db, self.config)
         self._auto_update_timer_source_id = None
         if self.config.auto.update.enabled:
             self.restart_auto_update_timer()
 
+        # Retry failed downloads and feed updates when they are due
+        self.retry_schedule = retry.RetrySchedule(self.db, self.config)
+        util.idle_timeout_add(60 * 1000, self._on_retry_timer)
+
+        # Show durations of YouTube episodes when they have been looked up
+        youtube.duration_lookups.callbacks.append(
+            lambda episodes: util.idle_add(self.update_episode_list_icons, {e.url for e in episodes}))
+
         # Find expired (old) episodes and delete them
-        old_episodes = list(common.get_expired_episodes(self.channels, self.config))
-        if len(old_episodes) > 0:
-            self.delete_episode_list(old_episodes, confirm=False)
-            updated_urls = {e.channel.url for e in old_episodes}
-            self.update_podcast_list_model(updated_urls)
+        self.delete_expired_episodes()
 
         # Do the initial sync with the web service
         if self.mygpo_client.can_access_webservice():
@@ -447,6 +453,13 @@ class gPodder(BuilderWidget):
             self._for_each_task_set_status(selected_tasks, download.DownloadTask.QUEUED)
         self.resume_all_infobar.set_revealed(False)
 
+    def delete_expired_episodes(self):
+        old_episodes = list(common.get_expired_episodes(self.channels, self.config))
+        if len(old_episodes) > 0:
+            self.delete_episode_list(old_episodes, confirm=False)
+            updated_urls = {e.channel.url for e in old_episodes}
+            self.update_podcast_list_model(updated_urls)
+
     def find_partial_downloads(self):
         def start_progress_callback(count):
             if count:
@@ -887,7 +900,7 @@ class gPodder(BuilderWidget):
             icon_name = 'gpodder-progress-%d' % i
             Gtk.IconTheme.add_builtin_icon(icon_name, cake_size, pixbuf)
 
-        self.treeAvailable.set_model(self.episode_list_model.get_filtered_model())
+        self.episode_list_model.set_view(self.treeAvailable)
 
         TreeViewHelper.set(self.treeAvailable, TreeViewHelper.ROLE_EPISODES)
 
@@ -976,9 +989,9 @@ class gPodder(BuilderWidget):
 
             # Restore column sorting
             if column.get_sort_column_id() == self.config.ui.gtk.state.main_window.episode_column_sort_id:
-                self.episode_list_model._sorter.set_sort_column_id(Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID,
+                self.episode_list_model.set_sort_column_id(Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID,
                     Gtk.SortType.DESCENDING)
-                self.episode_list_model._sorter.set_sort_column_id(column.get_sort_column_id(),
+                self.episode_list_model.set_sort_column_id(column.get_sort_column_id(),
                     Gtk.SortType.ASCENDING if self.config.ui.gtk.state.main_window.episode_column_sort_order
                         else Gtk.SortType.DESCENDING)
             # Save column sorting when user clicks column headers
@@ -2151,11 +2164,7 @@ class gPodder(BuilderWidget):
             self.episode_list_model.update_by_urls(urls)
         elif selected and not update_all:
             # We should update all selected episodes
-            selection = self.treeAvailable.get_selection()
-            model, paths = selection.get_selected_rows()
-            for path in reversed(paths):
-                iterator = model.get_iter(path)
-                self.episode_list_model.update_by_filter_iter(iterator)
+            self.episode_list_model.update_episodes(self.get_selected_episodes())
         elif update_all and not selected:
             # We update all (even the filter-hidden) episodes
             self.episode_list_model.update_all()
@@ -2317,8 +2326,7 @@ class gPodder(BuilderWidget):
         current_day = t[:3]
         if self.last_episode_date_refresh is not None and self.last_episode_date_refresh != current_day:
             # update all episodes in current view
-            for row in self.episode_list_model:
-                row[EpisodeListModel.C_PUBLISHED_TEXT] = row[EpisodeListModel.C_EPISODE].cute_pubdate()
+            self.episode_list_model.update_all()
 
         self.last_episode_date_refresh = current_day
 
@@ -2432,17 +2440,25 @@ class gPodder(BuilderWidget):
 
     def update_episode_list_model(self):
         if self.channels and self.active_channel is not None:
-            self.treeAvailable.get_selection().unselect_all()
-            self.treeAvailable.scroll_to_point(0, 0)
+            if not self.episode_list_model.is_showing(self.active_channel):
+                self.treeAvailable.get_selection().unselect_all()
+                self.treeAvailable.scroll_to_point(0, 0)
 
             self.episode_list_model.cache_config(self.config)
 
-            with self.treeAvailable.get_selection().handler_block(self.episode_selection_handler_id):
+            selection = self.treeAvailable.get_selection()
+            selected = self.get_selected_episodes()
+            with selection.handler_block(self.episode_selection_handler_id):
                 # have to block the on_episode_list_selection_changed handler because
                 # when selecting any channel from All Episodes, on_episode_list_selection_changed
                 # is called once per episode (4k time in my case), causing episode shownotes
                 # to be updated as many time, resulting in UI freeze for 10 seconds.
                 self.episode_list_model.replace_from_channel(self.active_channel)
+
+            # Selected episodes may have been removed or replaced by the update
+            now_selected = self.get_selected_episodes()
+            if len(now_selected) != len(selected) or any(a is not b for a, b in zip(now_selected, selected)):
+                self.on_episode_list_selection_changed(selection)
         else:
             self.episode_list_model.clear()
 
@@ -2587,77 +2603,38 @@ class gPodder(BuilderWidget):
         @util.run_in_background
         def thread_proc():
             # After the initial sorting and splitting, try all queued podcasts
-            length = len(queued)
-            for index, url in enumerate(queued):
-                title = title_for_url.get(url)
-                section = section_for_url.get(url)
-                progress.on_progress(float(index) / float(length))
-                progress.on_message(title or url)
-                try:
-                    # The URL is valid and does not exist already - subscribe!
-                    channel = self.model.load_podcast(url=url, create=True,
-                            authentication_tokens=auth_tokens.get(url, None),
-                            max_episodes=self.config.limit.episodes)
+            # (several at once, see gpodder.bulkimport)
+            def on_progress(done, total, url, error):
+                progress.on_progress(float(done) / float(total))
+                progress.on_message(title_for_url.get(url) or url)
 
-                    try:
-                        username, password = util.username_password_from_url(url)
-                    except ValueError:
-                        username, password = (None, None)
+            importer = bulkimport.BulkImport(self.model, self.config.limit.episodes)
+            importer.run([{'url': url, 'title': title_for_url.get(url), 'section': section_for_url.get(url)}
+                          for url in queued], auth_tokens, on_progress)
 
-                    if title is not None:
-                        # Prefer title from subscription source (bug 1711)
-                        channel.rename(title)
-                    if section is not None:
-                        channel.section = section
-
-                    if username is not None and channel.auth_username is None and \
-                            password is not None and channel.auth_password is None:
-                        channel.auth_username = username
-                        channel.auth_password = password
-
-                    channel.save()
+            for channel in importer.worked:
+                self._update_cover(channel)
+                worked.append(channel.url)
 
-                    self._update_cover(channel)
-                except feedcore.AuthenticationRequired as e:
-                    # use e.url because there might have been a redirection (#571)
-                    if e.url in auth_tokens:
+            for url, error in importer.failed.items():
+                if isinstance(error, feedcore.AuthenticationRequired):
+                    if url in auth_tokens:
                         # Fail for wrong authentication data
-                        error_messages[e.url] = _('Authentication failed')
-                        failed.append(e.url)
+                        error_messages[url] = _('Authentication failed')
+                        failed.append(url)
                     else:
                         # Queue for login dialog later
-                        authreq.append(e.url)
-                    continue
-                except feedcore.WifiLogin as error:
+                        authreq.append(url)
+                elif isinstance(error, feedcore.WifiLogin):
                     redirections[url] = error.data
                     failed.append(url)
                     error_messages[url] = _('Redirection detected')
-                    continue
-                except Exception as e:
-                    logger.error('Subscription error: %s', e, exc_info=True)
-                    error_messages[url] = str(e)
+                else:
+                    error_messages[url] = str(error)
                     failed.append(url)
-                    continue
-
-                assert channel is not None
-                worked.append(channel.url)
 
             util.idle_add(on_after_update)
 
-    def find_episode(self, podcast_url, episode_url):
-        """Find an episode given its podcast and episode URL.
-
-        The function will return a PodcastEpisode object if
-        the episode is found, or None if it's not found.
-        """
-        for podcast in self.channels:
-            if podcast_url == podcast.url:
-                for episode in podcast.get_all_episodes():
-                    if episode_url == episode.url:
-                        return episode
-
-        return None
-
     def process_received_episode_actions(self):
         """Process/merge episode actions from gpodder.net.
 
@@ -2671,7 +2648,8 @@ class gPodder(BuilderWidget):
 
         Gtk.main_iteration()
 
-        self.mygpo_client.process_episode_actions(self.find_episode)
+        podcasts = {podcast.url: podcast for podcast in self.channels}
+        self.mygpo_client.process_episode_actions(podcasts.get)
 
         self.db.commit()
 
@@ -2699,7 +2677,12 @@ class gPodder(BuilderWidget):
             self.show_update_feeds_buttons()
 
     def update_feed_cache(self, channels=None,
-                          show_new_episodes_dialog=True):
+                          show_new_episodes_dialog=True, scheduled=False):
+        """Update feeds (all podcasts with updates enabled, if channels is None).
+
+        For scheduled (automatic) updates, only podcasts that are due for a
+        check according to the update schedule are updated.
+        """
         if self.config.check_connection and not util.connection_available():
             self.show_message(_('Please connect to a network, then try again.'),
                     _('No network connection'), important=True)
@@ -2709,8 +2692,15 @@ class gPodder(BuilderWidget):
         self.rewrite_urls_mygpo()
 
         if channels is None:
-            # Only update podcasts for which updates are enabled
-            channels = [c for c in self.channels if not c.pause_subscription]
+            # Only update podcasts for which updates are enabled,
+            # and which are not waiting for a retry after an error
+            channels = [c for c in self.channels if not c.pause_subscription
+                        and self.retry_schedule.is_due(retry.KIND_PODCAST, c.id)]
+            if scheduled:
+                channels = [c for c in channels if self.update_schedule.is_due(c)]
+                if not channels:
+                    logger.debug('No podcasts due for an update')
+                    return
 
         self.update_action.set_enabled(False)
         self.update_channel_action.set_enabled(False)
@@ -2747,7 +2737,10 @@ class gPodder(BuilderWidget):
                 try:
                     channel._update_error = None
                     util.idle_add(indicate_updating_podcast, channel)
-                    new_episodes.extend(channel.update(max_episodes=self.config.limit.episodes))
+                    episodes = channel.update(max_episodes=self.config.limit.episodes)
+                    new_episodes.extend(episodes)
+                    self.retry_schedule.succeeded(retry.KIND_PODCAST, channel.id)
+                    self.update_schedule.checked(channel, episodes)
                     self._update_cover(channel)
                 except Exception as e:
                     message = str(e)
@@ -2756,6 +2749,8 @@ class gPodder(BuilderWidget):
                     else:
                         channel._update_error = '?'
                     nr_update_errors += 1
+                    self.retry_schedule.failed(retry.KIND_PODCAST, channel.id, message,
+                                               getattr(e, 'retry_after', None))
                     logger.error('Error updating feed: %s: %s', channel.title, message, exc_info=(e.__class__ not in [
                         gpodder.feedcore.BadRequest,
                         gpodder.feedcore.AuthenticationRequired,
@@ -2899,9 +2894,6 @@ class gPodder(BuilderWidget):
 
     def close_gpodder(self):
         """Clean everything and exit properly."""
-        # Cancel any running background updates of the episode list model
-        self.episode_list_model.background_update = None
-
         self.gPodder.hide()
 
         # Notify all tasks to to carry out any clean-up actions
@@ -3116,6 +3108,8 @@ class gPodder(BuilderWidget):
         if getattr(self.active_channel, 'ALL_EPISODES_PROXY', False):
             self.update_feed_cache()
         else:
+            # Start over, even if automatic updates have given up on it
+            self.retry_schedule.reset(retry.KIND_PODCAST, self.active_channel.id)
             self.update_feed_cache(channels=[self.active_channel])
 
     def on_itemUpdate_activate(self, action=None, param=None):
@@ -3834,7 +3828,7 @@ class gPodder(BuilderWidget):
             return True
 
         logger.debug('Auto update timer fired.')
-        self.update_feed_cache()
+        self.update_feed_cache(scheduled=True)
 
         # Ask web service for sub changes (if enabled)
         if self.mygpo_client.can_access_webservice():
@@ -3842,6 +3836,57 @@ class gPodder(BuilderWidget):
 
         return True
 
+    def _on_retry_timer(self):
+        if self.config.check_connection and not util.connection_available():
+            return True
+
+        # Queue failed downloads again, unless the user has paused them meanwhile
+        episode_ids = self.retry_schedule.due(retry.KIND_EPISODE)
+        if episode_ids:
+            channels = {c.id: c for c in self.channels}
+            podcast_ids = self.db.get_episode_podcast_ids(episode_ids)
+            episodes = []
+            for episode_id in episode_ids:
+                channel = channels.get(podcast_ids.get(episode_id))
+                episode = None
+                if channel is not None:
+                    episode = next((e for e in channel.get_all_episodes() if e.id == episode_id), None)
+
+                if episode is None or episode.state != gpodder.STATE_NORMAL:
+                    # Removed, downloaded or deleted meanwhile
+                    self.retry_schedule.succeeded(retry.KIND_EPISODE, episode_id)
+                elif episode.download_task is None or episode.download_task.status == download.DownloadTask.FAILED:
+                    episodes.append(episode)
+                elif episode.download_task.status in (download.DownloadTask.PAUSED, download.DownloadTask.CANCELLED):
+                    # The user has taken over
+                    self.retry_schedule.succeeded(retry.KIND_EPISODE, episode_id)
+                else:
+                    # Queued or running: the attempt reschedules or clears it
+                    self.retry_schedule.postpone(retry.KIND_EPISODE, episode_id)
+            if episodes:
+                logger.info('Retrying %d failed downloads', len(episodes))
+                self.download_episode_list(episodes, hide_progress=True)
+
+        # Update feeds again, unless a feed update is running
+        podcast_ids = self.retry_schedule.due(retry.KIND_PODCAST)
+        if podcast_ids and not self.update_action.get_enabled():
+            for podcast_id in podcast_ids:
+                self.retry_schedule.postpone(retry.KIND_PODCAST, podcast_id)
+        elif podcast_ids:
+            channels = {c.id: c for c in self.channels}
+            retry_channels = []
+            for podcast_id in podcast_ids:
+                channel = channels.get(podcast_id)
+                if channel is None or channel.pause_subscription:
+                    self.retry_schedule.succeeded(retry.KIND_PODCAST, podcast_id)
+                else:
+                    retry_channels.append(channel)
+            if retry_channels:
+                logger.info('Retrying update of %d feeds', len(retry_channels))
+                self.update_feed_cache(retry_channels)
+
+        return True
+
     def on_treeDownloads_row_activated(self, widget, *args):
         # Use the standard way of working on the treeview
         selection = self.treeDownloads.get_selection()
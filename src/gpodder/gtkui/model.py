@@ -23,14 +23,15 @@
 #  Based on code from libpodcasts.py (thp, 2005-10-29)
 #
 
+import bisect
+import collections
 import html
 import logging
 import os
 import re
-import time
 from itertools import groupby
 
-from gi.repository import GdkPixbuf, GLib, GObject, Gtk
+from gi.repository import GdkPixbuf, GObject, Gtk
 
 import gpodder
 from gpodder import coverart, model, query, util
@@ -104,46 +105,14 @@ class SeparatorMarker(object):
     pass
 
 
-class BackgroundUpdate(object):
-    def __init__(self, model, episodes):
-        self.model = model
-        self.episodes = episodes
-        self.index = 0
-
-    def update(self):
-        model = self.model
-
-        started = time.time()
-        while self.episodes:
-            episode = self.episodes.pop(0)
-            base_fields = (
-                model.C_URL, episode.url,
-                model.C_TITLE, episode.title,
-                model.C_EPISODE, episode,
-                model.C_PUBLISHED_TEXT, episode.cute_pubdate(show_time=self.model._config_ui_gtk_episode_list_show_released_time),
-                model.C_PUBLISHED, episode.published,
-            )
-            update_fields = model.get_update_fields(episode)
-            try:
-                it = model.get_iter((self.index,))
-            # fix #727 the tree might be invalid when trying to update so discard the exception
-            except ValueError:
-                break
-            # model.get_update_fields() takes 38-67% of each iteration, depending on episode status
-            # with downloaded episodes using the most time
-            # model.set(), excluding the field expansion, takes 33-62% of each iteration
-            # and each iteration takes 1ms or more on slow machines
-            model.set(it, *(base_fields + update_fields))
-            self.index += 1
-
-            # Check for the time limit of 500ms after each 50 rows processed
-            if self.index % 50 == 0 and (time.time() - started) > 0.5:
-                break
-
-        return bool(self.episodes)
-
+class EpisodeListModel(GObject.Object, Gtk.TreeModel, Gtk.TreeSortable):
+    """Lazy list model of the episodes shown in the episode list.
 
-class EpisodeListModel(Gtk.ListStore):
+    Only the episodes are stored, the fields of a row are formatted when
+    the view asks for them (i.e. when the row is shown) and kept in a
+    small LRU cache. Filtering and sorting work on the list of visible
+    episodes, using keys taken directly from the episodes where possible.
+    """
     C_URL, C_TITLE, C_FILESIZE_TEXT, C_EPISODE, C_STATUS_ICON, \
         C_PUBLISHED_TEXT, C_DESCRIPTION, C_TOOLTIP, \
         C_VIEW_SHOW_UNDELETED, C_VIEW_SHOW_DOWNLOADED, \
@@ -152,33 +121,63 @@ class EpisodeListModel(Gtk.ListStore):
         C_LOCKED, \
         C_TIME_AND_SIZE, C_TOTAL_TIME_AND_SIZE, C_FILESIZE_AND_TIME_TEXT, C_FILESIZE_AND_TIME = list(range(21))
 
+    COLUMN_TYPES = (
+        GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_PYOBJECT,
+        GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_STRING, GObject.TYPE_STRING,
+        GObject.TYPE_BOOLEAN, GObject.TYPE_BOOLEAN, GObject.TYPE_BOOLEAN, GObject.TYPE_INT64,
+        GObject.TYPE_INT64, GObject.TYPE_STRING, GObject.TYPE_BOOLEAN, GObject.TYPE_INT64,
+        GObject.TYPE_BOOLEAN, GObject.TYPE_STRING, GObject.TYPE_INT64, GObject.TYPE_STRING,
+        GObject.TYPE_INT64,
+    )
+
     VIEW_ALL, VIEW_UNDELETED, VIEW_DOWNLOADED, VIEW_UNPLAYED = list(range(4))
 
     VIEWS = ['VIEW_ALL', 'VIEW_UNDELETED', 'VIEW_DOWNLOADED', 'VIEW_UNPLAYED']
 
-    # In which steps the UI is updated for "loading" animations
-    _UI_UPDATE_STEP = .03
-
     # Steps for the "downloading" icon progress
     PROGRESS_STEPS = 20
 
+    # Number of formatted rows kept in memory
+    ROW_CACHE_SIZE = 1000
+
+    # Changing more rows than this at once resets the view (see _reset())
+    # instead of signalling each inserted and deleted row
+    MAX_ROW_SIGNALS = 500
+
     def __init__(self, on_filter_changed=lambda has_episodes: None):
-        Gtk.ListStore.__init__(self, str, str, str, object, str, str, str,
-                               str, bool, bool, bool, GObject.TYPE_INT64,
-                               GObject.TYPE_INT64, str, bool,
-                               GObject.TYPE_INT64, bool, str, GObject.TYPE_INT64, str, GObject.TYPE_INT64)
+        GObject.Object.__init__(self)
 
         # Callback for when the filter / list changes, gets one parameter
         # (has_episodes) that is True if the list has any episodes
         self._on_filter_changed = on_filter_changed
 
-        # Filter to allow hiding some episodes
-        self._filter = self.filter_new()
-        self._sorter = Gtk.TreeModelSort(self._filter)
+        # All episodes of the current channel, and their index in that list
+        self._episodes = []
+        self._index = {}
+        self._by_url = {}
+
+        # Visible episodes, sorted by their sort key (ascending), the sort
+        # keys in the same order, and the sort key of each visible episode.
+        # For a descending sort, the view sees these lists back to front.
+        self._rows = []
+        self._keys = []
+        self._row_keys = {}
+
+        # episode -> formatted row, least recently used first
+        self._cache = collections.OrderedDict()
+
+        self._stamp = 1
+        # Identifies the channel shown, see _channel_key()
+        self._channel_key = None
+        # Set when the formatting of all rows has changed
+        self._needs_reset = False
+        self._sort_column_id = Gtk.TREE_SORTABLE_UNSORTED_SORT_COLUMN_ID
+        self._sort_order = Gtk.SortType.ASCENDING
+        self._view = None
+
         self._view_mode = self.VIEW_ALL
         self._search_term = None
         self._search_term_eql = None
-        self._filter.set_visible_func(self._filter_visible_func)
 
         # Are we currently showing "all episodes"/section or a single channel?
         self._section_view = False
@@ -193,9 +192,6 @@ class EpisodeListModel(Gtk.ListStore):
         self.ICON_DELETED = 'edit-delete'
         self.ICON_ERROR = 'dialog-error'
 
-        self.background_update = None
-        self.background_update_tag = None
-
         if 'KDE_FULL_SESSION' in os.environ:
             # Workaround until KDE adds all the freedesktop icons
             # See https://bugs.kde.org/show_bug.cgi?id=233505 and
@@ -210,24 +206,193 @@ class EpisodeListModel(Gtk.ListStore):
         self._config_ui_gtk_episode_list_show_released_time = False
 
     def cache_config(self, config):
+        cached = (self._config_ui_gtk_episode_list_always_show_new,
+                  self._config_ui_gtk_episode_list_trim_title_prefix,
+                  self._config_ui_gtk_episode_list_descriptions,
+                  self._config_ui_gtk_episode_list_show_released_time)
         self._config_ui_gtk_episode_list_always_show_new = config.ui.gtk.episode_list.always_show_new
         self._config_ui_gtk_episode_list_trim_title_prefix = config.ui.gtk.episode_list.trim_title_prefix
         self._config_ui_gtk_episode_list_descriptions = config.ui.gtk.episode_list.descriptions
         self._config_ui_gtk_episode_list_show_released_time = config.ui.gtk.episode_list.show_released_time
+        if cached != (self._config_ui_gtk_episode_list_always_show_new,
+                      self._config_ui_gtk_episode_list_trim_title_prefix,
+                      self._config_ui_gtk_episode_list_descriptions,
+                      self._config_ui_gtk_episode_list_show_released_time):
+            self._cache.clear()
+            self._needs_reset = True
+
+    # Gtk.TreeModel
+
+    def _iter(self, index):
+        iterator = Gtk.TreeIter()
+        iterator.stamp = self._stamp
+        # user_data is a pointer, so don't use 0 (NULL) for the first row
+        iterator.user_data = index + 1
+        return iterator
+
+    def _episode_at(self, index):
+        """Return the episode in row index of the view."""
+        if self._sort_order == Gtk.SortType.DESCENDING:
+            index = len(self._rows) - 1 - index
+        return self._rows[index]
+
+    def _view_index(self, position):
+        """Return the row in the view of the episode at position in self._rows."""
+        if self._sort_order == Gtk.SortType.DESCENDING:
+            return len(self._rows) - 1 - position
+        return position
+
+    def do_get_flags(self):
+        return Gtk.TreeModelFlags.LIST_ONLY
+
+    def do_get_n_columns(self):
+        return len(self.COLUMN_TYPES)
+
+    def do_get_column_type(self, index):
+        return self.COLUMN_TYPES[index]
+
+    def do_get_iter(self, path):
+        indices = path.get_indices()
+        if len(indices) == 1 and 0 <= indices[0] < len(self._rows):
+            return (True, self._iter(indices[0]))
+        return (False, None)
+
+    def do_get_path(self, iterator):
+        return Gtk.TreePath((iterator.user_data - 1,))
+
+    def do_get_value(self, iterator, column):
+        return self._get_row(self._episode_at(iterator.user_data - 1))[column]
+
+    def do_iter_next(self, iterator):
+        if iterator.user_data < len(self._rows):
+            iterator.user_data += 1
+            return True
+        iterator.stamp = 0
+        return False
 
-    def _format_filesize(self, episode):
-        if episode.file_size > 0:
-            return util.format_filesize(episode.file_size, digits=1)
+    def do_iter_previous(self, iterator):
+        if iterator.user_data > 1:
+            iterator.user_data -= 1
+            return True
+        iterator.stamp = 0
+        return False
+
+    def do_iter_children(self, parent):
+        if parent is None and self._rows:
+            return (True, self._iter(0))
+        return (False, None)
+
+    def do_iter_has_child(self, iterator):
+        return False
+
+    def do_iter_n_children(self, iterator):
+        if iterator is None:
+            return len(self._rows)
+        return 0
+
+    def do_iter_nth_child(self, parent, n):
+        if parent is None and 0 <= n < len(self._rows):
+            return (True, self._iter(n))
+        return (False, None)
+
+    def do_iter_parent(self, child):
+        return (False, None)
+
+    # Gtk.TreeSortable
+
+    def do_get_sort_column_id(self):
+        return (self._sort_column_id >= 0, self._sort_column_id, self._sort_order)
+
+    def do_set_sort_column_id(self, sort_column_id, order):
+        if (sort_column_id, order) == (self._sort_column_id, self._sort_order):
+            return
+
+        old_order = {episode: self._view_index(position) for position, episode in enumerate(self._rows)}
+        self._sort_column_id = sort_column_id
+        self._sort_order = order
+        self._set_visible_rows(*self._sorted(self._rows))
+        self.sort_column_changed()
+
+        if self._rows:
+            new_order = [old_order[self._episode_at(index)] for index in range(len(self._rows))]
+            self._stamp += 1
+            self.rows_reordered(Gtk.TreePath(), None, new_order)
+
+    def do_set_sort_func(self, sort_column_id, sort_func, *user_data):
+        logger.warning('Custom sort functions are not supported by the episode list')
+
+    def do_set_default_sort_func(self, sort_func, *user_data):
+        logger.warning('Custom sort functions are not supported by the episode list')
+
+    def do_has_default_sort_func(self):
+        # The default order is the order of the episodes in the channel
+        return True
+
+    # Rows
+
+    def _format_row(self, episode):
+        row = [None] * len(self.COLUMN_TYPES)
+        fields = (
+            self.C_URL, episode.url,
+            self.C_TITLE, episode.title,
+            self.C_EPISODE, episode,
+            self.C_PUBLISHED_TEXT, episode.cute_pubdate(show_time=self._config_ui_gtk_episode_list_show_released_time),
+            self.C_PUBLISHED, episode.published,
+        ) + self.get_update_fields(episode)
+        for index in range(0, len(fields), 2):
+            row[fields[index]] = fields[index + 1]
+        return row
+
+    def _get_row(self, episode):
+        row = self._cache.get(episode)
+        if row is None:
+            row = self._cache[episode] = self._format_row(episode)
+            if len(self._cache) > self.ROW_CACHE_SIZE:
+                self._cache.popitem(last=False)
         else:
-            return None
+            self._cache.move_to_end(episode)
+        return row
+
+    def _sort_key(self, episode):
+        column = self._sort_column_id
+        index = self._index[episode]
+        if column < 0:
+            value = None
+        elif column == self.C_PUBLISHED:
+            value = episode.published or 0
+        elif column in (self.C_FILESIZE, self.C_FILESIZE_AND_TIME):
+            value = episode.file_size or 0
+        elif column in (self.C_TOTAL_TIME, self.C_TOTAL_TIME_AND_SIZE):
+            value = episode.total_time or 0
+        else:
+            value = self._get_row(episode)[column]
+            # None sorts before everything else
+            value = (value is not None, value)
 
-    def _filter_visible_func(self, model, iterator, misc):
+        return (value, index)
+
+    def _sorted(self, episodes):
+        """Return the episodes and their sort keys, sorted by key."""
+        episodes = list(episodes)
+        keys = [self._sort_key(episode) for episode in episodes]
+        order = sorted(range(len(episodes)), key=keys.__getitem__)
+        return [episodes[i] for i in order], [keys[i] for i in order]
+
+    def _view_flags(self, episode):
+        """Return the undeleted, downloaded and unplayed view visibility of episode."""
+        if episode.downloading:
+            return True, True, True
+        elif episode.state == gpodder.STATE_DELETED:
+            return False, False, False
+        elif episode.state == gpodder.STATE_DOWNLOADED:
+            return True, True, episode.is_new
+        elif episode.state == gpodder.STATE_NORMAL and episode.is_new:
+            return True, self._config_ui_gtk_episode_list_always_show_new, True
+        return True, False, False
+
+    def _is_visible(self, episode):
         # If searching is active, set visibility based on search text
         if self._search_term is not None and self._search_term != '':
-            episode = model.get_value(iterator, self.C_EPISODE)
-            if episode is None:
-                return False
-
             try:
                 return self._search_term_eql.match(episode)
             except Exception:
@@ -235,15 +400,115 @@ class EpisodeListModel(Gtk.ListStore):
 
         if self._view_mode == self.VIEW_ALL:
             return True
-        elif self._view_mode == self.VIEW_UNDELETED:
-            return model.get_value(iterator, self.C_VIEW_SHOW_UNDELETED)
+
+        undeleted, downloaded, unplayed = self._view_flags(episode)
+        if self._view_mode == self.VIEW_UNDELETED:
+            return undeleted
         elif self._view_mode == self.VIEW_DOWNLOADED:
-            return model.get_value(iterator, self.C_VIEW_SHOW_DOWNLOADED)
+            return downloaded
         elif self._view_mode == self.VIEW_UNPLAYED:
-            return model.get_value(iterator, self.C_VIEW_SHOW_UNPLAYED)
+            return unplayed
 
         return True
 
+    def _set_visible_rows(self, rows, keys):
+        self._rows = rows
+        self._keys = keys
+        self._row_keys = dict(zip(rows, keys))
+
+    def _reset(self, rows, keys):
+        """Replace the visible rows without signalling each row.
+
+        The model is taken out of the view while it changes, so the view
+        only asks for the rows it shows afterwards. The selected episodes
+        and the episode at the top of the view are restored.
+        """
+        self._needs_reset = False
+        view = self._view
+        if view is None or view.get_model() is not self:
+            self._stamp += 1
+            self._set_visible_rows(rows, keys)
+            return
+
+        selection = view.get_selection()
+        selected = [self._episode_at(path.get_indices()[0]) for path in selection.get_selected_rows()[1]]
+        visible_range = view.get_visible_range()
+        top = self._episode_at(visible_range[0].get_indices()[0]) if visible_range is not None else None
+
+        view.set_model(None)
+        self._stamp += 1
+        self._set_visible_rows(rows, keys)
+        view.set_model(self)
+
+        if selected or top is not None:
+            positions = {episode: position for position, episode in enumerate(self._rows)}
+            for episode in selected:
+                if episode in positions:
+                    selection.select_path(Gtk.TreePath((self._view_index(positions[episode]),)))
+            if top in positions:
+                view.scroll_to_cell(Gtk.TreePath((self._view_index(positions[top]),)), None, True, 0., 0.)
+
+    def _update_rows(self, rows, keys):
+        """Change the visible rows to rows (sorted by keys), signalling the changed rows.
+
+        Episodes that are no longer visible are deleted, new ones are
+        inserted, and the fewest possible episodes are moved (deleted and
+        inserted again), so most rows keep their selection.
+        """
+        positions = {episode: position for position, episode in enumerate(rows)}
+        common = [episode for episode in self._rows if episode in positions]
+        moved = {common[index] for index in util.moved_indices([positions[episode] for episode in common])}
+
+        removed = [position for position, episode in enumerate(self._rows)
+                   if episode not in positions or episode in moved]
+        added = [position for position, episode in enumerate(rows)
+                 if episode not in self._row_keys or episode in moved]
+        if len(removed) + len(added) > self.MAX_ROW_SIGNALS:
+            self._reset(rows, keys)
+            return
+
+        for position in reversed(removed):
+            self._remove_row(position)
+        for position in added:
+            self._insert_row(position, rows[position], keys[position])
+
+        # The sort keys of the other rows may have changed, but not their order
+        self._set_visible_rows(rows, keys)
+
+    def _changed_in_view(self):
+        """Signal that the rows shown in the view have changed."""
+        if self._view is None or self._view.get_model() is not self:
+            return
+
+        visible_range = self._view.get_visible_range()
+        if visible_range is not None:
+            start, end = (path.get_indices()[0] for path in visible_range)
+            for index in range(start, min(end + 1, len(self._rows))):
+                self.row_changed(Gtk.TreePath((index,)), self._iter(index))
+
+    def _remove_row(self, position):
+        index = self._view_index(position)
+        episode = self._rows.pop(position)
+        del self._keys[position]
+        del self._row_keys[episode]
+        self.row_deleted(Gtk.TreePath((index,)))
+
+    def _insert_row(self, position, episode, key):
+        self._rows.insert(position, episode)
+        self._keys.insert(position, key)
+        self._row_keys[episode] = key
+        index = self._view_index(position)
+        self.row_inserted(Gtk.TreePath((index,)), self._iter(index))
+
+    def _refilter(self):
+        self._update_rows(*self._sorted(episode for episode in self._episodes if self._is_visible(episode)))
+        self._on_filter_changed(self.has_episodes())
+
+    def set_view(self, treeview):
+        """Show this model in treeview (see _reset())."""
+        self._view = treeview
+        treeview.set_model(self)
+
     def get_filtered_model(self):
         """Return a filtered version of this episode model.
 
@@ -251,7 +516,7 @@ class EpisodeListModel(Gtk.ListStore):
         as this model can have some filters set that should
         be reflected in the UI.
         """
-        return self._sorter
+        return self
 
     def has_episodes(self):
         """Return True if episodes are visible (filtered).
@@ -259,7 +524,7 @@ class EpisodeListModel(Gtk.ListStore):
         If episodes are visible with the current filter
         applied, return True (otherwise return False).
         """
-        return bool(len(self._filter))
+        return bool(self._rows)
 
     def set_view_mode(self, new_mode):
         """Set a new view mode for this model.
@@ -269,8 +534,7 @@ class EpisodeListModel(Gtk.ListStore):
         """
         if self._view_mode != new_mode:
             self._view_mode = new_mode
-            self._filter.refilter()
-            self._on_filter_changed(self.has_episodes())
+            self._refilter()
 
     def get_view_mode(self):
         """Return the currently-set view mode."""
@@ -280,12 +544,17 @@ class EpisodeListModel(Gtk.ListStore):
         if self._search_term != new_term:
             self._search_term = new_term
             self._search_term_eql = query.UserEQL(new_term)
-            self._filter.refilter()
-            self._on_filter_changed(self.has_episodes())
+            self._refilter()
 
     def get_search_term(self):
         return self._search_term
 
+    def _format_filesize(self, episode):
+        if episode.file_size > 0:
+            return util.format_filesize(episode.file_size, digits=1)
+        else:
+            return None
+
     def _format_description(self, episode):
         d = []
 
@@ -309,14 +578,30 @@ class EpisodeListModel(Gtk.ListStore):
 
         return ''.join(d)
 
+    def _set_episodes(self, episodes):
+        self._episodes = episodes
+        self._index = {episode: index for index, episode in enumerate(episodes)}
+        self._by_url = {}
+        for episode in episodes:
+            self._by_url.setdefault(episode.url, []).append(episode)
+
+    @staticmethod
+    def _get_channel_key(channel):
+        if isinstance(channel, PodcastChannelProxy):
+            # Proxies are created again when the podcast list changes
+            return (PodcastChannelProxy, channel.section)
+        return channel
+
+    def is_showing(self, channel):
+        """Return True if the episodes of channel are shown."""
+        return channel is not None and self._channel_key == self._get_channel_key(channel)
+
     def replace_from_channel(self, channel):
         """Add episode from the given channel to this model.
 
-        Downloading should be a callback.
+        If the channel is already shown, only the rows of episodes that
+        have been added, removed or moved change.
         """
-        # Remove old episodes in the list store
-        self.clear()
-
         self._section_view = isinstance(channel, PodcastChannelProxy)
 
         # Avoid gPodder bug 1291
@@ -324,61 +609,80 @@ class EpisodeListModel(Gtk.ListStore):
             episodes = []
         else:
             episodes = channel.get_all_episodes()
-
-        # Always make a copy, so we can pass the episode list to BackgroundUpdate
         episodes = list(episodes)
 
-        for _ in range(len(episodes)):
-            self.append()
-
-        self._update_from_episodes(episodes)
+        if self.is_showing(channel) and not self._needs_reset:
+            self._update_from_episodes(episodes)
+        else:
+            self._channel_key = self._get_channel_key(channel)
+            self._cache.clear()
+            self._set_episodes(episodes)
+            self._reset(*self._sorted(episode for episode in self._episodes if self._is_visible(episode)))
+        self._on_filter_changed(self.has_episodes())
 
     def _update_from_episodes(self, episodes):
-        if self.background_update_tag is not None:
-            GLib.source_remove(self.background_update_tag)
-
-        self.background_update = BackgroundUpdate(self, episodes)
-        self.background_update_tag = GLib.idle_add(self._update_background)
-
-    def _update_background(self):
-        if self.background_update is not None:
-            if self.background_update.update():
-                return True
-
-            self.background_update = None
-            self.background_update_tag = None
-            self._on_filter_changed(self.has_episodes())
-
-        return False
+        # Episodes are identified by their id, so an episode loaded again keeps its row
+        old_episodes = {episode.id: episode for episode in self._episodes if episode.id is not None}
+        for episode in episodes:
+            old = old_episodes.get(episode.id)
+            if old is None or old is episode:
+                continue
+
+            key = self._row_keys.pop(old, None)
+            if key is not None:
+                position = bisect.bisect_left(self._keys, key)
+                self._rows[position] = episode
+                self._row_keys[episode] = key
+
+        # The episodes may have been changed by the feed update
+        self._cache.clear()
+        self._set_episodes(episodes)
+        self._update_rows(*self._sorted(episode for episode in self._episodes if self._is_visible(episode)))
+        self._changed_in_view()
+
+    def clear(self):
+        self._channel_key = None
+        self._cache.clear()
+        self._set_episodes([])
+        self._reset([], [])
+        self._on_filter_changed(False)
 
     def update_all(self):
-        if self.background_update is None:
-            episodes = [row[self.C_EPISODE] for row in self]
-        else:
-            # Update all episodes that have already been initialized...
-            episodes = [row[self.C_EPISODE] for index, row in enumerate(self) if index < self.background_update.index]
-            # ...and also include episodes that still need to be initialized
-            episodes.extend(self.background_update.episodes)
-
-        self._update_from_episodes(episodes)
+        self._cache.clear()
+        self._reset(*self._sorted(episode for episode in self._episodes if self._is_visible(episode)))
+        self._on_filter_changed(self.has_episodes())
+
+    def update_episodes(self, episodes):
+        """Update the rows of episodes, which may also show, hide or move them."""
+        for episode in episodes:
+            if episode not in self._index:
+                continue
+
+            self._cache.pop(episode, None)
+            old_key = self._row_keys.get(episode)
+            new_key = self._sort_key(episode) if self._is_visible(episode) else None
+            if old_key is not None and old_key == new_key:
+                index = self._view_index(bisect.bisect_left(self._keys, old_key))
+                self.row_changed(Gtk.TreePath((index,)), self._iter(index))
+                continue
+
+            if old_key is not None:
+                self._remove_row(bisect.bisect_left(self._keys, old_key))
+            if new_key is not None:
+                self._insert_row(bisect.bisect_left(self._keys, new_key), episode, new_key)
 
     def update_by_urls(self, urls):
-        for row in self:
-            if row[self.C_URL] in urls:
-                self.update_by_iter(row.iter)
+        self.update_episodes([episode for url in set(urls) for episode in self._by_url.get(url, ())])
 
     def update_by_filter_iter(self, iterator):
         # Convenience function for use by "outside" methods that use iters
         # from the filtered episode list model (i.e. all UI things normally)
-        iterator = self._sorter.convert_iter_to_child_iter(iterator)
-        self.update_by_iter(self._filter.convert_iter_to_child_iter(iterator))
+        self.update_by_iter(iterator)
 
     def get_update_fields(self, episode):
         tooltip = []
         status_icon = None
-        view_show_undeleted = True
-        view_show_downloaded = False
-        view_show_unplayed = False
+        view_show_undeleted, view_show_downloaded, view_show_unplayed = self._view_flags(episode)
 
         if episode.downloading:
             task = episode.download_task
@@ -391,18 +695,11 @@ class EpisodeListModel(Gtk.ListStore):
                     int(task.progress * 100)))
                 index = int(self.PROGRESS_STEPS * task.progress)
                 status_icon = 'gpodder-progress-%d' % index
-
-            view_show_downloaded = True
-            view_show_unplayed = True
         else:
             if episode.state == gpodder.STATE_DELETED:
                 tooltip.append(_('Deleted'))
                 status_icon = self.ICON_DELETED
-                view_show_undeleted = False
             elif episode.state == gpodder.STATE_DOWNLOADED:
-                view_show_downloaded = True
-                view_show_unplayed = episode.is_new
-
                 file_type = episode.file_type()
                 if file_type == 'audio':
                     tooltip.append(_('Downloaded episode'))
@@ -443,19 +740,11 @@ class EpisodeListModel(Gtk.ListStore):
             elif episode._download_error is not None:
                 tooltip.append(_('ERROR: %s') % episode._download_error)
                 status_icon = self.ICON_ERROR
-                if episode.state == gpodder.STATE_NORMAL and episode.is_new:
-                    view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                    view_show_unplayed = True
             elif not episode.url:
                 tooltip.append(_('No downloadable content'))
                 status_icon = self.ICON_WEB_BROWSER
-                if episode.state == gpodder.STATE_NORMAL and episode.is_new:
-                    view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                    view_show_unplayed = True
             elif episode.state == gpodder.STATE_NORMAL and episode.is_new:
                 tooltip.append(_('New episode'))
-                view_show_downloaded = self._config_ui_gtk_episode_list_always_show_new
-                view_show_unplayed = True
 
         if episode.total_time:
             total_time = util.format_time(episode.total_time)
@@ -491,7 +780,7 @@ class EpisodeListModel(Gtk.ListStore):
     def update_by_iter(self, iterator):
         episode = self.get_value(iterator, self.C_EPISODE)
         if episode is not None:
-            self.set(iterator, *self.get_update_fields(episode))
+            self.update_episodes([episode])
 
 
 class PodcastChannelProxy:
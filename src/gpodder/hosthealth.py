@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.hosthealth - Per-host health statistics and adaptive throttling
+#
+#  Latency, errors and throttle responses (429/503, timeouts) are recorded
+#  per host name. The number of concurrent connections to a host is
+#  adapted AIMD style: it grows slowly while requests succeed, and is
+#  halved when the host throttles us.
+#
+#  Downloads (long transfers) and other requests (feeds, cover art, ...)
+#  have separate connection slots, so running downloads don't hold up
+#  feed updates from the same host.
+#
+
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import requests.exceptions
+
+import gpodder
+from gpodder import util
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+# Responses that mean "slow down"
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+class HostStats(object):
+    FIELDS = ('requests', 'errors', 'throttled', 'latency', 'limit', 'last_throttled')
+
+    def __init__(self, hostname, limit):
+        self.hostname = hostname
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.latency = None  # seconds, moving average
+        self.limit = float(limit)
+        self.last_throttled = None
+        self.last_decrease = 0
+        self.active = 0
+        self.transfers = 0
+
+    def __repr__(self):
+        return '<HostStats %s: %d+%d/%.1f>' % (self.hostname, self.active, self.transfers, self.limit)
+
+    def running(self, transfer):
+        return self.transfers if transfer else self.active
+
+    def add_running(self, transfer, count):
+        if transfer:
+            self.transfers += count
+        else:
+            self.active += count
+
+    @property
+    def error_rate(self):
+        if not self.requests:
+            return 0.
+        return (self.errors + self.throttled) / self.requests
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @classmethod
+    def from_dict(cls, hostname, d):
+        stats = cls(hostname, d.get('limit', 1))
+        for name in cls.FIELDS:
+            if name in d:
+                setattr(stats, name, d[name])
+        return stats
+
+
+class HostRequest(object):
+    """A request in progress, see HostHealth.request()."""
+
+    def __init__(self, health, stats):
+        self._health = health
+        self.stats = stats
+        self.started = time.time()
+        self.status = None
+
+    def response(self, status):
+        """Record the status code of the response (when the headers arrive)."""
+        self.status = status
+        self._health.record(self.stats, status, time.time() - self.started)
+
+
+class HostHealth(object):
+    """Registry of per-host statistics and connection limits."""
+
+    # Connections to a host we haven't seen before
+    INITIAL_LIMIT = 2
+    # Weight of the latest sample in the moving average of the latency
+    LATENCY_WEIGHT = 0.2
+    # Throttle responses of concurrent requests only halve the limit once
+    DECREASE_INTERVAL = 5
+    # Seconds to wait for a free slot, before going over the limit
+    ACQUIRE_TIMEOUT = 30
+
+    def __init__(self):
+        self._config = None
+        self._lock = threading.Condition()
+        self._local = threading.local()
+        self._hosts = {}
+
+    def configure(self, config):
+        self._config = config
+
+    @property
+    def enabled(self):
+        return self._config is None or self._config.limit.hosts.adaptive
+
+    @property
+    def max_limit(self):
+        if self._config is None:
+            return 4
+        return max(1, self._config.limit.hosts.connections)
+
+    @staticmethod
+    def hostname(url):
+        try:
+            return (urllib.parse.urlsplit(url).hostname or '').lower()
+        except ValueError:
+            return ''
+
+    def _get(self, hostname):
+        stats = self._hosts.get(hostname)
+        if stats is None:
+            stats = HostStats(hostname, min(self.INITIAL_LIMIT, self.max_limit))
+            self._hosts[hostname] = stats
+        return stats
+
+    def _has_capacity(self, stats, transfer):
+        return not self.enabled or stats.running(transfer) < max(1, int(min(stats.limit, self.max_limit)))
+
+    def has_capacity(self, url, transfer=False):
+        """Return True if a connection to the host of url can be opened now.
+
+        transfer is True for downloads, which don't count against the
+        slots for other requests (and the other way round).
+        """
+        with self._lock:
+            return self._has_capacity(self._get(self.hostname(url)), transfer)
+
+    def _held(self):
+        if not hasattr(self._local, 'held'):
+            self._local.held = collections.Counter()
+        return self._local.held
+
+    def acquire(self, url, transfer=False, timeout=None):
+        """Wait for a free connection slot for the host of url.
+
+        A thread that already holds a slot for the host (e.g. when retrying
+        a request inside a request) doesn't need another one. If no slot
+        becomes free within timeout seconds (default: ACQUIRE_TIMEOUT), the
+        slot is taken anyway, so a busy host can't block us forever.
+        """
+        if timeout is None:
+            timeout = self.ACQUIRE_TIMEOUT
+        held = self._held()
+        with self._lock:
+            stats = self._get(self.hostname(url))
+            if not held[stats.hostname, transfer]:
+                if not self._lock.wait_for(lambda: self._has_capacity(stats, transfer), timeout):
+                    logger.warning('No free connection to %s after %d seconds, connecting anyway',
+                                   stats.hostname, timeout)
+                stats.add_running(transfer, 1)
+            held[stats.hostname, transfer] += 1
+            return stats
+
+    def release(self, stats, transfer=False):
+        held = self._held()
+        with self._lock:
+            held[stats.hostname, transfer] -= 1
+            if not held[stats.hostname, transfer]:
+                stats.add_running(transfer, -1)
+                self._lock.notify_all()
+
+    @contextlib.contextmanager
+    def request(self, url, transfer=False):
+        """Context manager for a request to url.
+
+        Waits for a free connection slot for the host, and records errors
+        raised inside the block. Call response() on the returned object
+        when the response arrives. Use transfer=True for downloads.
+        """
+        stats = self.acquire(url, transfer)
+        request = HostRequest(self, stats)
+        try:
+            yield request
+        except requests.exceptions.Timeout:
+            self.record(stats, None, time.time() - request.started, throttled=True)
+            raise
+        except (requests.exceptions.RequestException, OSError):
+            if request.status is None:
+                self.record(stats, None, time.time() - request.started)
+            raise
+        finally:
+            self.release(stats, transfer)
+
+    def record(self, stats, status, latency, throttled=False):
+        """Record the outcome of a request and adapt the connection limit."""
+        now = time.time()
+        with self._lock:
+            stats.requests += 1
+            if status is not None:
+                if stats.latency is None:
+                    stats.latency = latency
+                else:
+                    stats.latency += self.LATENCY_WEIGHT * (latency - stats.latency)
+
+            if throttled or status in THROTTLE_STATUS_CODES:
+                stats.throttled += 1
+                stats.last_throttled = int(now)
+                if now - stats.last_decrease > self.DECREASE_INTERVAL:
+                    # Multiplicative decrease
+                    stats.limit = max(1., stats.limit / 2)
+                    stats.last_decrease = now
+                    logger.info('%s is throttling, limiting to %d connections', stats.hostname, int(stats.limit))
+            elif status is None or status >= 400:
+                stats.errors += 1
+            else:
+                # Additive increase: about one more connection per round of successful requests
+                stats.limit = min(float(self.max_limit), stats.limit + 1. / stats.limit)
+
+            self._lock.notify_all()
+
+    def stats(self):
+        """Return the statistics of all known hosts, most used hosts first."""
+        with self._lock:
+            return sorted(self._hosts.values(), key=lambda s: s.requests, reverse=True)
+
+    def load(self, filename):
+        try:
+            with open(filename, 'r') as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning('Cannot load host statistics from %s', filename, exc_info=True)
+            return
+
+        with self._lock:
+            for hostname, d in data.items():
+                self._hosts[hostname] = HostStats.from_dict(hostname, d)
+
+    def save(self, filename):
+        with self._lock:
+            data = {hostname: stats.to_dict() for hostname, stats in self._hosts.items()}
+
+        try:
+            with open(filename + '.tmp', 'w') as fp:
+                json.dump(data, fp)
+            util.atomic_rename(filename + '.tmp', filename)
+        except OSError:
+            logger.warning('Cannot save host statistics to %s', filename, exc_info=True)
+
+
+hosts = HostHealth()
+
+
+def hosts_file():
+    return os.path.join(gpodder.home, 'Hosts.json')
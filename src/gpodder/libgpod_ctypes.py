@@ -323,14 +323,11 @@ class iPodTrack(object):
 
         self.track = None
 
-        # Don't forget to write the database on close
-        self.db.modified = True
+        self.db.forget_track(self)
 
+        # The file is still referenced by the iTunesDB on the device, delete it after the next commit
         if self.filename_on_ipod is not None:
-            try:
-                os.unlink(self.filename_on_ipod)
-            except Exception:
-                logger.info('Could not delete podcast file from iPod', exc_info=True)
+            self.db.pending_unlink.append(self.filename_on_ipod)
 
 
 class iPodDatabase(object):
@@ -343,17 +340,37 @@ class iPodDatabase(object):
 
         logger.info('iTunesDB: %s', self.itdb)
 
-        self.modified = False
+        # Number of tracks added or removed since the iTunesDB was last written
+        self.changes = 0
+        # Files of removed tracks, to be deleted once the iTunesDB doesn't reference them
+        self.pending_unlink = []
 
         self.podcasts_playlist = libgpod.itdb_playlist_podcasts(self.itdb)
         self.master_playlist = libgpod.itdb_playlist_mpl(self.itdb)
 
         self.tracks = [iPodTrack(self, track)
                        for track in glist_foreach(self.podcasts_playlist[0].members, ctypes.POINTER(Itdb_Track))]
+        self.tracks_by_url = {}
+        for track in self.tracks:
+            self.tracks_by_url.setdefault(track.podcast_url, track)
+
+    @property
+    def modified(self):
+        return self.changes > 0
 
     def get_podcast_tracks(self):
         return self.tracks
 
+    def find_track(self, podcast_url):
+        """Return the track of the episode with the given URL, or None."""
+        return self.tracks_by_url.get(podcast_url)
+
+    def forget_track(self, track):
+        self.tracks.remove(track)
+        if self.tracks_by_url.get(track.podcast_url) is track:
+            del self.tracks_by_url[track.podcast_url]
+        self.changes += 1
+
     def add_track(self, filename, episode_title, podcast_title, description, podcast_url, podcast_rss,
             published_timestamp, track_length, is_audio):
         track = libgpod.itdb_track_new()
@@ -394,9 +411,10 @@ class iPodDatabase(object):
 
         copied = libgpod.itdb_cp_track_to_ipod(track, filename.encode(), None)
         logger.info('Copy result: %r', copied)
-        self.modified = True
+        self.changes += 1
 
         self.tracks.append(iPodTrack(self, track))
+        self.tracks_by_url.setdefault(podcast_url, self.tracks[-1])
         return self.tracks[-1]
 
     def __del__(self):
@@ -404,12 +422,34 @@ class iPodDatabase(object):
         # just free the memory, but don't write out any modifications.
         self.close(write=False)
 
+    def commit(self):
+        """Write the iTunesDB to the device, if it has been modified.
+
+        Files of tracks removed since the last commit are only deleted
+        after the iTunesDB has been written, so that an interrupted sync
+        never leaves tracks in the iTunesDB whose files are missing.
+        """
+        if not self.itdb or not self.modified:
+            return True
+
+        result = libgpod.itdb_write(self.itdb, None)
+        logger.info('Wrote iTunesDB with %d changes: %r', self.changes, result)
+        if not result:
+            return False
+
+        self.changes = 0
+        for filename in self.pending_unlink:
+            try:
+                os.unlink(filename)
+            except Exception:
+                logger.info('Could not delete podcast file from iPod', exc_info=True)
+        self.pending_unlink = []
+        return True
+
     def close(self, write=True):
         if self.itdb:
-            if self.modified and write:
-                result = libgpod.itdb_write(self.itdb, None)
-                logger.info('Close result: %r', result)
-                self.modified = False
+            if write:
+                self.commit()
 
             libgpod.itdb_free(self.itdb)
             self.itdb = None
@@ -47,6 +47,13 @@ class Store(object):
     def __init__(self, filename=':memory:'):
         self.db = sqlite.connect(filename, check_same_thread=False)
         self.lock = threading.RLock()
+        # Registered schemas (table -> slots), so that tables are only checked once
+        self._registered = {}
+        # Row ids of the objects returned by load() (table -> {object: rowid}),
+        # and the reverse mapping (table -> {rowid: object}), so that only
+        # the object loaded last from a row is kept
+        self._rowids = {}
+        self._objects = {}
 
     def _schema(self, class_):
         return class_.__name__, sorted(class_.__slots__)
@@ -75,6 +82,9 @@ class Store(object):
     def _register(self, class_):
         with self.lock:
             table, slots = self._schema(class_)
+            if self._registered.get(table) == slots:
+                return
+
             cur = self.db.execute('PRAGMA table_info(%s)' % table)
             available = cur.fetchall()
 
@@ -88,6 +98,21 @@ class Store(object):
                 self.db.execute('CREATE TABLE %s (%s)' % (table,
                         ', '.join('%s TEXT' % s for s in slots)))
 
+            # Classes can list the key columns they are looked up by in INDEX
+            columns = getattr(class_, 'INDEX', ())
+            if columns:
+                self.db.execute('CREATE INDEX IF NOT EXISTS idx_%s_%s ON %s (%s)' % (table,
+                    '_'.join(columns), table, ', '.join(columns)))
+
+            self._registered[table] = slots
+
+    def _forget(self, table, o):
+        # Return the row id of an object from load(), and forget it
+        rowid = self._rowids.get(table, {}).pop(o, None)
+        if rowid is not None:
+            del self._objects[table][rowid]
+        return rowid
+
     def convert(self, v):
         if isinstance(v, str):
             return v
@@ -105,20 +130,25 @@ class Store(object):
 
     def save(self, o):
         if hasattr(o, '__iter__'):
-            klass = None
-            for child in o:
-                if klass is None:
-                    klass = child.__class__
-                    self._register(klass)
-                    table, slots = self._schema(klass)
-
-                if not isinstance(child, klass):
-                    raise ValueError('Only one type of object allowed')
-
-                used = [s for s in slots if getattr(child, s, None) is not None]
-                values = [self.convert(getattr(child, slot)) for slot in used]
-                self.db.execute('INSERT INTO %s (%s) VALUES (%s)' % (table,
-                    ', '.join(used), ', '.join('?' * len(used))), values)
+            with self.lock:
+                klass = None
+                # Rows with the same columns are inserted in one go
+                rows = {}
+                for child in o:
+                    if klass is None:
+                        klass = child.__class__
+                        self._register(klass)
+                        table, slots = self._schema(klass)
+
+                    if not isinstance(child, klass):
+                        raise ValueError('Only one type of object allowed')
+
+                    used = tuple(s for s in slots if getattr(child, s, None) is not None)
+                    rows.setdefault(used, []).append([self.convert(getattr(child, slot)) for slot in used])
+
+                for used, values in rows.items():
+                    self.db.executemany('INSERT INTO %s (%s) VALUES (%s)' % (table,
+                        ', '.join(used), ', '.join('?' * len(used))), values)
             return
 
         with self.lock:
@@ -136,6 +166,8 @@ class Store(object):
             sql = 'DELETE FROM %s' % (table,)
             if kwargs:
                 sql += ' WHERE %s' % (' AND '.join('%s=?' % k for k in kwargs))
+            self._rowids.pop(table, None)
+            self._objects.pop(table, None)
             try:
                 self.db.execute(sql, list(kwargs.values()))
                 return True
@@ -143,27 +175,37 @@ class Store(object):
                 return False
 
     def remove(self, o):
-        if hasattr(o, '__iter__'):
-            for child in o:
-                self.remove(child)
-            return
+        objects = o if hasattr(o, '__iter__') else (o,)
 
         with self.lock:
-            self._register(o.__class__)
-            table, slots = self._schema(o.__class__)
+            # Statement -> parameters of the rows to delete
+            statements = {}
+            for child in objects:
+                self._register(child.__class__)
+                table, slots = self._schema(child.__class__)
 
-            # Use "None" as wildcard selector in remove actions
-            slots = [s for s in slots if getattr(o, s, None) is not None]
+                # Use "None" as wildcard selector in remove actions
+                slots = [s for s in slots if getattr(child, s, None) is not None]
+                values = [self.convert(getattr(child, slot)) for slot in slots]
+                where = ['%s=?' % s for s in slots]
 
-            values = [self.convert(getattr(o, slot)) for slot in slots]
-            self.db.execute('DELETE FROM %s WHERE %s' % (table,
-                ' AND '.join('%s=?' % s for s in slots)), values)
+                # Objects from load() are found by their row id. The values
+                # are still compared, in case the row has been replaced.
+                rowid = self._forget(table, child)
+                if rowid is not None:
+                    where.insert(0, 'rowid=?')
+                    values.insert(0, rowid)
+
+                statements.setdefault('DELETE FROM %s WHERE %s' % (table, ' AND '.join(where)), []).append(values)
+
+            for sql, values in statements.items():
+                self.db.executemany(sql, values)
 
     def load(self, class_, **kwargs):
         with self.lock:
             self._register(class_)
             table, slots = self._schema(class_)
-            sql = 'SELECT %s FROM %s' % (', '.join(slots), table)
+            sql = 'SELECT rowid, %s FROM %s' % (', '.join(slots), table)
             if kwargs:
                 sql += ' WHERE %s' % (' AND '.join('%s=?' % k for k in kwargs))
             try:
@@ -171,13 +213,22 @@ class Store(object):
             except Exception:
                 raise
 
+            rowids = self._rowids.setdefault(table, {})
+            objects = self._objects.setdefault(table, {})
+
             def apply(row):
                 o = class_.__new__(class_)
-                for attr, value in zip(slots, row):
+                for attr, value in zip(slots, row[1:]):
                     try:
                         self._set(o, attr, value)
                     except ValueError:
                         return None
+                # An object loaded from the same row before is replaced
+                old = objects.get(row[0])
+                if old is not None:
+                    del rowids[old]
+                rowids[o] = row[0]
+                objects[row[0]] = o
                 return o
             return [x for x in [apply(row) for row in cur] if x is not None]
 
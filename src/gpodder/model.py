@@ -24,22 +24,24 @@
 #  Based on libpodcasts.py (thp, 2005-10-29)
 #
 
+import concurrent.futures
 import datetime
 import glob
 import hashlib
+import heapq
 import json
 import logging
 import os
 import re
 import shutil
 import string
+import threading
 import time
 import urllib.parse
 
-import podcastparser
-
 import gpodder
-from gpodder import coverart, feedcore, registry, schema, util, vimeo, youtube
+from gpodder import (coverart, feedcore, parsepool, registry, schema, timing,
+                     util, vimeo, youtube)
 
 logger = logging.getLogger(__name__)
 
@@ -98,12 +100,27 @@ class Feed:
         """
         return None
 
+    def prefetch_next_page(self, channel):
+        """Start fetching the next page in the background (optional).
+
+        Called before get_new_episodes() when the next page is likely to be
+        needed, so that get_next_page() doesn't have to wait for it.
+        """
+        pass
+
 
 class PodcastParserFeed(Feed):
-    def __init__(self, feed, fetcher, max_episodes=0):
+    def __init__(self, feed, fetcher, max_episodes=0, feed_data=None):
         self.feed = feed
         self.fetcher = fetcher
         self.max_episodes = max_episodes
+        # The response, for looking up details of YouTube channels. It is kept
+        # here because the fetcher is shared by concurrent updates.
+        self.feed_data = feed_data
+        # URL of this page if it is a page of a paged feed (not the first one)
+        self.page_url = None
+        # (url, stored page, Future of the response) of the prefetched next page
+        self._next_page = None
 
     def get_title(self):
         return self.feed.get('title')
@@ -111,13 +128,13 @@ class PodcastParserFeed(Feed):
     def get_link(self):
         vid = youtube.get_youtube_id(self.feed['url'])
         if vid is not None:
-            self.feed['link'] = youtube.get_channel_id_url(self.feed['url'], self.fetcher.feed_data)
+            self.feed['link'] = youtube.get_channel_id_url(self.feed['url'], self.feed_data)
         return self.feed.get('link')
 
     def get_description(self):
         vid = youtube.get_youtube_id(self.feed['url'])
         if vid is not None:
-            self.feed['description'] = youtube.get_channel_desc(self.feed['url'], self.fetcher.feed_data)
+            self.feed['description'] = youtube.get_channel_desc(self.feed['url'], self.feed_data)
         return self.feed.get('description')
 
     def get_cover_url(self):
@@ -143,11 +160,12 @@ class PodcastParserFeed(Feed):
         # because if the feed lists items in ascending order and has >
         # max_episodes old episodes, new episodes will not be shown.
         # See also: gPodder Bug 1186
-        entries = sorted(self.feed.get('episodes', []), key=lambda episode: episode['published'], reverse=True)
-
         # We can limit the maximum number of entries that gPodder will parse
+        entries = self.feed.get('episodes', [])
         if self.max_episodes > 0 and len(entries) > self.max_episodes:
-            entries = entries[:self.max_episodes]
+            entries = heapq.nlargest(self.max_episodes, entries, key=parsepool.by_published)
+        else:
+            entries = sorted(entries, key=parsepool.by_published, reverse=True)
 
         num_duplicate_guids = 0
 
@@ -175,24 +193,114 @@ class PodcastParserFeed(Feed):
             else:
                 new_episodes.append(episode)
 
+            episode.cache_text_description()
+            episode.save()
+
             if episode.total_time == 0 and 'youtube' in episode.url:
                 # query duration for new and existing youtube episodes that haven't been
                 # downloaded or queried such as live streams after they have ended
-                episode.total_time = youtube.get_total_time(episode)
-
-            episode.cache_text_description()
-            episode.save()
+                # (in the background, the episode needs an id to be saved)
+                youtube.duration_lookups.enqueue(episode)
+
+        # Remember the page, to request it conditionally next time
+        etag, last_modified = self.get_http_etag(), self.get_http_last_modified()
+        if self.page_url is not None and channel.id is not None and (etag or last_modified):
+            channel.db.save_feed_page(channel.id, self.page_url, self.max_episodes, etag, last_modified,
+                                      self.feed.get('paged_feed_next'), sorted(seen_guids))
         return new_episodes, seen_guids
 
+    def prefetch_next_page(self, channel):
+        url = self.feed.get('paged_feed_next')
+        if url is None or self._next_page is not None:
+            return
+
+        if self.max_episodes > 0 and len(self.feed.get('episodes', [])) >= self.max_episodes:
+            # This page likely has all the episodes we want
+            return
+
+        page = channel.db.get_feed_page(channel.id, url) if channel.id is not None else None
+        etag, last_modified = page[1:3] if page is not None else (None, None)
+        auth_url = channel.authenticate_url(url)
+        future = concurrent.futures.Future()
+
+        def request():
+            try:
+                future.set_result(self.fetcher.request(auth_url, etag, last_modified))
+            except Exception as e:
+                future.set_exception(e)
+
+        logger.debug('Prefetching next page %s', url)
+        util.run_in_background(request, daemon=True)
+        self._next_page = (url, page, future)
+
     def get_next_page(self, channel, max_episodes):
         if 'paged_feed_next' in self.feed:
             url = self.feed['paged_feed_next']
             logger.debug("get_next_page: feed has next %s", url)
-            url = channel.authenticate_url(url)
-            return self.fetcher.fetch(url, autodiscovery=False, max_episodes=max_episodes)
+            auth_url = channel.authenticate_url(url)
+            if self._next_page is not None:
+                url, page, future = self._next_page
+                self._next_page = None
+                with timing.span('transfer'):
+                    response = future.result()
+            else:
+                page = channel.db.get_feed_page(channel.id, url) if channel.id is not None else None
+                etag, last_modified = page[1:3] if page is not None else (None, None)
+                response = self.fetcher.request(auth_url, etag, last_modified)
+
+            result = self.fetcher.fetch(auth_url, autodiscovery=False, max_episodes=max_episodes, response=response)
+            if result.status == feedcore.NOT_MODIFIED:
+                page_max_episodes, etag, last_modified, next_url, guids = page
+                if page_max_episodes == max_episodes:
+                    return feedcore.Result(feedcore.UPDATED_FEED, UnchangedFeedPage(
+                        self.fetcher, url, next_url, guids, max_episodes))
+                # The page was processed with another limit, we need its episodes
+                result = self.fetcher.fetch(auth_url, autodiscovery=False, max_episodes=max_episodes)
+
+            if result.status == feedcore.UPDATED_FEED:
+                result.feed.page_url = url
+            return result
         return None
 
 
+class UnchangedFeedPage(PodcastParserFeed):
+    """A page of a paged feed that hasn't changed since the last update."""
+
+    def __init__(self, fetcher, url, next_url, guids, max_episodes):
+        feed = {'url': url, 'episodes': []}
+        if next_url is not None:
+            feed['paged_feed_next'] = next_url
+        super().__init__(feed, fetcher, max_episodes)
+        self.page_url = url
+        self.guids = guids
+        # The page, if it had to be fetched after all
+        self._fetched = None
+
+    def get_new_episodes(self, channel, existing_guids):
+        if all(guid in existing_guids for guid in self.guids):
+            logger.debug('Feed page not modified: %s', self.page_url)
+            return [], set(self.guids)
+
+        # Some episodes of the page have been removed (e.g. limit.episodes was lowered)
+        result = self.fetcher.fetch(channel.authenticate_url(self.page_url), autodiscovery=False,
+                                    max_episodes=self.max_episodes)
+        if result.status != feedcore.UPDATED_FEED:
+            return [], set()
+
+        self._fetched = result.feed
+        self._fetched.page_url = self.page_url
+        return self._fetched.get_new_episodes(channel, existing_guids)
+
+    def prefetch_next_page(self, channel):
+        if self._fetched is None:
+            super().prefetch_next_page(channel)
+
+    def get_next_page(self, channel, max_episodes):
+        if self._fetched is not None:
+            return self._fetched.get_next_page(channel, max_episodes)
+        return super().get_next_page(channel, max_episodes)
+
+
 class gPodderFetcher(feedcore.Fetcher):
     """Implements fetching a channel from custom feed handlers or the default using podcastparser."""
 
@@ -213,12 +321,12 @@ class gPodderFetcher(feedcore.Fetcher):
         return url
 
     def parse_feed(self, url, feed_data, data_stream, headers, status, max_episodes=0, **kwargs):
-        self.feed_data = feed_data
         try:
-            feed = podcastparser.parse(url, data_stream)
+            with timing.span('parse'):
+                feed = parsepool.pool.parse(url, data_stream, max_episodes)
             feed['url'] = url
             feed['headers'] = headers
-            return feedcore.Result(status, PodcastParserFeed(feed, self, max_episodes))
+            return feedcore.Result(status, PodcastParserFeed(feed, self, max_episodes, feed_data))
         except ValueError as e:
             raise feedcore.InvalidFeed('Could not parse feed: {url}: {msg}'.format(url=url, msg=e))
 
@@ -940,6 +1048,10 @@ class PodcastChannel(PodcastModelObject):
 
     feed_fetcher = gPodderFetcher()
 
+    # Podcasts can be updated in parallel (e.g. by BulkImport), but the
+    # extensions' podcast hooks are not expected to run concurrently
+    _extensions_lock = threading.RLock()
+
     def __init__(self, model, channel_id=None):
         self.parent = model
         self.children = []
@@ -1037,9 +1149,10 @@ class PodcastChannel(PodcastModelObject):
         # youtube-dl and yt-dlp create <name>.partial and <name>.partial.<ext> files while downloading.
         # On startup, the latter is reported as an unknown external file.
         # Both files are properly removed when the download completes.
+        # <name>.partial.resume holds the validators for resuming a download (see download.ResumeInfo).
         existing_files = {filename
                 for filename in glob.glob(os.path.join(self.save_dir, '*'))
-                if not filename.endswith('.partial')}
+                if not filename.endswith(('.partial', '.partial.resume'))}
 
         ignore_files = ['folder' + ext for ext in
                 coverart.CoverDownloader.EXTENSIONS]
@@ -1117,31 +1230,39 @@ class PodcastChannel(PodcastModelObject):
             # updating the feed and adding saving episodes
             tmp.save()
 
-            try:
-                tmp.update(max_episodes)
-            except Exception:
-                logger.debug('Fetch failed. Removing buggy feed.')
-                tmp.remove_downloaded()
-                tmp.delete()
-                raise
+            tmp.first_update(max_episodes)
+            tmp.finish_subscription()
 
-            # Determine the section in which this podcast should appear
-            tmp.section = tmp._get_content_type()
+            return tmp
 
-            # Determine a new download folder now that we have the title
-            tmp.get_save_dir(force_new=True)
+    def first_update(self, max_episodes=0):
+        """Update a new (saved) podcast for the first time, delete it if that fails."""
+        try:
+            self.update(max_episodes)
+        except Exception:
+            logger.debug('Fetch failed. Removing buggy feed.')
+            self.remove_downloaded()
+            self.delete()
+            raise
 
-            # Mark episodes as downloaded if files already exist (bug 902)
-            tmp.check_download_folder()
+    def finish_subscription(self):
+        """Set up a new podcast after its first update."""
+        # Determine the section in which this podcast should appear
+        self.section = self._get_content_type()
 
-            # Determine common prefix of episode titles
-            tmp._determine_common_prefix()
+        # Determine a new download folder now that we have the title
+        self.get_save_dir(force_new=True)
 
-            tmp.save()
+        # Mark episodes as downloaded if files already exist (bug 902)
+        self.check_download_folder()
 
-            gpodder.user_extensions.on_podcast_subscribe(tmp)
+        # Determine common prefix of episode titles
+        self._determine_common_prefix()
 
-            return tmp
+        self.save()
+
+        with self._extensions_lock:
+            gpodder.user_extensions.on_podcast_subscribe(self)
 
     def episode_factory(self, d):
         """Create a PodcastEpisode from a dict.
@@ -1185,11 +1306,12 @@ class PodcastChannel(PodcastModelObject):
         self.save()
 
     def _consume_updated_feed(self, feed, max_episodes=0):
-        self._consume_metadata(feed.get_title() or self.url,
-                               feed.get_link() or self.link,
-                               feed.get_description() or '',
-                               feed.get_cover_url() or None,
-                               feed.get_payment_url() or None)
+        with timing.span('metadata'):
+            self._consume_metadata(feed.get_title() or self.url,
+                                   feed.get_link() or self.link,
+                                   feed.get_description() or '',
+                                   feed.get_cover_url() or None,
+                                   feed.get_payment_url() or None)
 
         # Update values for HTTP conditional requests
         self.http_etag = feed.get_http_etag() or self.http_etag
@@ -1209,8 +1331,14 @@ class PodcastChannel(PodcastModelObject):
             logger.debug('Episode published in the future for podcast %s', self.title)
             last_published = tomorrow
 
+        # Paginate in the background while processing the episodes of a page,
+        # when we'll want more episodes (see below), e.g. for new subscriptions
+        if not existing or max_episodes > len(existing):
+            feed.prefetch_next_page(self)
+
         # new episodes from feed
-        new_episodes, seen_guids = feed.get_new_episodes(self, existing_guids)
+        with timing.span('episodes'):
+            new_episodes, seen_guids = feed.get_new_episodes(self, existing_guids)
 
         # pagination
         next_feed = feed
@@ -1230,7 +1358,9 @@ class PodcastChannel(PodcastModelObject):
                 next_feed = next_result.feed
                 for e in new_episodes:
                     existing_guids[e.guid] = e
-                next_new_episodes, next_seen_guids = next_feed.get_new_episodes(self, existing_guids)
+                next_feed.prefetch_next_page(self)
+                with timing.span('episodes'):
+                    next_new_episodes, next_seen_guids = next_feed.get_new_episodes(self, existing_guids)
                 logger.debug("next page has %i new episodes, %i seen episodes", len(next_new_episodes), len(next_seen_guids))
                 if not next_seen_guids:
                     logger.debug("breaking out of get_next_page loop because no episode in this page")
@@ -1264,7 +1394,8 @@ class PodcastChannel(PodcastModelObject):
 
         self.children.extend(new_episodes)
 
-        self.remove_unreachable_episodes(existing, seen_guids, max_episodes)
+        with timing.span('purge'):
+            self.remove_unreachable_episodes(existing, seen_guids, max_episodes)
         return real_new_episodes
 
     def remove_unreachable_episodes(self, existing, seen_guids, max_episodes):
@@ -1279,7 +1410,8 @@ class PodcastChannel(PodcastModelObject):
             for episode in episodes_to_purge:
                 logger.debug('Episode removed from feed: %s (%s)',
                         episode.title, episode.guid)
-                gpodder.user_extensions.on_episode_removed_from_podcast(episode)
+                with self._extensions_lock:
+                    gpodder.user_extensions.on_episode_removed_from_podcast(episode)
                 self.db.delete_episode_by_guid(episode.guid, self.id)
 
                 # Remove the episode from the "children" episodes list
@@ -1296,6 +1428,23 @@ class PodcastChannel(PodcastModelObject):
         self.children.sort(key=lambda e: e.published, reverse=True)
 
     def update(self, max_episodes=0):
+        """Update the podcast from its feed and return the new episodes.
+
+        The time spent in each phase of the update is recorded in the
+        database (see gpodder.timing).
+        """
+        outermost = timing.current() is None
+        with timing.collect() as timer:
+            try:
+                return self._update(max_episodes)
+            finally:
+                if outermost and self.id is not None:
+                    phases = dict(timer.phases, total=timer.total)
+                    self.db.save_update_timing(self.id, phases)
+                    # _update() has already committed (or failed)
+                    self.db.commit()
+
+    def _update(self, max_episodes):
         max_episodes = int(max_episodes)
         new_episodes = []
         try:
@@ -1330,15 +1479,18 @@ class PodcastChannel(PodcastModelObject):
             # feedcore.NotFound
             # feedcore.InvalidFeed
             # feedcore.UnknownStatusCode
-            gpodder.user_extensions.on_podcast_update_failed(self, e)
+            with timing.span('extensions'), self._extensions_lock:
+                gpodder.user_extensions.on_podcast_update_failed(self, e)
             raise
 
-        gpodder.user_extensions.on_podcast_updated(self)
+        with timing.span('extensions'), self._extensions_lock:
+            gpodder.user_extensions.on_podcast_updated(self)
 
         # Re-determine the common prefix for all episodes
         self._determine_common_prefix()
 
-        self.db.commit()
+        with timing.span('commit'):
+            self.db.commit()
         return new_episodes
 
     def delete(self):
@@ -1349,7 +1501,8 @@ class PodcastChannel(PodcastModelObject):
         if self.download_folder is None:
             self.get_save_dir()
 
-        gpodder.user_extensions.on_podcast_save(self)
+        with self._extensions_lock:
+            gpodder.user_extensions.on_podcast_save(self)
 
         self.db.save_podcast(self)
         self.model._append_podcast(self)
@@ -25,7 +25,9 @@
 
 import atexit
 import calendar
+import collections
 import datetime
+import gzip
 import logging
 import os
 import sys
@@ -33,7 +35,8 @@ import time
 
 # Append gPodder's user agent to mygpoclient's user agent
 import mygpoclient
-from mygpoclient import api, public
+from mygpoclient import api, http, public
+from mygpoclient import json as mygpojson
 from mygpoclient import util as mygpoutil
 
 import gpodder
@@ -70,7 +73,61 @@ except ImportError:
     MissingCredentials = object()
 
 
-EPISODE_ACTIONS_BATCH_SIZE = 100
+class CompressingJsonClient(mygpojson.JsonClient):
+    """JsonClient that accepts gzip-compressed responses.
+
+    Request bodies are only compressed if compress is True, because there
+    is no way to ask a server whether it accepts them (gpodder.net doesn't).
+    If a server rejects a compressed request that it then accepts
+    uncompressed, compression is turned off.
+    """
+
+    # Smaller request bodies are not worth compressing
+    MIN_COMPRESS_SIZE = 1024
+
+    def __init__(self, username=None, password=None, compress=False):
+        super().__init__(username, password)
+        self.compress = compress
+
+    def _should_compress(self, body):
+        return self.compress and body is not None and len(body) >= self.MIN_COMPRESS_SIZE
+
+    def _prepare_request(self, method, uri, data):
+        request = mygpojson.JsonClient._prepare_request(method, uri, data)
+        request.add_header('Accept-Encoding', 'gzip')
+        if self._should_compress(request.data):
+            request.data = gzip.compress(request.data)
+            request.add_header('Content-Encoding', 'gzip')
+        return request
+
+    @staticmethod
+    def _process_response(response):
+        data = response.read()
+        if response.headers.get('Content-Encoding') == 'gzip':
+            data = gzip.decompress(data)
+        return mygpojson.JsonClient.decode(data)
+
+    def _request(self, method, uri, data, **kwargs):
+        if not self._should_compress(mygpojson.JsonClient.encode(data)):
+            return super()._request(method, uri, data, **kwargs)
+
+        try:
+            return super()._request(method, uri, data, **kwargs)
+        except (http.BadRequest, http.UnknownResponse) as e:
+            if isinstance(e, http.UnknownResponse) and e.args[0] != 415:
+                raise
+
+            # Unsupported Media Type (or garbage to a server that doesn't
+            # look at Content-Encoding): only stop compressing if the
+            # uncompressed request works
+            self.compress = False
+            try:
+                result = super()._request(method, uri, data, **kwargs)
+            except Exception:
+                self.compress = True
+                raise
+            logger.info('%s does not accept compressed requests', uri)
+            return result
 
 
 # Database model classes
@@ -90,6 +147,9 @@ class SinceValue(object):
 class SubscribeAction(object):
     __slots__ = {'action_type': int, 'url': str}
 
+    # Removed by value (see minidb.Store)
+    INDEX = ('url',)
+
     # Possible values for the "action_type" field
     ADD, REMOVE = list(range(2))
 
@@ -233,60 +293,91 @@ class MygPoClient(object):
         self._store.remove(rewritten_urls)
         return rewritten_urls
 
-    def process_episode_actions(self, find_episode, on_updated=None):
+    def process_episode_actions(self, find_podcast, on_updated=None):
         """Process received episode actions.
 
-        The parameter "find_episode" should be a function accepting
-        two parameters (podcast_url and episode_url). It will be used
-        to get an episode object that needs to be updated. It should
-        return None if the requested episode does not exist.
+        The parameter "find_podcast" should be a function accepting
+        a podcast URL and returning the podcast object, or None if the
+        podcast does not exist. The episodes of the podcast will be
+        updated. The caller should commit the database afterwards.
 
         The optional callback "on_updated" should accept a single
         parameter (the episode object) and will be called whenever
         the episode data is changed in some way.
         """
         logger.debug('Processing received episode actions...')
+        started = time.time()
+
+        # Only the latest play and delete action of an episode matter,
+        # group them by podcast
+        latest = {}
+        received = 0
         for action in self._store.load(ReceivedEpisodeAction):
+            received += 1
             if action.action not in ('play', 'delete'):
                 # Ignore all other action types for now
                 continue
 
-            episode = find_episode(action.podcast_url, action.episode_url)
-
-            if episode is None:
-                # The episode does not exist on this client
+            key = (action.podcast_url, action.episode_url, action.action)
+            previous = latest.get(key)
+            if previous is not None:
+                if action.timestamp < previous.timestamp:
+                    previous, action = action, previous
+                if not action.total:
+                    action.total = previous.total
+            latest[key] = action
+
+        by_podcast = collections.defaultdict(list)
+        for action in latest.values():
+            by_podcast[action.podcast_url].append(action)
+
+        # Episodes to save (in order)
+        updated = {}
+        for podcast_url, actions in by_podcast.items():
+            podcast = find_podcast(podcast_url)
+            if podcast is None:
+                # The podcast does not exist on this client
                 continue
 
-            if action.action == 'play':
-                logger.debug('Play action for %s', episode.url)
-                episode.mark(is_played=True)
-
-                if (action.timestamp > episode.current_position_updated
-                        and action.position is not None):
-                    logger.debug('Updating position for %s', episode.url)
-                    episode.current_position = action.position
-                    episode.current_position_updated = action.timestamp
-
-                if action.total:
-                    logger.debug('Updating total time for %s', episode.url)
-                    episode.total_time = action.total
-
-                episode.save()
-                if on_updated is not None:
-                    on_updated(episode)
-            elif action.action == 'delete':
-                if not episode.was_downloaded(and_exists=True):
-                    # Set the episode to a "deleted" state
-                    logger.debug('Marking as deleted: %s', episode.url)
-                    episode.delete_from_disk()
-                    episode.save()
-                    if on_updated is not None:
-                        on_updated(episode)
+            episodes = {episode.url: episode for episode in podcast.get_all_episodes()}
+            for action in actions:
+                episode = episodes.get(action.episode_url)
+                if episode is None:
+                    # The episode does not exist on this client
+                    continue
+
+                if action.action == 'play':
+                    logger.debug('Play action for %s', episode.url)
+                    episode.mark(is_played=True)
+
+                    if (action.timestamp > episode.current_position_updated
+                            and action.position is not None):
+                        logger.debug('Updating position for %s', episode.url)
+                        episode.current_position = action.position
+                        episode.current_position_updated = action.timestamp
+
+                    if action.total:
+                        logger.debug('Updating total time for %s', episode.url)
+                        episode.total_time = action.total
+
+                    updated[episode] = True
+                elif action.action == 'delete':
+                    if not episode.was_downloaded(and_exists=True):
+                        # Set the episode to a "deleted" state
+                        logger.debug('Marking as deleted: %s', episode.url)
+                        episode.delete_from_disk()
+                        updated[episode] = True
+
+        for episode in updated:
+            episode.save()
+            if on_updated is not None:
+                on_updated(episode)
 
         # Remove all received episode actions
         self._store.delete(ReceivedEpisodeAction)
         self._store.commit()
-        logger.debug('Received episode actions processed.')
+        logger.info('Processed %d received episode actions (%d after merging) in %.2f seconds, %d episodes updated',
+                    received, len(latest), time.time() - started, len(updated))
 
     def get_received_actions(self):
         """Return a list of ReceivedSubscribeAction objects.
@@ -423,18 +514,15 @@ class MygPoClient(object):
                     else:
                         must_retry = True
 
-                # Upload podcast subscription actions
+                # Upload podcast subscription actions (uploaded actions
+                # are removed from the queue as they are uploaded)
                 actions = self._store.load(SubscribeAction)
-                if self.synchronize_subscriptions(actions):
-                    self._store.remove(actions)
-                else:
+                if not self.synchronize_subscriptions(actions):
                     must_retry = True
 
                 # Upload episode actions
                 actions = self._store.load(EpisodeAction)
-                if self.synchronize_episodes(actions):
-                    self._store.remove(actions)
-                else:
+                if not self.synchronize_episodes(actions):
                     must_retry = True
 
                 if not must_retry or not self.can_access_webservice():
@@ -464,15 +552,27 @@ class MygPoClient(object):
             logger.debug('Flush requested, already waiting.')
 
     def on_config_changed(self, name=None, old_value=None, new_value=None):
-        if name in ('mygpo.username', 'mygpo.password', 'mygpo.server') \
+        if name in ('mygpo.username', 'mygpo.password', 'mygpo.server', 'mygpo.upload.compress') \
                 or self._client is None:
             self._client = api.MygPodderClient(self._config.mygpo.username,
-                    self._config.mygpo.password, self._config.mygpo.server)
+                    self._config.mygpo.password, self._config.mygpo.server,
+                    client_class=self._create_http_client)
             logger.info('Reloading settings.')
         elif name.startswith('mygpo.device.'):
             # Update or create the device
             self.create_device()
 
+    def _create_http_client(self, username, password):
+        return CompressingJsonClient(username, password, self._config.mygpo.upload.compress)
+
+    @property
+    def chunk_size(self):
+        return max(1, self._config.mygpo.upload.chunk_size)
+
+    def _chunks(self, actions):
+        for lower in range(0, len(actions), self.chunk_size):
+            yield actions[lower:lower + self.chunk_size]
+
     def synchronize_episodes(self, actions):
         logger.debug('Starting episode status sync.')
 
@@ -522,19 +622,19 @@ class MygPoClient(object):
 
             # Step 2: Upload Episode actions
 
-            # Uploads are done in batches; uploading can resume if only parts
+            # Uploads are done in chunks; uploading can resume if only parts
             # be uploaded; avoids empty uploads as well
-            for lower in range(0, len(actions), EPISODE_ACTIONS_BATCH_SIZE):
-                batch = actions[lower:(lower + EPISODE_ACTIONS_BATCH_SIZE)]
-
+            for chunk in self._chunks(actions):
                 # Convert actions to the mygpoclient format for uploading
-                episode_actions = [convert_to_api(a) for a in batch]
+                episode_actions = [convert_to_api(a) for a in chunk]
 
                 # Upload the episode actions
                 self._client.upload_episode_actions(episode_actions)
 
-                # Actions have been uploaded to the server - remove them
-                self._store.remove(batch)
+                # Actions have been uploaded to the server - remove them,
+                # so they are not uploaded again if a later chunk fails
+                self._store.remove(chunk)
+                self._store.commit()
 
             logger.debug('Episode actions have been uploaded to the server.')
             return True
@@ -582,12 +682,12 @@ class MygPoClient(object):
             # Step 2: Push updates to the server and rewrite URLs (if any)
             actions = self._store.load(SubscribeAction)
 
-            add = [a.url for a in actions if a.is_add]
-            remove = [a.url for a in actions if a.is_remove]
+            # Only do push requests if something has changed
+            for chunk in self._chunks(actions):
+                add = [a.url for a in chunk if a.is_add]
+                remove = [a.url for a in chunk if a.is_remove]
 
-            if add or remove:
                 logger.debug('Uploading: +%d / -%d', len(add), len(remove))
-                # Only do a push request if something has changed
                 result = self._client.update_subscriptions(self.device_id, add, remove)
 
                 # Update the "since" value in the database
@@ -599,8 +699,10 @@ class MygPoClient(object):
                         logger.debug('Rewritten URL: %s', new_url)
                         self._store.save(RewrittenUrl(old_url, new_url))
 
-            # Actions have been uploaded to the server - remove them
-            self._store.remove(actions)
+                # Actions have been uploaded to the server - remove them
+                self._store.remove(chunk)
+                self._store.commit()
+
             logger.debug('All actions have been uploaded to the server.')
             return True
 
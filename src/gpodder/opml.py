@@ -38,8 +38,9 @@ import io
 import logging
 import os
 import os.path
-import xml.dom.minidom
 from email.utils import formatdate
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape, quoteattr
 
 import gpodder
 from gpodder import util
@@ -65,38 +66,52 @@ class Importer(object):
 
         Parses the feed into a local data structure containing channel metadata.
         """
-        self.items = []
+        self.items = list(self.iter_items(url))
+        if not len(self.items):
+            logger.info('OPML import finished, but no items found: %s', url)
+
+    @classmethod
+    def iter_items(cls, url):
+        """Parse an OPML feed from an URL incrementally, yielding channel dicts."""
         if os.path.exists(url):
-            doc = xml.dom.minidom.parse(url)
+            source = url
         else:
-            doc = xml.dom.minidom.parse(io.BytesIO(util.urlopen(url).content))
+            source = io.BytesIO(util.urlopen(url).content)
 
         section = None
-        for outline in doc.getElementsByTagName('outline'):
+        for event, outline in ElementTree.iterparse(source, events=('start', 'end')):
+            if outline.tag != 'outline' and not outline.tag.endswith('}outline'):
+                continue
+
+            if event == 'end':
+                # Outlines have been handled at the start tag, free memory
+                outline.clear()
+                continue
+
             # Make sure we are dealing with a valid link type (ignore case)
-            otl_type = outline.getAttribute('type')
-            if otl_type is None or otl_type.lower() not in self.VALID_TYPES:
-                otl_title = outline.getAttribute('title')
-                otl_text = outline.getAttribute('text')
+            otl_type = outline.get('type', '')
+            if otl_type.lower() not in cls.VALID_TYPES:
+                otl_title = outline.get('title', '')
+                otl_text = outline.get('text', '')
                 # gPodder sections will have name == text, if OPML accepts it type=section
-                if otl_title is not None and otl_title == otl_text:
+                if otl_title == otl_text:
                     section = otl_title
                 continue
 
-            if outline.getAttribute('xmlUrl') or outline.getAttribute('url'):
+            if outline.get('xmlUrl') or outline.get('url'):
                 channel = {
                     'url':
-                        outline.getAttribute('xmlUrl')
-                        or outline.getAttribute('url'),
+                        outline.get('xmlUrl')
+                        or outline.get('url'),
                     'title':
-                        outline.getAttribute('title')
-                        or outline.getAttribute('text')
-                        or outline.getAttribute('xmlUrl')
-                        or outline.getAttribute('url'),
+                        outline.get('title')
+                        or outline.get('text')
+                        or outline.get('xmlUrl')
+                        or outline.get('url'),
                     'description':
-                        outline.getAttribute('text')
-                        or outline.getAttribute('xmlUrl')
-                        or outline.getAttribute('url'),
+                        outline.get('text')
+                        or outline.get('xmlUrl')
+                        or outline.get('url'),
                     'section': section,
                 }
 
@@ -106,9 +121,7 @@ class Importer(object):
                 for attr in ('url', 'title', 'description'):
                     channel[attr] = channel[attr].strip()
 
-                self.items.append(channel)
-        if not len(self.items):
-            logger.info('OPML import finished, but no items found: %s', url)
+                yield channel
 
 
 class Exporter(object):
@@ -127,84 +140,65 @@ class Exporter(object):
         else:
             self.filename = '%s.opml' % (filename, )
 
-    def create_node(self, doc, name, content):
-        """Return an XML Element node with tag name "name" and text content "content".
-
-        E.g. <name>content</name>.
-        """
-        node = doc.createElement(name)
-        node.appendChild(doc.createTextNode(content))
-        return node
-
-    def create_outline(self, doc, channel):
-        """Return an OPML outline as XML Element node in the supplied document."""
-        outline = doc.createElement('outline')
-        outline.setAttribute('title', channel.title)
-        outline.setAttribute('text', channel.description)
-        outline.setAttribute('xmlUrl', channel.url)
-        outline.setAttribute('type', self.FEED_TYPE)
-        return outline
-
-    def create_section(self, doc, name):
-        """Create an empty OPML outline element used to divide sections."""
-        section = doc.createElement('outline')
-        section.setAttribute('title', name)
-        section.setAttribute('text', name)
-        return section
+    def write_outline(self, fp, channel):
+        """Write an OPML outline element for a channel."""
+        fp.write('            <outline title=%s text=%s xmlUrl=%s type=%s/>%s' % (
+            quoteattr(channel.title), quoteattr(channel.description),
+            quoteattr(channel.url), quoteattr(self.FEED_TYPE), os.linesep))
 
     def write(self, channels):
         """Write an XML document containing metadata for each channel in channels.
 
         OPML 2.0 specification: http://www.opml.org/spec2
 
+        The document is written directly to the file, without building
+        it in memory first.
+
         Returns True on success or False when there was an
         error writing the file.
         """
         if self.filename is None:
             return False
 
-        doc = xml.dom.minidom.Document()
-
-        opml = doc.createElement('opml')
-        opml.setAttribute('version', '2.0')
-        doc.appendChild(opml)
-
-        head = doc.createElement('head')
-        head.appendChild(self.create_node(doc, 'title', 'gPodder subscriptions'))
-        head.appendChild(self.create_node(doc, 'dateCreated', formatdate(localtime=True)))
-        opml.appendChild(head)
-
-        body = doc.createElement('body')
-
         sections = {}
         for channel in channels:
-            if channel.section not in sections.keys():
-                sections[channel.section] = self.create_section(doc, channel.section)
-            sections[channel.section].appendChild(self.create_outline(doc, channel))
-
-        for section in sections.values():
-            body.appendChild(section)
-
-        opml.appendChild(body)
+            sections.setdefault(channel.section, []).append(channel)
 
         try:
-            data = doc.toprettyxml(encoding='utf-8', indent='    ', newl=os.linesep)
             # We want to have at least 512 KiB free disk space after
             # saving the opml data, if this is not possible, don't
             # try to save the new file, but keep the old one so we
             # don't end up with a clobbed, empty opml file.
             FREE_DISK_SPACE_AFTER = 1024 * 512
+            # Estimated size of the document
+            size = sum(len(c.title) + len(c.description) + len(c.url) + 100
+                       for section in sections.values() for c in section)
             path = os.path.dirname(self.filename) or os.path.curdir
             available = util.get_free_disk_space(path)
-            if available != -1 and available < 2 * len(data) + FREE_DISK_SPACE_AFTER:
+            if available != -1 and available < 2 * size + FREE_DISK_SPACE_AFTER:
                 # On Windows, if we have zero bytes available, assume that we have
                 # not had the win32file module available + assume enough free space
                 if not gpodder.ui.win32 or available > 0:
                     logger.error('Not enough free disk space to save channel list to %s', self.filename)
                     return False
-            fp = open(self.filename + '.tmp', 'wb')
-            fp.write(data)
-            fp.close()
+
+            with open(self.filename + '.tmp', 'w', encoding='utf-8', newline='') as fp:
+                nl = os.linesep
+                fp.write('<?xml version="1.0" encoding="utf-8"?>' + nl)
+                fp.write('<opml version="2.0">' + nl)
+                fp.write('    <head>' + nl)
+                fp.write('        <title>%s</title>%s' % (escape('gPodder subscriptions'), nl))
+                fp.write('        <dateCreated>%s</dateCreated>%s' % (escape(formatdate(localtime=True)), nl))
+                fp.write('    </head>' + nl)
+                fp.write('    <body>' + nl)
+                for name, section in sections.items():
+                    # An outline used to divide sections
+                    fp.write('        <outline title=%s text=%s>%s' % (quoteattr(name), quoteattr(name), nl))
+                    for channel in section:
+                        self.write_outline(fp, channel)
+                    fp.write('        </outline>' + nl)
+                fp.write('    </body>' + nl)
+                fp.write('</opml>' + nl)
             util.atomic_rename(self.filename + '.tmp', self.filename)
         except:
             logger.error('Could not open file for writing: %s', self.filename,
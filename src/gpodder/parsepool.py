@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.parsepool - Parse large feeds in worker processes
+#
+#  podcastparser is pure Python, so parsing big back-catalog feeds in
+#  several update threads at once is limited by the GIL. With
+#  limit.parse.processes > 0, feeds of at least limit.parse.min_size KiB
+#  are sent (as bytes) to a pool of worker processes, which return the
+#  parsed feed as a plain dict.
+#
+#  Only the newest max_episodes episodes are kept while parsing, so the
+#  memory and time needed for huge feeds depend on max_episodes rather
+#  than on the number of items in the feed.
+#
+
+import concurrent.futures
+import heapq
+import io
+import logging
+import multiprocessing
+import threading
+from xml import sax
+
+import podcastparser
+
+import gpodder
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+
+def by_published(entry):
+    return entry['published']
+
+
+class BoundedPodcastHandler(podcastparser.PodcastHandler):
+    """A podcastparser handler that keeps the newest max_episodes episodes.
+
+    podcastparser only sorts the episodes once the channel has ended, and
+    its own max_episodes then keeps the first ones in that order (the
+    oldest ones for serial podcasts). Without a limit while parsing, all
+    episodes of a large feed are kept until then, so we prune to the
+    newest episodes here instead.
+    """
+
+    def __init__(self, url, max_episodes):
+        super().__init__(url, 0)
+        self.keep = max_episodes
+
+    def prune(self):
+        if self.keep and len(self.episodes) > self.keep:
+            # In place, self.data['episodes'] is the same list
+            self.episodes[:] = heapq.nlargest(self.keep, self.episodes, key=by_published)
+
+    def add_episode(self):
+        # The previous episode is complete, prune once in a while
+        if self.keep and len(self.episodes) >= 2 * self.keep:
+            self.prune()
+        super().add_episode()
+
+
+def parse(url, stream, max_episodes=0):
+    """Parse a feed like podcastparser.parse(), keeping the newest max_episodes episodes.
+
+    The episodes are not sorted. If max_episodes is 0, all episodes are kept.
+    """
+    handler = BoundedPodcastHandler(url, max_episodes)
+    try:
+        sax.parse(stream, handler)
+    except sax.SAXParseException as e:
+        raise podcastparser.FeedParseError(e.getMessage(), e.getException(), e._locator)
+    handler.prune()
+    return handler.data
+
+
+def _parse(url, data, max_episodes):
+    # Runs in the worker process
+    return parse(url, io.BytesIO(data), max_episodes)
+
+
+class ParserPool(object):
+    def __init__(self):
+        self._config = None
+        self._lock = threading.Lock()
+        self._executor = None
+        self._processes = 0
+
+    def configure(self, config):
+        self._config = config
+
+    @property
+    def processes(self):
+        if self._config is None:
+            return 0
+        return max(0, self._config.limit.parse.processes)
+
+    @property
+    def min_size(self):
+        if self._config is None:
+            return 0
+        return max(0, self._config.limit.parse.min_size) * 1024
+
+    def _get_executor(self):
+        with self._lock:
+            processes = self.processes
+            if self._executor is not None and self._processes != processes:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+            if self._executor is None and processes:
+                # Don't fork the (multi-threaded) UI process, start fresh interpreters
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    processes, mp_context=multiprocessing.get_context('spawn'))
+                self._processes = processes
+
+            return self._executor
+
+    def parse(self, url, stream, max_episodes=0):
+        """Parse the feed in stream, see parse().
+
+        Raises ValueError if the feed cannot be parsed.
+        """
+        if not self.processes:
+            return parse(url, stream, max_episodes)
+
+        data = stream.read()
+        executor = self._get_executor() if len(data) >= self.min_size else None
+        if executor is not None:
+            try:
+                return executor.submit(_parse, url, data, max_episodes).result()
+            except concurrent.futures.BrokenExecutor:
+                logger.warning('Feed parser process died, parsing %s in-thread', url, exc_info=True)
+                with self._lock:
+                    if self._executor is executor:
+                        self._executor = None
+
+        return parse(url, io.BytesIO(data), max_episodes)
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+pool = ParserPool()
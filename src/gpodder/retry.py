@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.retry - Persistent retry schedule for failed downloads and feeds
+#
+#  Failed episode downloads and feed updates are retried automatically,
+#  with a jittered exponential backoff, or after the delay requested by
+#  the server (Retry-After). The schedule is kept in the database, so it
+#  survives restarts. After too many failed attempts, the object is kept
+#  in the schedule without a next attempt, until it succeeds or the user
+#  retries it.
+#
+
+import email.utils
+import logging
+import random
+import time
+
+import gpodder
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+KIND_EPISODE = 'episode'
+KIND_PODCAST = 'podcast'
+
+
+def parse_retry_after(value, now=None):
+    """Parse a Retry-After header value (seconds or HTTP-date).
+
+    Returns the delay in seconds, or None if the value is invalid.
+    """
+    if not value:
+        return None
+
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+
+    if when is None:
+        return None
+
+    if now is None:
+        now = time.time()
+    return max(0, int(when.timestamp() - now))
+
+
+def backoff_delay(attempt, initial, maximum):
+    """Return the delay in seconds before retry number attempt (1-based).
+
+    The delay doubles with every attempt, up to maximum. Half of it is
+    randomized, so that clients failing at the same time don't all come
+    back at the same time.
+    """
+    delay = min(maximum, initial * 2 ** (max(1, attempt) - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+class RetrySchedule(object):
+    """Retry schedule of episodes (KIND_EPISODE) and podcasts (KIND_PODCAST)."""
+
+    def __init__(self, db, config):
+        self.db = db
+        self._config = config
+
+    @property
+    def enabled(self):
+        return self._config.auto.backoff.enabled
+
+    def failed(self, kind, object_id, error=None, retry_after=None):
+        """Schedule the next attempt after a failure.
+
+        retry_after is the delay requested by the server, if any. Returns
+        the time of the next attempt, or None if no retry is scheduled
+        (disabled, or too many failed attempts).
+
+        After too many failed attempts the object is not retried again
+        (see is_due()), until it succeeds or the schedule is reset().
+        """
+        if not self.enabled or object_id is None:
+            return None
+
+        attempts = (self.db.get_retry_attempts(kind, object_id) or 0) + 1
+        if attempts > self._config.auto.backoff.attempts:
+            logger.info('Giving up on %s %d after %d attempts', kind, object_id, attempts - 1)
+            self.db.save_retry(kind, object_id, attempts - 1, None, str(error) if error else None)
+            return None
+
+        backoff = self._config.auto.backoff
+        delay = backoff_delay(attempts, backoff.initial, backoff.maximum)
+        if retry_after is not None:
+            # The server knows best, but don't wait forever
+            delay = min(max(delay, retry_after), backoff.maximum)
+
+        next_attempt = int(time.time() + delay)
+        self.db.save_retry(kind, object_id, attempts, next_attempt, str(error) if error else None)
+        logger.info('Retrying %s %d in %d seconds (attempt %d)', kind, object_id, delay, attempts)
+        return next_attempt
+
+    def succeeded(self, kind, object_id):
+        """Forget the retry schedule of an object (e.g. after a successful attempt)."""
+        if object_id is not None:
+            self.db.delete_retry(kind, object_id)
+
+    def reset(self, kind, object_id):
+        """Forget the retry schedule of an object that the user retries.
+
+        Failed attempts are counted from the start again, and an object
+        that has been given up on is retried automatically again.
+        """
+        if object_id is not None:
+            self.db.delete_retry(kind, object_id)
+
+    def postpone(self, kind, object_id):
+        """Move a due retry back, without counting it as a failed attempt.
+
+        Used if the object is busy (e.g. its download is running) when
+        the retry is due.
+        """
+        if object_id is not None:
+            self.db.postpone_retry(kind, object_id, int(time.time() + self._config.auto.backoff.initial))
+
+    def is_due(self, kind, object_id, now=None):
+        """Return False if the object is waiting for a scheduled retry, or has been given up on."""
+        if not self.enabled or object_id is None:
+            return True
+
+        if self.db.get_retry_attempts(kind, object_id) is None:
+            return True
+
+        next_attempt = self.db.get_retry_time(kind, object_id)
+        if next_attempt is None:
+            # Too many failed attempts
+            return False
+
+        if now is None:
+            now = time.time()
+        return next_attempt <= now
+
+    def due(self, kind, now=None):
+        """Return the ids of all objects whose retry is due."""
+        if not self.enabled:
+            return []
+
+        if now is None:
+            now = time.time()
+        return self.db.get_due_retries(kind, now)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.schedule - Adaptive feed update schedule
+#
+#  Instead of fetching every feed on every automatic update, each podcast
+#  gets a next-check time. It is derived from the podcast's publish
+#  cadence and usual time of day, and stretched for feeds that are
+#  usually unchanged when we check them.
+#
+
+import collections
+import logging
+import time
+
+import gpodder
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+
+# Number of recent episodes used to determine the publish cadence
+HISTORY = 10
+
+# Weight of the latest check in the moving average of unchanged checks
+UNCHANGED_WEIGHT = 0.3
+
+
+def publish_hour(published):
+    """Return the most common (UTC) hour of day of the publish times."""
+    hours = collections.Counter(time.gmtime(p).tm_hour for p in published)
+    return hours.most_common(1)[0][0]
+
+
+def update_interval(published, unchanged, now, minimum, maximum):
+    """Return the number of seconds until a feed should be checked again.
+
+    published are the publish times of recent episodes (newest first),
+    unchanged is the ratio of recent checks that found nothing new.
+    """
+    intervals = sorted(a - b for a, b in zip(published, published[1:]) if a > b)
+    if not intervals:
+        # Not enough history
+        return minimum
+
+    cadence = intervals[len(intervals) // 2]
+    expected = published[0] + cadence
+    if cadence >= DAY - 4 * HOUR:
+        # Daily or less frequent: episodes usually appear at the same time of day
+        aligned = expected - expected % DAY + publish_hour(published) * HOUR
+        if aligned < expected - DAY / 2:
+            aligned += DAY
+        elif aligned > expected + DAY / 2:
+            aligned -= DAY
+        expected = aligned
+
+    slack = min(cadence / 8, 3 * HOUR)
+    if now < expected - slack:
+        # Not expecting a new episode yet, but publishers are not that regular
+        interval = min(expected - slack - now, cadence / 4)
+    elif now - expected > 3 * cadence:
+        # Long overdue: on hiatus or dead
+        interval = maximum
+    else:
+        interval = minimum
+
+    # Feeds that are usually unchanged can wait a bit longer
+    interval *= 1 + unchanged
+
+    return int(max(minimum, min(maximum, interval)))
+
+
+class UpdateSchedule(object):
+    """Next-check times of podcasts, for automatic feed updates."""
+
+    def __init__(self, db, config):
+        self.db = db
+        self._config = config
+
+    @property
+    def enabled(self):
+        return self._config.auto.update.adaptive
+
+    @property
+    def minimum(self):
+        return max(1, self._config.auto.update.frequency) * 60
+
+    @property
+    def maximum(self):
+        return max(self.minimum, self._config.auto.update.max_interval * HOUR)
+
+    def next_check(self, podcast):
+        """Return the time of the next scheduled check, or None."""
+        row = self.db.get_update_schedule(podcast.id)
+        return row[0] if row is not None else None
+
+    def is_due(self, podcast, now=None):
+        """Return True if the podcast should be checked in this update cycle."""
+        if not self.enabled or podcast.id is None:
+            return True
+
+        next_check = self.next_check(podcast)
+        if next_check is None:
+            return True
+
+        if now is None:
+            now = time.time()
+        # Updates run every "minimum" seconds: check feeds that would be due before the next run
+        return next_check - now < self.minimum / 2
+
+    def checked(self, podcast, new_episodes, now=None):
+        """Schedule the next check after a successful feed update."""
+        if podcast.id is None:
+            return
+
+        if now is None:
+            now = time.time()
+
+        row = self.db.get_update_schedule(podcast.id)
+        unchanged = row[1] if row is not None and row[1] is not None else 0.
+        unchanged += UNCHANGED_WEIGHT * ((0. if new_episodes else 1.) - unchanged)
+
+        interval = update_interval(self.db.get_publish_times(podcast.id, HISTORY + 1),
+                                   unchanged, now, self.minimum, self.maximum)
+        logger.debug('Next check of %s in %d minutes', podcast.url, interval // 60)
+        self.db.save_update_schedule(podcast.id, int(now + interval), unchanged)
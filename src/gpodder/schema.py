@@ -74,7 +74,7 @@ PodcastColumns = (
     'cover_thumb',
 )
 
-CURRENT_VERSION = 8
+CURRENT_VERSION = 14
 
 
 # SQL commands to upgrade old database versions to new ones
@@ -123,6 +123,41 @@ UPGRADE_SQL = [
         ALTER TABLE episode ADD COLUMN chapters TEXT NULL DEFAULT NULL
         UPDATE podcast SET http_last_modified=NULL, http_etag=NULL
         """),
+
+        # Version 9: Content hashes of downloaded enclosures for deduplication
+        (8, 9, """
+        CREATE TABLE enclosure (episode_id INTEGER PRIMARY KEY NOT NULL, file_size INTEGER, mtime INTEGER, content_hash TEXT NOT NULL)
+        CREATE INDEX idx_enclosure_content_hash ON enclosure (content_hash)
+        CREATE INDEX idx_episode_url ON episode (url)
+        """),
+
+        # Version 10: Persistent retry schedule of failed downloads and feed updates
+        (9, 10, """
+        CREATE TABLE retry (kind TEXT NOT NULL, object_id INTEGER NOT NULL, attempts INTEGER, next_attempt INTEGER, error TEXT)
+        CREATE UNIQUE INDEX idx_retry_object ON retry (kind, object_id)
+        """),
+
+        # Version 11: Adaptive feed update schedule
+        (10, 11, """
+        CREATE TABLE update_schedule (podcast_id INTEGER PRIMARY KEY NOT NULL, next_check INTEGER, unchanged REAL)
+        """),
+
+        # Version 12: Time spent in each phase of feed updates
+        (11, 12, """
+        CREATE TABLE update_timing (podcast_id INTEGER NOT NULL, phase TEXT NOT NULL, samples INTEGER, average REAL, last REAL, maximum REAL)
+        CREATE UNIQUE INDEX idx_update_timing_phase ON update_timing (podcast_id, phase)
+        """),
+
+        # Version 13: Validators and episodes of feed pages, for conditional requests
+        (12, 13, """
+        CREATE TABLE feed_page (podcast_id INTEGER, url TEXT, max_episodes INTEGER, etag TEXT, last_modified TEXT, next_url TEXT, guids TEXT)
+        CREATE UNIQUE INDEX idx_feed_page_url ON feed_page (podcast_id, url)
+        """),
+
+        # Version 14: Episode whose file a deduplicated enclosure was linked to
+        (13, 14, """
+        ALTER TABLE enclosure ADD COLUMN linked_to INTEGER NULL DEFAULT NULL
+        """),
 ]
 
 
@@ -195,11 +230,72 @@ def initialize_database(db):
     CREATE INDEX idx_episode_is_new ON episode (is_new)
     CREATE INDEX idx_episode_archive ON episode (archive)
     CREATE INDEX idx_episode_published ON episode (published)
+    CREATE INDEX idx_episode_url ON episode (url)
     """
 
     for sql in INDEX_SQL.strip().split('\n'):
         db.execute(sql)
 
+    # Create table for content hashes of downloaded enclosures
+    db.execute("""
+    CREATE TABLE enclosure (
+        episode_id INTEGER PRIMARY KEY NOT NULL,
+        file_size INTEGER,
+        mtime INTEGER,
+        content_hash TEXT NOT NULL,
+        linked_to INTEGER NULL DEFAULT NULL
+    )
+    """)
+    db.execute("CREATE INDEX idx_enclosure_content_hash ON enclosure (content_hash)")
+
+    # Create table for the retry schedule of failed downloads and feed updates
+    db.execute("""
+    CREATE TABLE retry (
+        kind TEXT NOT NULL,
+        object_id INTEGER NOT NULL,
+        attempts INTEGER,
+        next_attempt INTEGER,
+        error TEXT
+    )
+    """)
+    db.execute("CREATE UNIQUE INDEX idx_retry_object ON retry (kind, object_id)")
+
+    # Create table for the adaptive feed update schedule
+    db.execute("""
+    CREATE TABLE update_schedule (
+        podcast_id INTEGER PRIMARY KEY NOT NULL,
+        next_check INTEGER,
+        unchanged REAL
+    )
+    """)
+
+    # Create table for the time spent in each phase of feed updates
+    db.execute("""
+    CREATE TABLE update_timing (
+        podcast_id INTEGER NOT NULL,
+        phase TEXT NOT NULL,
+        samples INTEGER,
+        average REAL,
+        last REAL,
+        maximum REAL
+    )
+    """)
+    db.execute("CREATE UNIQUE INDEX idx_update_timing_phase ON update_timing (podcast_id, phase)")
+
+    # Create table for the pages of paged feeds, for conditional requests
+    db.execute("""
+    CREATE TABLE feed_page (
+        podcast_id INTEGER,
+        url TEXT,
+        max_episodes INTEGER,
+        etag TEXT,
+        last_modified TEXT,
+        next_url TEXT,
+        guids TEXT
+    )
+    """)
+    db.execute("CREATE UNIQUE INDEX idx_feed_page_url ON feed_page (podcast_id, url)")
+
     # Create table for version info / metadata + insert initial data
     db.execute("""CREATE TABLE version (version integer)""")
     db.execute("INSERT INTO version (version) VALUES (%d)" % CURRENT_VERSION)
@@ -23,13 +23,15 @@
 # based on libipodsync.py (2006-04-05 Thomas Perl)
 # Ported to gPodder 3 by Joseph Wickremasinghe in June 2012
 
+import collections
+import json
 import logging
 import os.path
 import threading
 import time
 
 import gpodder
-from gpodder import download, services, util
+from gpodder import download, services, tracklength, transcode, util
 
 import gi  # isort:skip
 gi.require_version('Gio', '2.0')  # isort:skip
@@ -74,7 +76,16 @@ def open_device(gui):
     return None
 
 
-def get_track_length(filename):
+# Length of tracks whose length cannot be determined (three hours, to be on the safe side)
+DEFAULT_TRACK_LENGTH = 60 * 60 * 1000 * 3
+
+
+def detect_track_length(filename):
+    """Return the length of a media file in milliseconds, or None if unknown."""
+    duration = tracklength.get_duration(filename)
+    if duration is not None:
+        return int(duration * 1000)
+
     attempted = False
 
     if mplayer_available:
@@ -101,8 +112,14 @@ def get_track_length(filename):
         logger.warning('Could not determine length: %s', filename)
         logger.warning('Please install MPlayer or the eyed3.mp3 module for track length detection.')
 
-    return int(60 * 60 * 1000 * 3)
-    # Default is three hours (to be on the safe side)
+    return None
+
+
+def get_track_length(filename):
+    length = detect_track_length(filename)
+    if length is None:
+        length = DEFAULT_TRACK_LENGTH
+    return length
 
 
 def episode_filename_on_device(config, episode):
@@ -120,8 +137,9 @@ def episode_filename_on_device(config, episode):
         config.device_sync.custom_sync_name,
         config.device_sync.use_title_as_filename),
         config.device_sync.max_filename_length)
-    # add the file extension
-    to_file = filename_base + os.path.splitext(from_file)[1].lower()
+    # add the file extension (of the transcoded file, if it gets transcoded)
+    to_file = filename_base + (transcode.target_extension(config, episode)
+                               or os.path.splitext(from_file)[1].lower())
 
     # dirty workaround: on bad (empty) episode titles,
     # we simply use the from_file basename
@@ -187,19 +205,81 @@ class SyncTrack(object):
         return str(self.playcount)
 
 
+class SyncPlan(object):
+    """What a sync will do, decided before anything is transferred.
+
+    See Device.plan_sync(). Episodes to copy are ordered by their folder
+    on the device, so that the transfers don't jump between folders.
+    """
+
+    def __init__(self):
+        self.copy = []  # episodes to transfer to the device
+        self.present = []  # episodes already on the device
+        self.skip = []  # (episode, reason) of episodes not to sync
+        self.delete = []  # tracks to remove from the device
+        self.sizes = {}  # episode id -> size of the local file
+        self._copy_ids = set()
+
+    def add_copy(self, episode, size):
+        self.copy.append(episode)
+        self.sizes[episode.id] = size
+        self._copy_ids.add(episode.id)
+
+    def will_copy(self, episode):
+        return episode.id in self._copy_ids
+
+    @property
+    def copy_bytes(self):
+        return sum(self.sizes[episode.id] for episode in self.copy)
+
+    @property
+    def delete_bytes(self):
+        return sum(track.length or 0 for track in self.delete)
+
+    def summary(self):
+        return _('Sync: copy %(copy)d episodes (%(copy_size)s), delete %(delete)d (%(delete_size)s), '
+                 '%(present)d already on device, %(skip)d skipped') % {
+            'copy': len(self.copy),
+            'copy_size': util.format_filesize(self.copy_bytes),
+            'delete': len(self.delete),
+            'delete_size': util.format_filesize(self.delete_bytes),
+            'present': len(self.present),
+            'skip': len(self.skip),
+        }
+
+
 class Device(services.ObservableService):
+    # Whether tracks that are already on the device get a sync task too
+    # (e.g. to copy the play status back)
+    sync_present_tracks = False
+
     def __init__(self, config):
         self._config = config
         self.cancelled = False
         self.allowed_types = ['audio', 'video']
         self.errors = []
         self.tracks_list = []
+        self.plan = None
         signals = ['progress', 'sub-progress', 'status', 'done', 'post-done']
         services.ObservableService.__init__(self, signals)
 
+    @property
+    def tracks_list(self):
+        return self._tracks_list
+
+    @tracks_list.setter
+    def tracks_list(self, tracks):
+        self._tracks_list = tracks
+        self._tracks_index = None
+
     def get_device_description(self):
         return 'unknown device'
 
+    @property
+    def copy_streams(self):
+        """Number of tracks that can be copied to the device at the same time."""
+        return 1
+
     def open(self):
         pass
 
@@ -224,22 +304,73 @@ class Device(services.ObservableService):
     def cleanup_task(self, task):
         pass
 
-    def add_sync_tasks(self, tracklist, force_played=False, done_callback=None):
-        for track in list(tracklist):
-            # Filter tracks that are not meant to be synchronized
-            does_not_exist = not track.was_downloaded(and_exists=True)
-            exclude_played = (not track.is_new
-                    and self._config.device_sync.skip_played_episodes)
-            wrong_type = track.file_type() not in self.allowed_types
-
-            if does_not_exist:
-                tracklist.remove(track)
-            elif exclude_played or wrong_type:
-                logger.info('Excluding %s from sync', track.title)
-                tracklist.remove(track)
-
-        if tracklist:
-            for track in sorted(tracklist, key=lambda e: e.pubdate_prop):
+    def _sync_order(self, episode):
+        return episode.published
+
+    def _needs_copy(self, episode, track, size):
+        """Return True if the track on the device must be replaced by the episode's file of size bytes."""
+        return False
+
+    def prepare_sync(self, plan):
+        """Prepare the files of a sync plan for copying, before the sync tasks run."""
+        pass
+
+    def plan_sync(self, episodes, deleted=(), force_played=False):
+        """Decide what to do with all episodes at once.
+
+        episodes are the candidates to copy to the device, their local
+        files are checked with a single stat. The tracks of episodes in
+        deleted are removed from the device. Played episodes are skipped
+        (if configured) unless force_played is True.
+        """
+        plan = SyncPlan()
+        for episode in deleted:
+            track = self.episode_on_device(episode)
+            if track is not None:
+                plan.delete.append(track)
+
+        for episode in sorted(episodes, key=self._sync_order):
+            size = None
+            if episode.state == gpodder.STATE_DOWNLOADED:
+                try:
+                    size = os.stat(episode.local_filename(create=False)).st_size
+                except (TypeError, OSError):
+                    pass
+
+            if size is None:
+                plan.skip.append((episode, _('not downloaded')))
+            elif not episode.is_new and self._config.device_sync.skip_played_episodes and not force_played:
+                logger.info('Excluding %s from sync', episode.title)
+                plan.skip.append((episode, _('played')))
+            elif episode.file_type() not in self.allowed_types:
+                logger.info('Excluding %s from sync', episode.title)
+                plan.skip.append((episode, _('unsupported file type')))
+            else:
+                track = self.episode_on_device(episode)
+                if track is None or self._needs_copy(episode, track, size):
+                    plan.add_copy(episode, size)
+                else:
+                    plan.present.append(episode)
+
+        logger.info(plan.summary())
+        self.notify('status', plan.summary())
+        return plan
+
+    def add_sync_tasks(self, tracklist, force_played=False, done_callback=None, plan=None):
+        if plan is None:
+            plan = self.plan_sync(tracklist, force_played=force_played)
+        self.plan = plan
+        self.prepare_sync(plan)
+
+        tracks = plan.copy
+        if self.sync_present_tracks:
+            tracks = sorted(plan.copy + plan.present, key=self._sync_order)
+
+        # Episodes can be deleted locally after the plan has been made
+        tracks = [track for track in tracks if track.state != gpodder.STATE_DELETED]
+
+        if tracks:
+            for track in tracks:
                 if self.cancelled:
                     break
 
@@ -273,15 +404,21 @@ class Device(services.ObservableService):
     def episode_on_device(self, episode):
         return self._track_on_device(episode.title)
 
-    def _track_on_device(self, track_name):
-        for t in self.tracks_list:
-            title = t.title
-            if track_name == title:
-                return t
-        return None
+    def _track_key(self, track):
+        return track.title
+
+    def _track_on_device(self, key):
+        # Build the index on first use, not for every episode
+        if self._tracks_index is None:
+            self._tracks_index = {}
+            for track in self.tracks_list:
+                self._tracks_index.setdefault(self._track_key(track), track)
+        return self._tracks_index.get(key)
 
 
 class iPodDevice(Device):
+    sync_present_tracks = True
+
     def __init__(self, config,
             download_status_model,
             download_queue_manager):
@@ -326,10 +463,20 @@ class iPodDevice(Device):
 
         return True
 
+    def _commit(self, force=False):
+        """Write the iPod database if enough changes have accumulated (or if force is True)."""
+        interval = self._config.device_sync.ipod_commit_interval
+        if not force and (interval <= 0 or self.ipod.changes < interval):
+            return
+
+        self.notify('status', _('Saving iPod database'))
+        if not self.ipod.commit():
+            logger.error('Could not write iPod database on %s', self.mountpoint)
+
     def close(self):
         if self.ipod is not None:
-            self.notify('status', _('Saving iPod database'))
-            self.ipod.close()
+            self._commit(force=True)
+            self.ipod.close(write=False)
             self.ipod = None
 
         Device.close(self)
@@ -355,30 +502,30 @@ class iPodDevice(Device):
             tracks.append(t)
         return tracks
 
+    def _track_key(self, track):
+        return (track.ipod_track.podcast_rss, track.ipod_track.podcast_url)
+
     def episode_on_device(self, episode):
-        return next((track for track in self.tracks_list
-                     if track.ipod_track.podcast_rss == episode.channel.url
-                     and track.ipod_track.podcast_url == episode.url), None)
+        return self._track_on_device((episode.channel.url, episode.url))
 
     def remove_track(self, track):
         self.notify('status', _('Removing %s') % track.title)
         logger.info('Removing track from iPod: %r', track.title)
         track.ipod_track.remove_from_device()
         try:
-            self.tracks_list.remove(next((sync_track for sync_track in self.tracks_list
-                                          if sync_track.ipod_track == track), None))
+            self.tracks_list.remove(track)
+            self._tracks_index = None
         except ValueError:
             ...
+        self._commit()
 
     def add_track(self, task, reporthook=None):
         episode = task.episode
         self.notify('status', _('Adding %s') % episode.title)
-        tracklist = self.ipod.get_podcast_tracks()
-        episode_urls = [track.podcast_url for track in tracklist]
-
-        if episode.url in episode_urls:
+        track = self.ipod.find_track(episode.url)
+        if track is not None:
             # Mark as played on iPod if played locally (and set podcast flags)
-            self.update_from_episode(tracklist[episode_urls.index(episode.url)], episode)
+            self.update_from_episode(track, episode)
             return True
 
         local_filename = episode.local_filename(create=False)
@@ -400,11 +547,23 @@ class iPodDevice(Device):
             logger.error('Cannot copy .ogg files to iPod.')
             return False
 
+        if episode.total_time > 0:
+            length = episode.total_time * 1000
+        else:
+            length = detect_track_length(local_filename)
+            if length is not None:
+                # Remember it for the next sync
+                episode.total_time = length // 1000
+                episode.save()
+            else:
+                length = DEFAULT_TRACK_LENGTH
+
         track = self.ipod.add_track(local_filename, episode.title, episode.channel.title,
                 episode._text_description, episode.url, episode.channel.url,
-                episode.published, get_track_length(local_filename), episode.file_type() == 'audio')
+                episode.published, length, episode.file_type() == 'audio')
 
         self.update_from_episode(track, episode, initial=True)
+        self._commit()
 
         reporthook(episode.file_size, 1, episode.file_size)
 
@@ -428,7 +587,64 @@ class iPodDevice(Device):
             episode.save()
 
 
+class DeviceManifest(object):
+    """Cached listing of the track files on a device, per folder.
+
+    The files of a folder are only listed again when the modification
+    time of the folder has changed, so files must be replaced by renaming
+    (writing to an existing file doesn't change the folder). Folders that changed shortly before
+    they were listed are listed again (e.g. FAT only has a resolution of
+    two seconds).
+    """
+    VERSION = 1
+    RACY_SECONDS = 2
+
+    def __init__(self, folders=None):
+        # folder name -> {'mtime': ..., 'listed': ..., 'files': [[name, size, mtime], ...]}
+        self.folders = folders or {}
+        self.changed = False
+
+    def get(self, folder, mtime):
+        """Return the cached files of folder, or None if they must be listed."""
+        entry = self.folders.get(folder)
+        if entry is None or mtime is None or entry['mtime'] != mtime:
+            return None
+
+        if entry['listed'] - mtime <= self.RACY_SECONDS:
+            return None
+
+        return entry['files']
+
+    def put(self, folder, mtime, files):
+        if mtime is None:
+            self.folders.pop(folder, None)
+        else:
+            self.folders[folder] = {'mtime': mtime, 'listed': int(time.time()), 'files': files}
+        self.changed = True
+
+    def retain(self, folders):
+        """Forget the folders that are no longer on the device."""
+        for folder in set(self.folders) - set(folders):
+            del self.folders[folder]
+            self.changed = True
+
+    def to_json(self):
+        return json.dumps({'version': self.VERSION, 'folders': self.folders})
+
+    @classmethod
+    def from_json(cls, data):
+        data = json.loads(data)
+        if data.get('version') != cls.VERSION:
+            return cls()
+        return cls(data['folders'])
+
+
 class MP3PlayerDevice(Device):
+    # The manifest is kept in a folder of its own, so that writing it
+    # doesn't change the modification time of the device's root folder
+    MANIFEST_FOLDER = '.gpodder'
+    MANIFEST_FILE = 'manifest.json'
+
     def __init__(self, config,
             download_status_model,
             download_queue_manager,
@@ -440,6 +656,88 @@ class MP3PlayerDevice(Device):
         self.mount_volume_for_file = mount_volume_for_file
         self.download_status_model = download_status_model
         self.download_queue_manager = download_queue_manager
+        self._transcoder = None
+        # (filename, profile) of planned transcodes that have not been started yet
+        self._transcode_queue = collections.deque()
+        # filename -> (cache key, estimated size) of transcodes waiting to be copied
+        self._prefetched = {}
+        self._transcode_lock = threading.Lock()
+
+    @property
+    def transcoder(self):
+        if self._transcoder is None:
+            cache = transcode.TranscodeCache(transcode.cache_folder(),
+                    self._config.device_sync.transcode.cache_size * 1024 * 1024)
+            self._transcoder = transcode.Transcoder(cache)
+        return self._transcoder
+
+    def _transcode_profile(self, episode):
+        """Return the transcoding profile for the episode, or None to copy it as it is."""
+        if transcode.target_extension(self._config, episode) is None:
+            return None
+        return self._config.device_sync.transcode.profile
+
+    def prepare_sync(self, plan):
+        # Start transcoding, so the files are ready when their tasks run
+        with self._transcode_lock:
+            for episode in plan.copy:
+                profile = self._transcode_profile(episode)
+                if profile is not None:
+                    self._transcode_queue.append((episode.local_filename(create=False), profile))
+        self._prefetch_transcodes()
+
+    def _prefetch_transcodes(self):
+        """Start the next planned transcodes, as many as fit in the cache.
+
+        Their outputs stay in the cache until they have been copied, so
+        starting too many at once would exceed the cache size.
+        """
+        with self._transcode_lock:
+            budget = self.transcoder.cache.max_size
+            used = sum(size for key, size in self._prefetched.values())
+            while self._transcode_queue:
+                filename, profile = self._transcode_queue[0]
+                try:
+                    # The size of the source, as an estimate of the output
+                    size = os.path.getsize(filename)
+                except OSError:
+                    self._transcode_queue.popleft()
+                    continue
+
+                if self._prefetched and used + size > budget:
+                    break
+
+                self._transcode_queue.popleft()
+                self._prefetched[filename] = (self.transcoder.prefetch(filename, profile), size)
+                used += size
+
+    def _release_transcode(self, episode):
+        """Let the cache evict the transcoded file of episode, after it has been copied."""
+        filename = episode.local_filename(create=False)
+        with self._transcode_lock:
+            prefetched = self._prefetched.pop(filename, None)
+            if prefetched is None:
+                # Copied before its turn, or not transcoded at all
+                for item in [item for item in self._transcode_queue if item[0] == filename]:
+                    self._transcode_queue.remove(item)
+                return
+            self.transcoder.release(prefetched[0])
+        self._prefetch_transcodes()
+
+    def close(self):
+        with self._transcode_lock:
+            self._transcode_queue.clear()
+            self._prefetched.clear()
+        if self._transcoder is not None:
+            self._transcoder.shutdown()
+            self._transcoder = None
+        return Device.close(self)
+
+    @property
+    def copy_streams(self):
+        if self.destination.is_native():
+            return self._config.device_sync.copy_streams.local
+        return self._config.device_sync.copy_streams.gio
 
     def get_free_space(self):
         info = self.destination.query_filesystem_info(Gio.FILE_ATTRIBUTE_FILESYSTEM_FREE, None)
@@ -494,6 +792,20 @@ class MP3PlayerDevice(Device):
     def get_episode_file_on_device(self, episode):
         return episode_filename_on_device(self._config, episode)
 
+    def _sync_order(self, episode):
+        return (episode_foldername_on_device(self._config, episode) or '', episode.published)
+
+    def _needs_copy(self, episode, track, size):
+        profile = self._transcode_profile(episode)
+        if profile is not None:
+            size = self.transcoder.cached_size(episode.local_filename(create=False), profile)
+            if size is None:
+                # Not transcoded (anymore), cannot compare
+                return False
+
+        # An interrupted sync leaves a partial file (see add_track)
+        return self._config.device_sync.compare_episode_filesize and track.length != size
+
     def create_task(self, track):
         return GioSyncTask(track)
 
@@ -509,6 +821,13 @@ class MP3PlayerDevice(Device):
         self.remove_track_file(file)
 
     def add_track(self, task, reporthook=None):
+        try:
+            return self._add_track(task, reporthook)
+        finally:
+            # Make room for the next transcodes
+            self._release_transcode(task.episode)
+
+    def _add_track(self, task, reporthook):
         episode = task.episode
         self.notify('status', _('Adding %s') % episode.title)
 
@@ -521,6 +840,13 @@ class MP3PlayerDevice(Device):
         assert filename is not None
 
         from_file = filename
+        profile = self._transcode_profile(episode)
+        if profile is not None:
+            self.notify('status', _('Transcoding %s') % episode.title)
+            try:
+                from_file = self.transcoder.transcode(filename, profile)
+            except transcode.TranscodeError as e:
+                raise SyncFailedException(str(e))
 
         # verify free space
         needed = util.calculate_size(from_file)
@@ -538,9 +864,13 @@ class MP3PlayerDevice(Device):
 
         util.make_directory(folder)
 
-        to_file_exists = to_file.query_exists()
-        from_size = episode.file_size
-        to_size = episode.file_size
+        from_size = episode.file_size if profile is None else needed
+        to_size = from_size
+        if self.plan is not None and self.plan.will_copy(episode):
+            # The sync plan has already compared it with the file on the device
+            to_file_exists = False
+        else:
+            to_file_exists = to_file.query_exists()
         # An interrupted sync results in a partial file on the device that must be removed to fully sync it.
         # Comparing file size would detect such files and finish uploading.
         # However, some devices add metadata to files, increasing their size, and forcing an upload on every sync.
@@ -556,6 +886,24 @@ class MP3PlayerDevice(Device):
             logger.info('Copying %s (%d bytes) => %s (%d bytes)',
                     os.path.basename(from_file), from_size,
                     to_file.get_uri(), to_size)
+            if to_file.is_native():
+                # Local file system: copy in the kernel. Overwriting a file in
+                # place doesn't change the modification time of its folder, so
+                # copy to a temporary file and rename it (see DeviceManifest).
+                temp_path = to_file.get_path() + '.partial'
+                try:
+                    if not util.copy_local_file(from_file, temp_path, reporthook, task.cancellable.is_cancelled):
+                        util.delete_file(temp_path)
+                        raise SyncCancelledException()
+                    util.atomic_rename(temp_path, to_file.get_path())
+                except OSError as err:
+                    util.delete_file(temp_path)
+                    logger.error('Error copying %s to %s: %s', from_file, to_file.get_path(), err)
+                    d = {'from_file': from_file, 'to_file': to_file.get_path(), 'message': err.strerror or str(err)}
+                    self.errors.append(_('Error copying %(from_file)s to %(to_file)s: %(message)s') % d)
+                    return False
+                return True
+
             from_file = Gio.File.new_for_path(from_file)
             try:
                 def hookconvert(current_bytes, total_bytes, user_data):
@@ -571,42 +919,101 @@ class MP3PlayerDevice(Device):
 
         return True
 
-    def add_sync_track(self, tracks, file, info, podcast_name):
-        (title, extension) = os.path.splitext(info.get_name())
-        timestamp = info.get_modification_time()
-        modified = util.format_date(timestamp.tv_sec)
+    def add_sync_track(self, tracks, file, name, size, mtime, podcast_name):
+        (title, extension) = os.path.splitext(name)
+        modified = util.format_date(mtime)
 
-        t = SyncTrack(title, info.get_size(), modified,
+        t = SyncTrack(title, size, modified,
                 filename=file.get_uri(),
                 podcast=podcast_name)
         tracks.append(t)
 
+    def _load_manifest(self):
+        file = self.destination.get_child(self.MANIFEST_FOLDER).get_child(self.MANIFEST_FILE)
+        try:
+            success, contents, etag = file.load_contents(None)
+            return DeviceManifest.from_json(contents.decode('utf-8'))
+        except GLib.Error as err:
+            if not err.matches(Gio.io_error_quark(), Gio.IOErrorEnum.NOT_FOUND):
+                logger.warning('Cannot read %s: %s', file.get_uri(), err.message)
+        except (ValueError, KeyError):
+            logger.warning('Ignoring invalid %s', file.get_uri(), exc_info=True)
+        return DeviceManifest()
+
+    def _save_manifest(self, manifest):
+        folder = self.destination.get_child(self.MANIFEST_FOLDER)
+        file = folder.get_child(self.MANIFEST_FILE)
+        try:
+            if util.make_directory(folder):
+                file.replace_contents(manifest.to_json().encode('utf-8'), None, False,
+                                      Gio.FileCreateFlags.REPLACE_DESTINATION, None)
+        except GLib.Error as err:
+            logger.warning('Cannot write %s: %s', file.get_uri(), err.message)
+
+    @staticmethod
+    def _modification_time(info):
+        if not info.has_attribute(Gio.FILE_ATTRIBUTE_TIME_MODIFIED):
+            return None
+        return info.get_attribute_uint64(Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+
+    def _list_folder(self, manifest, name, folder, mtime):
+        """Return [name, size, mtime] of the files in folder, from the manifest if unchanged."""
+        files = manifest.get(name, mtime)
+        if files is not None:
+            return files
+
+        attributes = (
+            Gio.FILE_ATTRIBUTE_STANDARD_NAME + ","
+            + Gio.FILE_ATTRIBUTE_STANDARD_TYPE + ","
+            + Gio.FILE_ATTRIBUTE_STANDARD_SIZE + ","
+            + Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
+
+        files = []
+        for info in folder.enumerate_children(attributes, Gio.FileQueryInfoFlags.NONE, None):
+            if info.get_file_type() == Gio.FileType.REGULAR:
+                files.append([info.get_name(), info.get_size(), self._modification_time(info) or 0])
+
+        manifest.put(name, mtime, files)
+        return files
+
     def get_all_tracks(self):
         tracks = []
+        # Only local file systems reliably update the modification time of a
+        # folder when its files change (MTP and other GVfs backends may not)
+        use_manifest = self.destination.is_native()
+        manifest = self._load_manifest() if use_manifest else DeviceManifest()
 
         attributes = (
             Gio.FILE_ATTRIBUTE_STANDARD_NAME + ","
             + Gio.FILE_ATTRIBUTE_STANDARD_TYPE + ","
-            + Gio.FILE_ATTRIBUTE_STANDARD_SIZE + ","
             + Gio.FILE_ATTRIBUTE_TIME_MODIFIED)
 
         root_path = self.destination
-        for path_info in root_path.enumerate_children(attributes, Gio.FileQueryInfoFlags.NONE, None):
-            if self._config.device_sync.one_folder_per_podcast:
-                if path_info.get_file_type() == Gio.FileType.DIRECTORY:
-                    path_file = root_path.get_child(path_info.get_name())
+        if self._config.device_sync.one_folder_per_podcast:
+            folders = []
+            for path_info in root_path.enumerate_children(attributes, Gio.FileQueryInfoFlags.NONE, None):
+                name = path_info.get_name()
+                if path_info.get_file_type() == Gio.FileType.DIRECTORY and name != self.MANIFEST_FOLDER:
+                    path_file = root_path.get_child(name)
                     try:
-                        for child_info in path_file.enumerate_children(attributes, Gio.FileQueryInfoFlags.NONE, None):
-                            if child_info.get_file_type() == Gio.FileType.REGULAR:
-                                child_file = path_file.get_child(child_info.get_name())
-                                self.add_sync_track(tracks, child_file, child_info, path_info.get_name())
+                        files = self._list_folder(manifest, name, path_file, self._modification_time(path_info))
                     except GLib.Error as err:
                         logger.error('get all tracks for %s failed: %s', path_file.get_uri(), err.message)
+                        continue
+
+                    folders.append(name)
+                    for child_name, size, mtime in files:
+                        self.add_sync_track(tracks, path_file.get_child(child_name), child_name, size, mtime, name)
+        else:
+            folders = ['']
+            root_info = root_path.query_info(Gio.FILE_ATTRIBUTE_TIME_MODIFIED, Gio.FileQueryInfoFlags.NONE, None)
+            for name, size, mtime in self._list_folder(manifest, '', root_path, self._modification_time(root_info)):
+                self.add_sync_track(tracks, root_path.get_child(name), name, size, mtime, None)
+
+        manifest.retain(folders)
+        if use_manifest and manifest.changed:
+            self._save_manifest(manifest)
 
-            else:
-                if path_info.get_file_type() == Gio.FileType.REGULAR:
-                    path_file = root_path.get_child(path_info.get_name())
-                    self.add_sync_track(tracks, path_file, path_info, None)
         return tracks
 
     def episode_on_device(self, episode):
@@ -124,31 +124,9 @@ class gPodderSyncUI(object):
             force_played = False
             episodes = self._filter_sync_episodes(channels)
 
-        def check_free_space():
-            # "Will we add this episode to the device?"
-            def will_add(episode):
-                # If already on-device, it won't take up any space
-                if device.episode_on_device(episode):
-                    return False
-
-                # Might not be synced if it's played already
-                if (not force_played
-                        and self._config.device_sync.skip_played_episodes):
-                    return False
-
-                # In all other cases, we expect the episode to be
-                # synchronized to the device, so "answer" positive
-                return True
-
-            # "What is the file size of this episode?"
-            def file_size(episode):
-                filename = episode.local_filename(create=False)
-                if filename is None:
-                    return 0
-                return util.calculate_size(str(filename))
-
+        def check_free_space(plan):
             # Calculate total size of sync and free space on device
-            total_size = sum(file_size(e) for e in episodes if will_add(e))
+            total_size = plan.copy_bytes
             free_space = max(device.get_free_space(), 0)
 
             if total_size > free_space:
@@ -229,7 +207,7 @@ class gPodderSyncUI(object):
                 @util.run_in_background
                 def sync_thread_func():
                     device.add_sync_tasks(episodes, force_played=force_played,
-                                          done_callback=done_callback)
+                                          done_callback=done_callback, plan=plan)
                     util.idle_add(add_downloads_complete)
                 return
 
@@ -314,30 +292,27 @@ class gPodderSyncUI(object):
                 logger.info('Not creating playlists - starting sync')
                 resume_sync([], [], None)
 
-        # This function is used to remove files from the device
+        # This function plans the sync and removes files from the device
         def cleanup_episodes():
+            deleted = []
             # 'skip_played_episodes' must be used or else all the
             # played tracks will be copied then immediately deleted
             if (self._config.device_sync.delete_deleted_episodes
                 or (self._config.device_sync.delete_played_episodes
                     and self._config.device_sync.skip_played_episodes)):
-                all_episodes = self._filter_sync_episodes(
-                    channels, only_downloaded=False)
-                for local_episode in all_episodes:
-                    episode = device.episode_on_device(local_episode)
-                    if episode is None:
-                        continue
-
-                    if local_episode.state == gpodder.STATE_DELETED:
-                        logger.info('Removing episode from device: %s',
-                                    episode.title)
-                        device.remove_track(episode)
+                deleted = [episode for episode in self._filter_sync_episodes(channels, only_downloaded=False)
+                           if episode.state == gpodder.STATE_DELETED]
+
+            plan = device.plan_sync(episodes, deleted, force_played)
+            for track in plan.delete:
+                logger.info('Removing episode from device: %s', track.title)
+                device.remove_track(track)
 
             # When this is done, start the callback in the UI code
-            util.idle_add(check_free_space)
+            util.idle_add(check_free_space, plan)
 
         # This will run the following chain of actions:
-        #  1. Remove old episodes (in worker thread)
+        #  1. Plan the sync and remove old episodes (in worker thread)
         #  2. Check for free space (in UI thread)
         #  3. Sync the device (in UI thread)
         util.run_in_background(cleanup_episodes)
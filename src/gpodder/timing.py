@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.timing - Where does the time of a feed update go?
+#
+#  Code that takes time during a feed update is wrapped in spans:
+#
+#      with timing.span('parse'):
+#          ...
+#
+#  Spans only measure something inside timing.collect() (see
+#  PodcastChannel.update), in the same thread. Time spent in nested spans
+#  is only counted for the innermost span, so the phases of an update
+#  add up to its total time.
+#
+
+import collections
+import contextlib
+import threading
+import time
+
+_local = threading.local()
+
+
+class PhaseTimer(object):
+    def __init__(self):
+        self.phases = collections.defaultdict(float)
+        self._stack = []
+        self._mark = None
+
+    def _account(self):
+        now = time.perf_counter()
+        if self._stack:
+            self.phases[self._stack[-1]] += now - self._mark
+        self._mark = now
+
+    @contextlib.contextmanager
+    def span(self, phase):
+        self._account()
+        self._stack.append(phase)
+        try:
+            yield
+        finally:
+            self._account()
+            self._stack.pop()
+
+    def move(self, from_phase, to_phase, seconds):
+        """Attribute seconds already recorded in from_phase to to_phase."""
+        seconds = min(seconds, self.phases[from_phase])
+        self.phases[from_phase] -= seconds
+        self.phases[to_phase] += seconds
+
+    @property
+    def total(self):
+        return sum(self.phases.values())
+
+
+def current():
+    """Return the PhaseTimer collecting in this thread, or None."""
+    return getattr(_local, 'timer', None)
+
+
+@contextlib.contextmanager
+def collect(phase='other'):
+    """Collect the spans of this thread in a PhaseTimer.
+
+    Time not spent in any other span is recorded as phase. If this thread
+    is already collecting, the spans go to the existing PhaseTimer.
+    """
+    timer = current()
+    if timer is not None:
+        with timer.span(phase):
+            yield timer
+        return
+
+    timer = _local.timer = PhaseTimer()
+    try:
+        with timer.span(phase):
+            yield timer
+    finally:
+        _local.timer = None
+
+
+@contextlib.contextmanager
+def span(phase):
+    """Record the time spent in this block as phase, if collecting."""
+    timer = current()
+    if timer is None:
+        yield
+        return
+
+    with timer.span(phase):
+        yield
+
+
+def move(from_phase, to_phase, seconds):
+    timer = current()
+    if timer is not None:
+        timer.move(from_phase, to_phase, seconds)
+
+
+def update_stats(db, podcasts):
+    """Return the recorded update timings of podcasts, slowest first.
+
+    Each item is a dict with the podcast's url and title, and the phases
+    of its updates (phase -> dict of samples, average, last and maximum
+    seconds). The "total" phase is the whole update.
+    """
+    by_id = {podcast.id: podcast for podcast in podcasts}
+    stats = {}
+    for podcast_id, phase, samples, average, last, maximum in db.get_update_timing():
+        podcast = by_id.get(podcast_id)
+        if podcast is None:
+            continue
+
+        if podcast_id not in stats:
+            stats[podcast_id] = {'url': podcast.url, 'title': podcast.title, 'phases': {}}
+        stats[podcast_id]['phases'][phase] = {
+            'samples': samples,
+            'average': average,
+            'last': last,
+            'maximum': maximum,
+        }
+
+    return sorted(stats.values(), key=lambda s: s['phases'].get('total', {}).get('average', 0), reverse=True)
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.tracklength - Duration of media files from their headers
+#
+#  Reads the duration of MP3 (Xing/Info, VBRI or constant bitrate),
+#  MP4/M4A (mvhd) and Ogg Vorbis/Opus (last granule position) files,
+#  without decoding them or running external programs.
+#
+
+import logging
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+# How much of a file is searched for the first MP3 frame or the last Ogg page
+SEARCH_SIZE = 64 * 1024
+
+MP3_BITRATES = {
+    # (MPEG-1?, layer): kbit/s by bitrate index
+    (True, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+MP3_SAMPLE_RATES = {
+    # version bits: Hz by sample rate index
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000),  # MPEG-2.5
+}
+
+
+def _mp3_frame(header):
+    """Return (mpeg1, layer, bitrate, sample_rate, mono) of an MP3 frame header, or None."""
+    b0, b1, b2, b3 = header
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version = (b1 >> 3) & 3
+    layer = 4 - ((b1 >> 1) & 3)
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version == 3
+    return (mpeg1, layer, MP3_BITRATES[mpeg1, layer][bitrate_index] * 1000,
+            MP3_SAMPLE_RATES[version][sample_rate_index], b3 >> 6 == 3)
+
+
+def mp3_duration(fp, size):
+    header = fp.read(10)
+    start = 0
+    if header[:3] == b'ID3' and len(header) == 10:
+        # Skip the ID3v2 tag (size is a synchsafe integer, plus footer)
+        start = 10 + ((header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9])
+        if header[5] & 0x10:
+            start += 10
+
+    fp.seek(start)
+    data = fp.read(SEARCH_SIZE)
+    offset = data.find(b'\xff')
+    while 0 <= offset <= len(data) - 4:
+        frame = _mp3_frame(data[offset:offset + 4])
+        if frame is not None:
+            break
+        offset = data.find(b'\xff', offset + 1)
+    else:
+        return None
+
+    mpeg1, layer, bitrate, sample_rate, mono = frame
+    if layer == 1:
+        samples_per_frame = 384
+    elif layer == 2 or mpeg1:
+        samples_per_frame = 1152
+    else:
+        samples_per_frame = 576
+
+    # Variable bitrate files have the number of frames in their first frame
+    side_info = (17 if mono else 32) if mpeg1 else (9 if mono else 17)
+    xing = offset + 4 + side_info
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags, = struct.unpack('>I', data[xing + 4:xing + 8])
+        if flags & 1:
+            frames, = struct.unpack('>I', data[xing + 8:xing + 12])
+            return frames * samples_per_frame / sample_rate
+
+    vbri = offset + 36
+    if data[vbri:vbri + 4] == b'VBRI':
+        frames, = struct.unpack('>I', data[vbri + 14:vbri + 18])
+        return frames * samples_per_frame / sample_rate
+
+    # Constant bitrate
+    audio_size = size - start - offset
+    fp.seek(max(0, size - 128))
+    if fp.read(3) == b'TAG':
+        audio_size -= 128
+    return audio_size * 8 / bitrate
+
+
+def mp4_duration(fp, size):
+    def boxes(start, end):
+        position = start
+        while position + 8 <= end:
+            fp.seek(position)
+            box_size, box_type = struct.unpack('>I4s', fp.read(8))
+            header_size = 8
+            if box_size == 1:
+                box_size, = struct.unpack('>Q', fp.read(8))
+                header_size = 16
+            elif box_size == 0:
+                box_size = end - position
+            if box_size < header_size:
+                return
+            yield box_type, position + header_size, position + box_size
+            position += box_size
+
+    for box_type, start, end in boxes(0, size):
+        if box_type != b'moov':
+            continue
+
+        for child_type, child_start, child_end in boxes(start, end):
+            if child_type != b'mvhd':
+                continue
+
+            fp.seek(child_start)
+            data = fp.read(32)
+            if data[0] == 1:
+                timescale, duration = struct.unpack('>IQ', data[20:32])
+            else:
+                timescale, duration = struct.unpack('>II', data[12:20])
+            if not timescale:
+                return None
+            return duration / timescale
+
+    return None
+
+
+def ogg_duration(fp, size):
+    # The first page has the stream's identification header
+    first = fp.read(128)
+    serial, = struct.unpack('<I', first[14:18])
+    packet = first[27 + first[26]:]
+    if packet.startswith(b'\x01vorbis'):
+        sample_rate, = struct.unpack('<I', packet[12:16])
+        pre_skip = 0
+    elif packet.startswith(b'OpusHead'):
+        # Opus granule positions always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip, = struct.unpack('<H', packet[10:12])
+    else:
+        return None
+
+    # The last page of the stream has the total number of samples
+    fp.seek(max(0, size - SEARCH_SIZE))
+    data = fp.read()
+    offset = data.rfind(b'OggS')
+    while offset >= 0:
+        page = data[offset:offset + 18]
+        if len(page) == 18:
+            granule, page_serial = struct.unpack('<qI', page[6:18])
+            if page_serial == serial and granule >= 0:
+                return max(0, granule - pre_skip) / sample_rate
+        offset = data.rfind(b'OggS', 0, offset)
+
+    return None
+
+
+def get_duration(filename):
+    """Return the duration of a media file in seconds, or None if unknown."""
+    try:
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as fp:
+            magic = fp.read(12)
+            fp.seek(0)
+            if magic[:4] == b'OggS':
+                duration = ogg_duration(fp, size)
+            elif magic[4:8] == b'ftyp':
+                duration = mp4_duration(fp, size)
+            elif magic[:3] == b'ID3' or filename.lower().endswith(('.mp3', '.mp2')):
+                duration = mp3_duration(fp, size)
+            else:
+                return None
+    except (OSError, struct.error, IndexError):
+        logger.debug('Cannot read duration of %s', filename, exc_info=True)
+        return None
+
+    if duration is not None and duration <= 0:
+        return None
+    return duration
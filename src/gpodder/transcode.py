@@ -0,0 +1,322 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2018 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+
+
+#
+#  gpodder.transcode - Transcoding episodes for devices, with a cache
+#
+#  Episodes are transcoded when they are synced, by one ffmpeg process
+#  per CPU core. The outputs are cached by the hash of the source file
+#  and the profile, so syncing to another device (or again after a
+#  device has been wiped) doesn't transcode them again. The least
+#  recently used outputs are evicted to keep the cache within its size.
+#
+
+import concurrent.futures
+import functools
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import threading
+import time
+
+import gpodder
+from gpodder import util
+
+logger = logging.getLogger(__name__)
+
+_ = gpodder.gettext
+
+# Profile name -> (extension, ffmpeg output options)
+PROFILES = {
+    'mp3': ('.mp3', ['-vn', '-codec:a', 'libmp3lame', '-q:a', '2', '-id3v2_version', '3', '-write_id3v1', '1']),
+    'ogg': ('.ogg', ['-vn', '-codec:a', 'libvorbis', '-q:a', '4']),
+    'opus': ('.opus', ['-vn', '-codec:a', 'libopus', '-b:a', '64k']),
+}
+
+
+class TranscodeError(Exception):
+    pass
+
+
+@functools.lru_cache(maxsize=None)
+def find_command():
+    command = util.find_command('ffmpeg') or util.find_command('avconv')
+    if command is None:
+        logger.warning('Cannot transcode for devices: ffmpeg not found')
+    return command
+
+
+def target_extension(config, episode):
+    """Return the extension of the episode on devices, if it gets transcoded, else None."""
+    settings = config.device_sync.transcode
+    if not settings.enabled or settings.profile not in PROFILES:
+        return None
+
+    extension = PROFILES[settings.profile][0]
+    if episode.file_type() != 'audio' or episode.extension().lower() == extension:
+        return None
+
+    if find_command() is None:
+        return None
+
+    return extension
+
+
+def file_hash(filename):
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as fp:
+        for chunk in iter(lambda: fp.read(1024 * 1024), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class TranscodeCache(object):
+    """Content-addressed cache of transcoded files, within a size budget."""
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, folder, max_size):
+        self.folder = folder
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        # source filename -> [size, mtime, hash], to hash unchanged files only once
+        self._sources = {}
+        # cache key -> {'filename': ..., 'size': ..., 'used': ...}
+        self._entries = {}
+        # True if there are changes that have not been saved yet
+        self._dirty = False
+        # keys of outputs that are waiting to be copied, these are never evicted
+        self._pinned = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.folder, self.INDEX_FILE), 'r') as fp:
+                data = json.load(fp)
+            self._sources = data['sources']
+            self._entries = data['entries']
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError):
+            logger.warning('Ignoring invalid transcode cache index in %s', self.folder, exc_info=True)
+
+    def _save(self):
+        filename = os.path.join(self.folder, self.INDEX_FILE)
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(filename + '.tmp', 'w') as fp:
+                json.dump({'sources': self._sources, 'entries': self._entries}, fp)
+            util.atomic_rename(filename + '.tmp', filename)
+            self._dirty = False
+        except OSError:
+            logger.warning('Cannot save transcode cache index %s', filename, exc_info=True)
+
+    def flush(self):
+        """Save the index, if source files have been hashed since it was saved."""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def source_hash(self, filename):
+        st = os.stat(filename)
+        with self._lock:
+            known = self._sources.get(filename)
+            if known is not None and known[:2] == [st.st_size, st.st_mtime]:
+                return known[2]
+
+        digest = file_hash(filename)
+        with self._lock:
+            self._sources[filename] = [st.st_size, st.st_mtime, digest]
+            self._dirty = True
+        return digest
+
+    def key(self, filename, profile):
+        extension, options = PROFILES[profile]
+        return hashlib.sha1(json.dumps([self.source_hash(filename), profile, options]).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Return the cached file for key (marking it as used), or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            filename = os.path.join(self.folder, entry['filename'])
+            if not os.path.exists(filename):
+                del self._entries[key]
+                return None
+
+            entry['used'] = time.time()
+            return filename
+
+    def size(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['size'] if entry is not None else None
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+
+    def add(self, key, temp_filename, extension):
+        """Move a transcoded file into the cache, and return its filename."""
+        name = key + extension
+        filename = os.path.join(self.folder, name)
+        with self._lock:
+            util.atomic_rename(temp_filename, filename)
+            self._entries[key] = {'filename': name, 'size': os.path.getsize(filename), 'used': time.time()}
+            self._evict(keep=key)
+            self._save()
+        return filename
+
+    def _evict(self, keep):
+        total = sum(entry['size'] for entry in self._entries.values())
+        for key, entry in sorted(self._entries.items(), key=lambda item: item[1]['used']):
+            if total <= self.max_size:
+                break
+            if key == keep or key in self._pinned:
+                continue
+
+            logger.debug('Evicting %s from the transcode cache', entry['filename'])
+            try:
+                os.remove(os.path.join(self.folder, entry['filename']))
+            except FileNotFoundError:
+                pass
+            total -= entry['size']
+            del self._entries[key]
+
+        # Forget the hashes of sources that are gone
+        for source in [s for s in self._sources if not os.path.exists(s)]:
+            del self._sources[source]
+
+
+class Transcoder(object):
+    """Transcodes files with a pool of ffmpeg processes, one per CPU core."""
+
+    def __init__(self, cache, command=None, workers=None):
+        self.cache = cache
+        self.command = command or find_command()
+        self._executor = concurrent.futures.ThreadPoolExecutor(workers or os.cpu_count() or 1)
+        self._lock = threading.RLock()
+        self._pending = {}
+        # Running ffmpeg processes, stopped by shutdown()
+        self._processes = set()
+        self._closed = False
+
+    def cached_size(self, filename, profile):
+        """Return the size of the transcoded file, if it is in the cache."""
+        return self.cache.size(self.cache.key(filename, profile))
+
+    def submit(self, filename, profile):
+        """Start transcoding filename (if needed); returns a Future of the transcoded filename."""
+        key = self.cache.key(filename, profile)
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(self._transcode, key, filename, profile)
+                self._pending[key] = future
+                future.add_done_callback(lambda f: self._done(key))
+            return future
+
+    def prefetch(self, filename, profile):
+        """Start transcoding filename, and keep the output in the cache until release(key).
+
+        Returns the cache key.
+        """
+        key = self.cache.key(filename, profile)
+        self.cache.pin(key)
+        self.submit(filename, profile)
+        return key
+
+    def release(self, key):
+        self.cache.unpin(key)
+
+    def _done(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+
+    def transcode(self, filename, profile):
+        """Return the filename of the transcoded file, transcoding it if needed."""
+        return self.submit(filename, profile).result()
+
+    def _transcode(self, key, filename, profile):
+        cached = self.cache.get(key)
+        if cached is not None:
+            logger.info('Using cached transcode of %s', filename)
+            return cached
+
+        extension, options = PROFILES[profile]
+        os.makedirs(self.cache.folder, exist_ok=True)
+        temp_filename = os.path.join(self.cache.folder, key + '.partial' + extension)
+        # One thread per process, there is one process per core
+        cmd = [self.command, '-nostdin', '-y', '-loglevel', 'error', '-i', filename, '-threads', '1'] + options + [temp_filename]
+
+        logger.info('Transcoding %s to %s', filename, profile)
+        started = time.time()
+        with self._lock:
+            if self._closed:
+                raise TranscodeError(_('Transcoding has been cancelled'))
+
+            if gpodder.ui.win32:
+                # Redirection doesn't work with close_fds on Windows (see util.Popen)
+                process = util.Popen(cmd)
+            else:
+                process = util.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self._processes.add(process)
+
+        try:
+            if gpodder.ui.win32:
+                process.wait()
+                stderr = b'<unavailable>'
+            else:
+                stdout, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+        if process.returncode != 0:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise TranscodeError(_('Cannot transcode %(filename)s: %(error)s') % {
+                'filename': os.path.basename(filename),
+                'error': stderr.decode('utf-8', 'replace').strip()})
+
+        logger.debug('Transcoded %s in %.1f seconds', filename, time.time() - started)
+        return self.cache.add(key, temp_filename, extension)
+
+    def shutdown(self):
+        """Cancel the transcodes that have not started yet, and stop the running ones."""
+        with self._lock:
+            self._closed = True
+            for future in list(self._pending.values()):
+                future.cancel()
+            for process in self._processes:
+                process.terminate()
+        self._executor.shutdown(wait=False)
+        self.cache.flush()
+
+
+def cache_folder():
+    return os.path.join(gpodder.home, 'Transcoded')
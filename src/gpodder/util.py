@@ -29,9 +29,11 @@ This module provides helper and utility functions for gPodder that
 are not tied to any specific part of gPodder.
 
 """
+import bisect
 import collections
 import datetime
 import email
+import errno
 import glob
 import http.client
 import itertools
@@ -60,6 +62,7 @@ from html.parser import HTMLParser
 
 import requests
 import requests.exceptions
+from requests.packages.urllib3.exceptions import MaxRetryError, ResponseError
 from requests.packages.urllib3.util.retry import Retry
 
 import gpodder
@@ -1229,9 +1232,36 @@ def url_add_authentication(url, username, password):
     return urllib.parse.urlunsplit(url_parts)
 
 
+class RetryStrategy(Retry):
+    """Retry strategy that doesn't block a thread for a long Retry-After.
+
+    If the server asks to come back later than MAX_RETRY_AFTER seconds,
+    the response is returned as is (raise_on_status=False), so that the
+    caller can schedule a retry (see gpodder.retry).
+    """
+    MAX_RETRY_AFTER = 30
+    DEFAULT_STATUS_FORCELIST = Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,))
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('status_forcelist', self.DEFAULT_STATUS_FORCELIST)
+        kwargs.setdefault('raise_on_status', False)
+        super().__init__(**kwargs)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and self.respect_retry_after_header:
+            try:
+                retry_after = self.get_retry_after(response)
+            except Exception:
+                retry_after = None
+            if retry_after is not None and retry_after > self.MAX_RETRY_AFTER:
+                raise MaxRetryError(_pool, url, ResponseError('Retry-After: %d seconds' % retry_after))
+
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+
 def urlopen(url, headers=None, data=None, timeout=None, **kwargs):
     """Open an URL with the User-agent set to gPodder (with version)."""
-    from gpodder import config
+    from gpodder import config, hosthealth, timing
     if headers is None:
         headers = {}
     else:
@@ -1240,9 +1270,7 @@ def urlopen(url, headers=None, data=None, timeout=None, **kwargs):
     if not timeout:
         timeout = gpodder.SOCKET_TIMEOUT
 
-    retry_strategy = Retry(
-        total=3,
-        status_forcelist=Retry.RETRY_AFTER_STATUS_CODES.union((408, 418, 504, 598, 599,)))
+    retry_strategy = RetryStrategy(total=3)
     s = requests.Session()
     a = requests.adapters.HTTPAdapter(max_retries=retry_strategy)
     s.mount('http://', a)
@@ -1250,7 +1278,13 @@ def urlopen(url, headers=None, data=None, timeout=None, **kwargs):
     headers.update({'User-agent': gpodder.user_agent})
     proxies = config._proxies
     logger.debug(f"urlopen: url: {url}, proxies: {proxies}")
-    return s.get(url, headers=headers, data=data, proxies=proxies, timeout=timeout, **kwargs)
+    with timing.span('queue'), hosthealth.hosts.request(url) as request:
+        with timing.span('transfer'):
+            response = s.get(url, headers=headers, data=data, proxies=proxies, timeout=timeout, **kwargs)
+        # Time until the response headers arrived (DNS, connect, TLS, server)
+        timing.move('transfer', 'request', response.elapsed.total_seconds())
+        request.response(response.status_code)
+    return response
 
 
 def get_real_url(url):
@@ -1370,6 +1404,39 @@ def lerp(a, b, f):
     return ((1.0 - f) * a) + (f * b)
 
 
+def moved_indices(sequence):
+    """Return the indices of sequence that are not in its longest increasing subsequence.
+
+    These are the fewest items that have to be moved to sort sequence.
+
+    >>> sorted(moved_indices([0, 1, 2, 3]))
+    []
+    >>> sorted(moved_indices([3, 0, 1, 2]))
+    [0]
+    >>> sorted(moved_indices([1, 2, 3, 0]))
+    [3]
+    """
+    tails = []  # smallest last value of increasing subsequences, by length
+    tail_indices = []
+    previous = [None] * len(sequence)
+    for index, value in enumerate(sequence):
+        length = bisect.bisect_left(tails, value)
+        if length == len(tails):
+            tails.append(value)
+            tail_indices.append(index)
+        else:
+            tails[length] = value
+            tail_indices[length] = index
+        previous[index] = tail_indices[length - 1] if length > 0 else None
+
+    moved = set(range(len(sequence)))
+    index = tail_indices[-1] if tail_indices else None
+    while index is not None:
+        moved.discard(index)
+        index = previous[index]
+    return moved
+
+
 def bluetooth_available():
     """Return True or False depending on the availability of bluetooth functionality on the system."""
     if find_command('bluetooth-sendto') or \
@@ -1893,6 +1960,50 @@ def atomic_rename(old_name, new_name):
         os.rename(old_name, new_name)
 
 
+def copy_local_file(from_path, to_path, reporthook=None, cancelled=None):
+    """Copy a file between local paths, in the kernel where possible.
+
+    Uses copy_file_range() (which can clone blocks on the same file
+    system), else sendfile() on Linux, else read() and write(). reporthook
+    is called with (bytes copied, 1, total bytes) after each chunk. If
+    cancelled() returns True, the copy stops and False is returned.
+    """
+    chunk_size = 8 * 1024 * 1024
+    total = os.path.getsize(from_path)
+    with open(from_path, 'rb') as src, open(to_path, 'wb') as dst:
+        copied = 0
+        methods = []
+        if hasattr(os, 'copy_file_range'):
+            methods.append(lambda count: os.copy_file_range(src.fileno(), dst.fileno(), count))
+        # Elsewhere (e.g. macOS), sendfile() only writes to sockets
+        if hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            methods.append(lambda count: os.sendfile(dst.fileno(), src.fileno(), None, count))
+        methods.append(lambda count: dst.write(src.read(count)))
+
+        while copied < total:
+            try:
+                count = methods[0](min(chunk_size, total - copied))
+            except OSError as e:
+                if len(methods) == 1 or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                                        errno.EOPNOTSUPP, errno.EBADF, errno.ENOTSOCK):
+                    raise
+                # Not supported for these files, try the next method
+                logger.debug('Falling back from copy method: %s', e)
+                methods.pop(0)
+                continue
+
+            if not count:
+                break
+            copied += count
+
+            if reporthook is not None:
+                reporthook(copied, 1, total)
+            if cancelled is not None and cancelled():
+                return False
+
+    return True
+
+
 def check_command(self, cmd):
     """Check if a command line command/program exists."""
     # Prior to Python 2.7.3, this module (shlex) did not support Unicode input.
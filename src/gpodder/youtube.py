@@ -20,10 +20,14 @@
 #  Justin Forest <justin.forest@gmail.com> 2008-10-13
 #
 
+import collections
 import io
 import json
 import logging
+import os
 import re
+import threading
+import time
 import urllib
 import xml.etree.ElementTree
 from functools import lru_cache
@@ -262,6 +266,140 @@ def get_total_time(episode):
         return 0
 
 
+class DurationLookups(object):
+    """Background queue for looking up the duration of YouTube episodes.
+
+    Feeds don't contain the duration, and looking it up needs a watch page
+    (and sometimes a consent page) per video, so it is not done while
+    updating the feed. Videos without a duration (live streams, failed
+    lookups) are not looked up again for NEGATIVE_TTL seconds.
+    """
+    MAX_WORKERS = 2
+    NEGATIVE_TTL = 24 * 60 * 60
+    # Results are saved and reported in batches of this many episodes
+    BATCH_SIZE = 20
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._queue = collections.OrderedDict()
+        self._negative = {}
+        self._workers = 0
+        # Called with the list of episodes whose duration has been found
+        self.callbacks = []
+
+    def enqueue(self, episode):
+        """Look up the duration of episode in the background."""
+        vid = get_youtube_id(episode.url)
+        if vid is None:
+            return
+
+        with self._lock:
+            if self._negative.get(vid, 0) > time.time():
+                return
+
+            self._queue[vid] = episode
+            if self._workers < self.MAX_WORKERS:
+                self._workers += 1
+                util.run_in_background(self._worker, daemon=True)
+
+    def _worker(self):
+        found = []
+        done = False
+        try:
+            while True:
+                with self._lock:
+                    if self._queue and len(found) < self.BATCH_SIZE:
+                        vid, episode = self._queue.popitem(last=False)
+                    else:
+                        vid, episode = None, None
+
+                if episode is None:
+                    # Batch complete or queue empty: publish the results before
+                    # wait() can return, and exit only if nothing has been queued
+                    self._found(found)
+                    found = []
+                    with self._lock:
+                        if not self._queue:
+                            self._workers -= 1
+                            self._lock.notify_all()
+                            done = True
+                            return
+                    continue
+
+                try:
+                    total_time = get_total_time(episode)
+                    if total_time > 0:
+                        episode.total_time = total_time
+                        episode.save()
+                        found.append(episode)
+                    else:
+                        with self._lock:
+                            self._negative[vid] = time.time() + self.NEGATIVE_TTL
+                except Exception:
+                    logger.error('Cannot save the duration of %s', episode.url, exc_info=True)
+        finally:
+            if not done:
+                # Don't leave wait() hanging
+                with self._lock:
+                    self._workers -= 1
+                    self._lock.notify_all()
+
+    def _found(self, episodes):
+        if not episodes:
+            return
+
+        try:
+            episodes[0].db.commit()
+        except Exception:
+            logger.error('Cannot save durations of YouTube episodes', exc_info=True)
+            return
+
+        logger.debug('Found duration of %d YouTube episodes', len(episodes))
+        for callback in self.callbacks:
+            try:
+                callback(episodes)
+            except Exception:
+                logger.error('Error in duration lookup callback', exc_info=True)
+
+    def wait(self, timeout=None):
+        """Wait until the queue is empty. Return False on timeout."""
+        with self._lock:
+            return self._lock.wait_for(lambda: not self._workers, timeout)
+
+    def load(self, filename):
+        try:
+            with open(filename, 'r') as fp:
+                negative = json.load(fp)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError):
+            logger.warning('Cannot load YouTube lookup cache from %s', filename, exc_info=True)
+            return
+
+        now = time.time()
+        with self._lock:
+            self._negative.update((vid, expires) for vid, expires in negative.items() if expires > now)
+
+    def save(self, filename):
+        now = time.time()
+        with self._lock:
+            negative = {vid: expires for vid, expires in self._negative.items() if expires > now}
+
+        try:
+            with open(filename + '.tmp', 'w') as fp:
+                json.dump(negative, fp)
+            util.atomic_rename(filename + '.tmp', filename)
+        except OSError:
+            logger.warning('Cannot save YouTube lookup cache to %s', filename, exc_info=True)
+
+
+duration_lookups = DurationLookups()
+
+
+def duration_lookups_file():
+    return os.path.join(gpodder.home, 'YouTubeLookups.json')
+
+
 def get_real_download_url(url, allow_partial, preferred_fmt_ids=None):
     if not preferred_fmt_ids:
         preferred_fmt_ids, _, _ = formats_dict[22]  # MP4 720p
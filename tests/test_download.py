@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+
+import gpodder
+from gpodder import util
+from gpodder.download import DiskSpaceAdmission, DownloadTask, DownloadURLOpener, ResumeInfo
+from gpodder.jsonconfig import JsonConfig
+
+CONTENT = b'0123456789' * 100
+ETAG = '"v1"'
+
+
+class MyChannel:
+    auth_username = ''
+    auth_password = ''
+
+
+def write_partial(tmp_path, data, etag=ETAG):
+    tempname = str(tmp_path / 'episode.mp3.partial')
+    with open(tempname, 'wb') as fp:
+        fp.write(data)
+    ResumeInfo('http://example.com', etag, None, len(CONTENT)).save(tempname)
+    return tempname
+
+
+def read(filename):
+    with open(filename, 'rb') as fp:
+        return fp.read()
+
+
+def test_resume_sends_if_range(httpserver, tmp_path):
+    tempname = write_partial(tmp_path, CONTENT[:300])
+    httpserver.expect_request('/ep', headers={'Range': 'bytes=300-', 'If-Range': ETAG}).respond_with_data(
+        CONTENT[300:], status=206, headers={'Content-Range': 'bytes 300-999/1000', 'ETag': ETAG})
+    DownloadURLOpener(MyChannel()).retrieve_resume(httpserver.url_for('/ep'), tempname)
+    assert read(tempname) == CONTENT
+    assert not os.path.exists(ResumeInfo.filename_for(tempname))
+
+
+def test_resume_if_range_mismatch_restarts(httpserver, tmp_path):
+    tempname = write_partial(tmp_path, b'x' * 300, etag='"old"')
+    # If-Range did not match, the server sends the whole (new) file
+    httpserver.expect_request('/ep').respond_with_data(CONTENT, status=200, headers={'ETag': ETAG})
+    DownloadURLOpener(MyChannel()).retrieve_resume(httpserver.url_for('/ep'), tempname)
+    assert read(tempname) == CONTENT
+
+
+def test_resume_overlapping_range_seeks(httpserver, tmp_path):
+    tempname = write_partial(tmp_path, CONTENT[:300])
+    httpserver.expect_request('/ep').respond_with_data(
+        CONTENT[200:], status=206, headers={'Content-Range': 'bytes 200-999/1000', 'ETag': ETAG})
+    DownloadURLOpener(MyChannel()).retrieve_resume(httpserver.url_for('/ep'), tempname)
+    assert read(tempname) == CONTENT
+
+
+def test_resume_changed_file_without_if_range_support(httpserver, tmp_path):
+    tempname = write_partial(tmp_path, b'x' * 300, etag='"old"')
+    # The server ignores If-Range, but the entity tag shows the file has changed
+    httpserver.expect_ordered_request('/ep', headers={'Range': 'bytes=300-'}).respond_with_data(
+        CONTENT[300:], status=206, headers={'Content-Range': 'bytes 300-999/1000', 'ETag': ETAG})
+    httpserver.expect_ordered_request('/ep').respond_with_data(CONTENT, status=200, headers={'ETag': ETAG})
+    DownloadURLOpener(MyChannel()).retrieve_resume(httpserver.url_for('/ep'), tempname)
+    assert read(tempname) == CONTENT
+
+
+def test_resume_info_weak_etag():
+    assert ResumeInfo(etag='W/"v1"', last_modified='Mon').if_range() == 'Mon'
+    assert ResumeInfo(etag='"v1"', last_modified='Mon').if_range() == '"v1"'
+
+
+class MyTask:
+    def __init__(self, total_size, progress=0.0, activity=DownloadTask.ACTIVITY_DOWNLOAD):
+        self.total_size = total_size
+        self.progress = progress
+        self.activity = activity
+
+
+def test_disk_space_admission(monkeypatch, tmp_path):
+    MiB = 1024 * 1024
+    monkeypatch.setattr(gpodder, 'downloads', str(tmp_path))
+    monkeypatch.setattr(util, 'get_free_disk_space', lambda path: 1000 * MiB)
+    config = JsonConfig(default={'limit': {'free_space': {'enabled': True, 'reserve': 100, 'cleanup': False}}})
+    admission = DiskSpaceAdmission(config)
+
+    running = MyTask(600 * MiB, progress=0.5)
+    admission.start(running)
+    assert admission.bytes_in_flight() == 300 * MiB
+    assert admission.admit(MyTask(600 * MiB)) is True
+    assert admission.admit(MyTask(601 * MiB)) is False
+    # unknown size: only the reserve and bytes in flight count
+    assert admission.admit(MyTask(0)) is True
+    # sync tasks don't write to the download disk
+    syncing = MyTask(2000 * MiB, activity=DownloadTask.ACTIVITY_SYNCHRONIZE)
+    assert admission.admit(syncing) is True
+    admission.start(syncing)
+    assert admission.bytes_in_flight() == 300 * MiB
+    assert admission.running_count(DownloadTask.ACTIVITY_SYNCHRONIZE) == 1
+    admission.finish(syncing)
+
+    admission.finish(running)
+    assert admission.admit(MyTask(900 * MiB)) is True
+
+    config.limit.free_space.enabled = False
+    assert admission.admit(MyTask(2000 * MiB)) is True
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import pytest
+
+gi = pytest.importorskip('gi')
+gi.require_version('Gtk', '3.0')
+
+from gi.repository import Gtk  # isort:skip
+
+from gpodder.gtkui.model import EpisodeListModel  # isort:skip
+
+
+class MyEpisode:
+    def __init__(self, id, published):
+        self.id = id
+        self.url = 'https://example.com/%d.mp3' % id
+        self.published = published
+
+
+class MyChannel:
+    def __init__(self, episodes):
+        self.episodes = episodes
+
+    def get_all_episodes(self):
+        return self.episodes
+
+
+def make_model(episodes):
+    model = EpisodeListModel()
+    model.set_sort_column_id(EpisodeListModel.C_PUBLISHED, Gtk.SortType.ASCENDING)
+    channel = MyChannel(episodes)
+    model.replace_from_channel(channel)
+    events = []
+    model.connect('row-inserted', lambda model, path, iterator: events.append(('inserted', path.get_indices()[0])))
+    model.connect('row-deleted', lambda model, path: events.append(('deleted', path.get_indices()[0])))
+    return model, channel, events
+
+
+def test_update_episodes():
+    a, b, c = MyEpisode(1, 100), MyEpisode(2, 200), MyEpisode(3, 300)
+    model, channel, events = make_model([a, b, c])
+    assert model._rows == [a, b, c]
+
+    b.published = 400
+    model.update_episodes([b])
+    assert model._rows == [a, c, b]
+    assert events == [('deleted', 1), ('inserted', 2)]
+
+    # Unchanged sort keys don't move rows
+    del events[:]
+    model.update_by_urls([a.url])
+    assert model._rows == [a, c, b]
+    assert events == []
+
+
+def test_update_rows():
+    a, b, c = MyEpisode(1, 100), MyEpisode(2, 200), MyEpisode(3, 300)
+    model, channel, events = make_model([a, b, c])
+
+    # Only removed and added episodes change rows
+    d = MyEpisode(4, 0)
+    channel.episodes = [a, c, d]
+    model.replace_from_channel(channel)
+    assert model._rows == [d, a, c]
+    assert events == [('deleted', 1), ('inserted', 0)]
+
+    # A moved episode is deleted and inserted again, the others stay
+    del events[:]
+    a.published = 500
+    model.replace_from_channel(channel)
+    assert model._rows == [d, c, a]
+    assert events == [('deleted', 1), ('inserted', 2)]
+
+    # An episode loaded again keeps its row
+    del events[:]
+    c2 = MyEpisode(3, 300)
+    channel.episodes = [a, c2, d]
+    model.replace_from_channel(channel)
+    assert model._rows == [d, c2, a]
+    assert events == []
@@ -21,7 +21,7 @@ import io
 import pytest
 import requests.exceptions
 
-from gpodder.feedcore import Fetcher, NEW_LOCATION, Result, UPDATED_FEED
+from gpodder.feedcore import BadRequest, Fetcher, NEW_LOCATION, Result, UPDATED_FEED
 
 
 class MyFetcher(Fetcher):
@@ -63,6 +63,9 @@ def test_easy(httpserver):
     assert args['headers']['content-type'] == 'text/xml'
     assert isinstance(args['data_stream'], io.BytesIO)
     assert args['data_stream'].getvalue().decode('utf-8') == SIMPLE_RSS
+    # the body is shared, not copied
+    assert args['data_stream'].getvalue() is args['feed_data'].content
+    assert args['feed_data'].text == SIMPLE_RSS
     assert args['url'] == httpserver.url_for('/feed')
     assert args['extra_args']['custom_key'] == 'value'
 
@@ -114,3 +117,12 @@ def test_temporary_error_retry(httpserver):
     args = res.feed['parse_feed']
     assert args['headers']['content-type'] == 'text/xml'
     assert args['url'] == httpserver.url_for('/feed')
+
+
+def test_retry_after_is_not_waited_for(httpserver):
+    # Too long to wait in-process: the delay is passed on to the retry schedule
+    httpserver.expect_request('/feed').respond_with_data(status=429, headers={'Retry-After': '3600'})
+    with pytest.raises(BadRequest) as excinfo:
+        MyFetcher().fetch(httpserver.url_for('/feed'))
+    assert excinfo.value.retry_after == 3600
+    assert len(httpserver.log) == 1
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import threading
+
+from gpodder.hosthealth import HostHealth
+from gpodder.jsonconfig import JsonConfig
+
+URL = 'http://Example.com/feed.xml'
+
+
+def make_health():
+    health = HostHealth()
+    health.configure(JsonConfig(default={'limit': {'hosts': {'adaptive': True, 'connections': 4}}}))
+    return health
+
+
+def test_aimd():
+    health = make_health()
+    stats = health.acquire(URL)
+    assert stats.hostname == 'example.com'
+    assert stats.limit == HostHealth.INITIAL_LIMIT
+    health.release(stats)
+
+    for i in range(20):
+        health.record(stats, 200, 0.1)
+    assert stats.limit == 4
+
+    health.record(stats, 429, 0.1)
+    assert stats.limit == 2
+    assert stats.throttled == 1
+    # Throttle responses of concurrent requests only count once
+    health.record(stats, 503, 0.1)
+    assert stats.limit == 2
+
+    health.record(stats, 404, 0.1)
+    assert stats.errors == 1
+    assert stats.limit == 2
+
+
+def test_capacity():
+    health = make_health()
+    first = health.acquire(URL)
+    assert health.has_capacity(URL)
+    # The same thread may nest requests to the same host
+    health.acquire(URL)
+    assert first.active == 1
+    health.release(first)
+    health.release(first)
+    assert first.active == 0
+
+    with health.request(URL):
+        pass
+    first.limit = 1.
+    with health.request(URL):
+        assert not health.has_capacity(URL)
+        assert health.has_capacity('http://example.org/')
+    assert health.has_capacity(URL)
+
+
+def test_load_save(tmp_path):
+    filename = str(tmp_path / 'Hosts.json')
+    health = make_health()
+    with health.request(URL) as request:
+        request.response(429)
+    health.save(filename)
+
+    health = make_health()
+    health.load(filename)
+    stats, = health.stats()
+    assert (stats.hostname, stats.requests, stats.throttled, stats.limit) == ('example.com', 1, 1, 1.)
+
+
+def test_transfers_have_separate_slots():
+    health = make_health()
+    stats = health.acquire(URL, transfer=True)
+    stats.limit = 1.
+    assert not health.has_capacity(URL, transfer=True)
+    # Downloads don't hold up feed updates and cover art
+    assert health.has_capacity(URL)
+    with health.request(URL):
+        assert stats.active == 1
+    health.release(stats, transfer=True)
+    assert (stats.active, stats.transfers) == (0, 0)
+
+
+def test_acquire_timeout():
+    health = make_health()
+    stats = health.acquire(URL)
+    stats.limit = 1.
+    # Another thread gets the slot anyway when none becomes free in time
+    result = []
+    thread = threading.Thread(target=lambda: result.append(health.acquire(URL, timeout=0.01)))
+    thread.start()
+    thread.join()
+    assert result == [stats]
+    assert stats.active == 2
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from gpodder import minidb
+
+
+class Action(object):
+    __slots__ = {'url': str, 'position': int}
+
+    def __init__(self, url, position=None):
+        self.url = url
+        self.position = position
+
+
+def test_remove_loaded_objects():
+    store = minidb.Store()
+    store.save(Action('http://example.com/%d' % (i % 5), i) for i in range(20))
+    actions = store.load(Action)
+    assert len(actions) == 20
+
+    store.remove(a for a in actions if a.position < 10)
+    assert sorted(a.position for a in store.load(Action)) == list(range(10, 20))
+
+
+def test_remove_by_value():
+    store = minidb.Store()
+    store.save(Action('http://example.com/%d' % (i % 5), i) for i in range(20))
+    store.save(Action('http://example.com/none'))
+
+    # None is a wildcard
+    store.remove(Action('http://example.com/1'))
+    store.remove([Action('http://example.com/2', 2), Action('http://example.com/none')])
+    assert sorted(a.position for a in store.load(Action)) == [0, 3, 4, 5, 7, 8, 9, 10, 12, 13, 14, 15, 17, 18, 19]
+
+
+def test_remove_replaced_row():
+    store = minidb.Store()
+    store.save(Action('http://example.com/a', 1))
+    old = store.get(Action, url='http://example.com/a')
+    store.delete(Action, url='http://example.com/a')
+    store.save(Action('http://example.com/b', 2))
+
+    # Even if the row id of the deleted row is reused, the other row stays
+    store.remove(old)
+    assert [a.url for a in store.load(Action)] == ['http://example.com/b']
+
+
+class IndexedAction(Action):
+    INDEX = ('url',)
+
+
+def test_index_key_columns():
+    store = minidb.Store()
+    store.save(Action('http://example.com/a', 1))
+    store.save(IndexedAction('http://example.com/a', 1))
+    store.remove(Action('http://example.com/a', 1))
+    store.load(Action, position=1)
+    indexes = [name for (name,) in store.db.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert indexes == ['idx_IndexedAction_url']
+
+
+def test_loaded_objects_forgotten():
+    store = minidb.Store()
+    store.save(Action('http://example.com/%d' % i, i) for i in range(3))
+    first = store.load(Action)
+    second = store.load(Action, position=0)
+    # Only the object loaded last from a row is kept
+    assert len(store._rowids['Action']) == 3
+    assert first[0] not in store._rowids['Action']
+
+    store.remove(second + first[1:])
+    assert store._rowids['Action'] == {}
+    assert store._objects['Action'] == {}
+    assert store.load(Action) == []
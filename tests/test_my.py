@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import gzip
+import json
+
+from werkzeug.wrappers import Response
+
+import gpodder
+from gpodder import config, my
+
+
+class MyEpisode:
+    def __init__(self, url):
+        self.url = url
+        self.is_played = False
+        self.current_position = 0
+        self.current_position_updated = 0
+        self.total_time = 0
+        self.saved = 0
+
+    def mark(self, is_played=None):
+        self.is_played = is_played
+
+    def save(self):
+        self.saved += 1
+
+
+class MyPodcast:
+    def __init__(self, url, episodes):
+        self.url = url
+        self.episodes = episodes
+
+    def get_all_episodes(self):
+        return self.episodes
+
+
+def test_process_episode_actions(tmp_path, monkeypatch):
+    monkeypatch.setattr(gpodder, 'home', str(tmp_path))
+    client = my.MygPoClient(config.Config(str(tmp_path / 'Settings.json')))
+    podcast_url = 'http://example.com/feed'
+    client._store.save(my.ReceivedEpisodeAction(podcast_url, 'http://example.com/1.mp3', 'dev', 'play', 20, 0, 30, 0))
+    client._store.save(my.ReceivedEpisodeAction(podcast_url, 'http://example.com/1.mp3', 'dev', 'play', 10, 0, 60, 100))
+    client._store.save(my.ReceivedEpisodeAction(podcast_url, 'http://example.com/2.mp3', 'dev', 'download', 10, 0, 0, 0))
+    client._store.save(my.ReceivedEpisodeAction(podcast_url, 'http://example.com/3.mp3', 'dev', 'play', 10, 0, 10, 0))
+    client._store.save(my.ReceivedEpisodeAction('http://example.com/other', 'http://example.com/1.mp3', 'dev', 'play', 10, 0, 1, 0))
+
+    episodes = [MyEpisode('http://example.com/%d.mp3' % i) for i in (1, 2)]
+    podcasts = {podcast_url: MyPodcast(podcast_url, episodes)}
+    updated = []
+    client.process_episode_actions(podcasts.get, updated.append)
+
+    # The latest play action wins, the total time is kept
+    assert (episodes[0].is_played, episodes[0].current_position, episodes[0].total_time) == (True, 30, 100)
+    assert episodes[0].saved == 1
+    assert not episodes[1].is_played
+    assert updated == episodes[:1]
+    assert client._store.load(my.ReceivedEpisodeAction) == []
+
+
+def make_client(tmp_path, monkeypatch, httpserver, compress=True):
+    monkeypatch.setattr(gpodder, 'home', str(tmp_path))
+    monkeypatch.setattr(my.CompressingJsonClient, 'MIN_COMPRESS_SIZE', 0)
+    cfg = config.Config(str(tmp_path / 'Settings.json'))
+    cfg.mygpo.username = 'user'
+    cfg.mygpo.password = 'secret'
+    cfg.mygpo.server = httpserver.url_for('/')
+    cfg.mygpo.upload.chunk_size = 2
+    cfg.mygpo.upload.compress = compress
+    httpserver.expect_request('/api/2/episodes/user.json', method='GET').respond_with_json({'actions': [], 'timestamp': 1})
+    client = my.MygPoClient(cfg)
+    for i in range(5):
+        client._store.save(my.EpisodeAction('http://example.com/feed', 'http://example.com/%d.mp3' % i, 'dev', 'play', i, 0, i, 0))
+    return client
+
+
+def test_upload_episode_actions_in_chunks(tmp_path, monkeypatch, httpserver):
+    client = make_client(tmp_path, monkeypatch, httpserver)
+    uploaded = []
+
+    def upload(request):
+        assert request.headers['Content-Encoding'] == 'gzip'
+        if len(uploaded) == 2:
+            return Response('', status=500)
+        uploaded.append(json.loads(gzip.decompress(request.get_data())))
+        return Response(json.dumps({'timestamp': 2, 'update_urls': []}), content_type='application/json')
+
+    httpserver.expect_request('/api/2/episodes/user.json', method='POST').respond_with_handler(upload)
+    assert not client.synchronize_episodes(client._store.load(my.EpisodeAction))
+
+    # The uploaded chunks are no longer queued
+    assert [len(chunk) for chunk in uploaded] == [2, 2]
+    assert [a.position for a in client._store.load(my.EpisodeAction)] == [4]
+
+
+def test_upload_without_compression(tmp_path, monkeypatch, httpserver):
+    client = make_client(tmp_path, monkeypatch, httpserver)
+    uploaded = []
+
+    def upload(request):
+        if 'Content-Encoding' in request.headers:
+            return Response('', status=415)
+        uploaded.extend(json.loads(request.get_data()))
+        return Response(json.dumps({'timestamp': 2, 'update_urls': []}), content_type='application/json')
+
+    httpserver.expect_request('/api/2/episodes/user.json', method='POST').respond_with_handler(upload)
+    assert client.synchronize_episodes(client._store.load(my.EpisodeAction))
+    assert len(uploaded) == 5
+    assert client._client._client.compress is False
+    assert client._store.load(my.EpisodeAction) == []
+
+
+def test_upload_uncompressed_by_default(tmp_path, monkeypatch, httpserver):
+    client = make_client(tmp_path, monkeypatch, httpserver, compress=False)
+    uploaded = []
+
+    def upload(request):
+        assert 'Content-Encoding' not in request.headers
+        uploaded.extend(json.loads(request.get_data()))
+        return Response(json.dumps({'timestamp': 2, 'update_urls': []}), content_type='application/json')
+
+    httpserver.expect_request('/api/2/episodes/user.json', method='POST').respond_with_handler(upload)
+    assert client.synchronize_episodes(client._store.load(my.EpisodeAction))
+    assert len(uploaded) == 5
+    assert config.Config(str(tmp_path / 'Other.json')).mygpo.upload.compress is False
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from gpodder import opml
+
+
+class MyChannel:
+    def __init__(self, title, url, section):
+        self.title = title
+        self.description = 'About ' + title
+        self.url = url
+        self.section = section
+
+
+def test_export_import(tmp_path):
+    channels = [
+        MyChannel('One & Two', 'http://example.com/1.xml?a=1&b=2', 'audio'),
+        MyChannel('"Quoted"', 'http://example.com/2.xml', 'video'),
+        MyChannel('Three', 'http://example.com/3.xml', 'audio'),
+    ]
+    filename = str(tmp_path / 'subscriptions.opml')
+    assert opml.Exporter(filename).write(channels)
+
+    items = opml.Importer(filename).items
+    assert [(i['url'], i['title'], i['description'], i['section']) for i in items] == [
+        ('http://example.com/1.xml?a=1&b=2', 'One & Two', 'About One & Two', 'audio'),
+        ('http://example.com/3.xml', 'Three', 'About Three', 'audio'),
+        ('http://example.com/2.xml', '"Quoted"', 'About "Quoted"', 'video'),
+    ]
+
+
+def test_import_namespaced_outlines(tmp_path):
+    filename = str(tmp_path / 'other.opml')
+    with open(filename, 'w') as fp:
+        fp.write('<opml xmlns="http://opml.org/spec2" version="2.0"><body>'
+                 '<outline text="Feed" type="RSS" xmlUrl="http://example.com/feed"/>'
+                 '<outline text="Ignored" type="link"/></body></opml>')
+    items = opml.Importer(filename).items
+    assert [(i['url'], i['title'], i['description']) for i in items] == [
+        ('http://example.com/feed', 'Feed', 'http://example.com/feed')]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from gpodder import dbsqlite, feedcore, model
+
+PAGE = '''<rss xmlns:atom="http://www.w3.org/2005/Atom"><channel><title>Paged</title>
+{next}{items}</channel></rss>'''
+ITEM = ('<item><title>{0}</title><guid>{0}</guid><pubDate>Mon, {0:02d} Jan 2024 00:00:00 +0000</pubDate>'
+        '<enclosure url="http://example.com/{0}.mp3" type="audio/mpeg" length="1"/></item>')
+PAGES = 3
+
+
+class MyEpisode:
+    total_time = 0
+
+    @classmethod
+    def from_podcastparser_entry(cls, entry, channel):
+        episode = cls()
+        episode.guid = entry['guid']
+        episode.url = entry['enclosures'][0]['url']
+        return episode
+
+    def update_from(self, episode):
+        pass
+
+    def cache_text_description(self):
+        pass
+
+    def save(self):
+        pass
+
+
+class MyChannel:
+    EpisodeClass = MyEpisode
+
+    def __init__(self, db):
+        self.id = 1
+        self.db = db
+
+    def authenticate_url(self, url):
+        return url
+
+
+def serve_pages(httpserver):
+    for n in range(PAGES):
+        items = ''.join(ITEM.format(i) for i in range(30 - 3 * n, 27 - 3 * n, -1))
+        link = '<atom:link rel="next" href="%s"/>' % httpserver.url_for('/page%d' % (n + 1)) if n + 1 < PAGES else ''
+        httpserver.expect_request('/page%d' % n).respond_with_data(
+            PAGE.format(next=link, items=items), content_type='text/xml', headers={'ETag': '"%d"' % n})
+
+
+def read_pages(httpserver, channel, existing_guids):
+    """Follow the pages like PodcastChannel._consume_updated_feed, return the seen guids."""
+    feed = model.gPodderFetcher().fetch(httpserver.url_for('/page0')).feed
+    seen_guids = set()
+    while feed is not None:
+        feed.prefetch_next_page(channel)
+        new_episodes, page_guids = feed.get_new_episodes(channel, existing_guids)
+        existing_guids.update((e.guid, e) for e in new_episodes)
+        seen_guids |= page_guids
+        result = feed.get_next_page(channel, 0)
+        feed = result.feed if result is not None and result.status == feedcore.UPDATED_FEED else None
+    return seen_guids
+
+
+def test_unchanged_pages_are_not_fetched_again(httpserver, tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    channel = MyChannel(db)
+    serve_pages(httpserver)
+    existing_guids = {}
+    assert len(read_pages(httpserver, channel, existing_guids)) == 9
+    assert db.get_feed_page(1, httpserver.url_for('/page1'))[1] == '"1"'
+
+    httpserver.clear()
+    # Unchanged pages (the first one is checked by the channel)
+    for n in range(1, PAGES):
+        httpserver.expect_request('/page%d' % n, headers={'If-None-Match': '"%d"' % n}).respond_with_data('', status=304)
+    serve_pages(httpserver)
+    assert len(read_pages(httpserver, channel, existing_guids)) == 9
+    assert [r.path for r, _ in httpserver.log[-2:]] == ['/page1', '/page2']
+    assert all(response.status_code == 304 for _, response in httpserver.log[-2:])
+    db.close()
+
+
+def test_feed_keeps_its_own_response(httpserver):
+    serve_pages(httpserver)
+    # The fetcher is shared by all podcasts, which can be updated concurrently
+    fetcher = model.gPodderFetcher()
+    first = fetcher.fetch(httpserver.url_for('/page0')).feed
+    second = fetcher.fetch(httpserver.url_for('/page1')).feed
+    assert b'/page1' in first.feed_data.content
+    assert b'/page1' not in second.feed_data.content
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import io
+
+import podcastparser
+
+from gpodder import parsepool
+from gpodder.jsonconfig import JsonConfig
+
+FEED = b'''<rss><channel><title>Podcast</title>
+<item><title>Episode</title><guid>1</guid><enclosure url="http://example.com/1.mp3" type="audio/mpeg" length="1"/></item>
+</channel></rss>'''
+
+
+def test_parse_in_process():
+    config = JsonConfig(default={'limit': {'parse': {'processes': 1, 'min_size': 0}}})
+    pool = parsepool.ParserPool()
+    pool.configure(config)
+    try:
+        expected = podcastparser.parse('http://example.com/feed', io.BytesIO(FEED))
+        assert pool.parse('http://example.com/feed', io.BytesIO(FEED)) == expected
+        assert pool._executor is not None
+    finally:
+        pool.shutdown()
+
+
+def test_small_feeds_are_parsed_in_thread():
+    config = JsonConfig(default={'limit': {'parse': {'processes': 1, 'min_size': 1}}})
+    pool = parsepool.ParserPool()
+    pool.configure(config)
+    assert pool.parse('http://example.com/feed', io.BytesIO(FEED))['title'] == 'Podcast'
+    assert pool._executor is None
+
+
+def test_parse_keeps_newest_episodes():
+    items = ''.join('<item><title>{0}</title><guid>{0}</guid><pubDate>{1}</pubDate>'
+                    '<enclosure url="http://example.com/{0}.mp3" type="audio/mpeg" length="1"/></item>'
+                    .format(i, 'Mon, 0{} Jan 2024 00:00:00 +0000'.format(1 + i * 7 % 9)) for i in range(9))
+    feed = '<rss><channel><title>Podcast</title>{}</channel></rss>'.format(items).encode()
+
+    expected = sorted(podcastparser.parse('http://example.com/feed', io.BytesIO(feed))['episodes'],
+                      key=parsepool.by_published, reverse=True)
+    episodes = parsepool.parse('http://example.com/feed', io.BytesIO(feed), max_episodes=2)['episodes']
+    assert sorted(episodes, key=parsepool.by_published, reverse=True) == expected[:2]
+    assert len(parsepool.parse('http://example.com/feed', io.BytesIO(feed))['episodes']) == 9
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import time
+
+from gpodder import dbsqlite, retry
+from gpodder.jsonconfig import JsonConfig
+
+
+def test_parse_retry_after():
+    assert retry.parse_retry_after('120') == 120
+    assert retry.parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412420) == 60
+    assert retry.parse_retry_after('soon') is None
+    assert retry.parse_retry_after(None) is None
+
+
+def test_backoff_delay():
+    for attempt in range(1, 10):
+        delay = retry.backoff_delay(attempt, 60, 3600)
+        expected = min(3600, 60 * 2 ** (attempt - 1))
+        assert expected / 2 <= delay <= expected
+
+
+def test_retry_schedule(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    config = JsonConfig(default={'auto': {'backoff': {'enabled': True, 'attempts': 2, 'initial': 60, 'maximum': 3600}}})
+    schedule = retry.RetrySchedule(db, config)
+
+    assert schedule.is_due(retry.KIND_PODCAST, 1)
+    next_attempt = schedule.failed(retry.KIND_PODCAST, 1, 'error')
+    assert time.time() + 30 - 1 <= next_attempt <= time.time() + 60
+    assert not schedule.is_due(retry.KIND_PODCAST, 1)
+    assert schedule.is_due(retry.KIND_EPISODE, 1)
+    assert schedule.due(retry.KIND_PODCAST, now=next_attempt) == [1]
+
+    # Retry-After is honored, up to the maximum delay
+    next_attempt = schedule.failed(retry.KIND_PODCAST, 1, 'error', retry_after=7200)
+    assert next_attempt >= time.time() + 3600 - 1
+
+    # Give up after too many attempts, and don't start over
+    assert schedule.failed(retry.KIND_PODCAST, 1, 'error') is None
+    assert not schedule.is_due(retry.KIND_PODCAST, 1, now=time.time() + 86400)
+    assert schedule.due(retry.KIND_PODCAST, now=time.time() + 86400) == []
+    schedule.postpone(retry.KIND_PODCAST, 1)
+    assert schedule.failed(retry.KIND_PODCAST, 1, 'error') is None
+    assert not schedule.is_due(retry.KIND_PODCAST, 1, now=time.time() + 86400)
+    assert db.get_retry_attempts(retry.KIND_PODCAST, 1) == 2
+
+    # ...until the user retries it
+    schedule.reset(retry.KIND_PODCAST, 1)
+    assert schedule.is_due(retry.KIND_PODCAST, 1)
+
+    schedule.failed(retry.KIND_EPISODE, 2, 'error')
+    schedule.succeeded(retry.KIND_EPISODE, 2)
+    assert schedule.is_due(retry.KIND_EPISODE, 2)
+    db.close()
+
+
+def test_retry_cleanup(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    config = JsonConfig(default={'auto': {'backoff': {'enabled': True, 'attempts': 8, 'initial': 60, 'maximum': 3600}}})
+    schedule = retry.RetrySchedule(db, config)
+    for episode_id in (1, 2):
+        db.db.execute("INSERT INTO episode (id, podcast_id, url, guid) VALUES (?, ?, ?, ?)",
+                      (episode_id, 10, 'http://example.com/%d.mp3' % episode_id, 'guid%d' % episode_id))
+        schedule.failed(retry.KIND_EPISODE, episode_id, 'error')
+    assert db.get_episode_podcast_ids([1, 2, 3]) == {1: 10, 2: 10}
+
+    # Postponing does not count as an attempt
+    now = time.time()
+    schedule.postpone(retry.KIND_EPISODE, 1)
+    assert not schedule.is_due(retry.KIND_EPISODE, 1, now=now + 59)
+    assert db.get_retry_attempts(retry.KIND_EPISODE, 1) == 1
+
+    # Removed episodes are not retried
+    db.delete_episode_by_guid('guid2', 10)
+    assert db.get_retry_attempts(retry.KIND_EPISODE, 2) is None
+    assert db.get_retry_attempts(retry.KIND_EPISODE, 1) == 1
+    db.close()
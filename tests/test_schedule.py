@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from gpodder import dbsqlite
+from gpodder.jsonconfig import JsonConfig
+from gpodder.schedule import DAY, HOUR, UpdateSchedule, update_interval
+
+MINIMUM = 20 * 60
+MAXIMUM = DAY
+# Weekly show, published on Mondays at 06:00 UTC
+WEEKLY = [1700460000 - i * 7 * DAY for i in range(10)]
+
+
+def test_no_history():
+    assert update_interval([], 0., 0, MINIMUM, MAXIMUM) == MINIMUM
+    assert update_interval(WEEKLY[:1], 0., 0, MINIMUM, MAXIMUM) == MINIMUM
+
+
+def test_weekly_show():
+    # Right after an episode: wait, but not for the whole week
+    assert update_interval(WEEKLY, 0., WEEKLY[0] + HOUR, MINIMUM, MAXIMUM) == MAXIMUM
+    # Shortly before the next episode is expected: check often
+    assert update_interval(WEEKLY, 0., WEEKLY[0] + 7 * DAY - HOUR, MINIMUM, MAXIMUM) == MINIMUM
+    assert update_interval(WEEKLY, 0., WEEKLY[0] + 7 * DAY + HOUR, MINIMUM, MAXIMUM) == MINIMUM
+    # Feeds that are usually unchanged are checked less often
+    assert update_interval(WEEKLY, 1., WEEKLY[0] + 7 * DAY + HOUR, MINIMUM, MAXIMUM) == 2 * MINIMUM
+    # Dead feed
+    assert update_interval(WEEKLY, 0., WEEKLY[0] + 365 * DAY, MINIMUM, MAXIMUM) == MAXIMUM
+
+
+def test_time_of_day():
+    # Daily show at 06:00 UTC: nothing to expect in the evening
+    daily = [WEEKLY[0] - i * DAY for i in range(10)]
+    assert update_interval(daily, 0., daily[0] + 12 * HOUR, MINIMUM, MAXIMUM) == 6 * HOUR
+    assert update_interval(daily, 0., daily[0] + DAY - HOUR, MINIMUM, MAXIMUM) == MINIMUM
+
+
+class MyPodcast:
+    id = 1
+    url = 'http://example.com/feed.xml'
+
+
+def test_update_schedule(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    for published in WEEKLY:
+        db.db.execute('INSERT INTO episode (podcast_id, url, guid, published) VALUES (1, ?, ?, ?)',
+                      ('http://example.com/%d' % published, str(published), published))
+    config = JsonConfig(default={'auto': {'update': {'frequency': 20, 'adaptive': True, 'max_interval': 24}}})
+    schedule = UpdateSchedule(db, config)
+    podcast = MyPodcast()
+
+    assert schedule.is_due(podcast)
+    schedule.checked(podcast, [], now=WEEKLY[0] + HOUR)
+    assert schedule.next_check(podcast) == WEEKLY[0] + HOUR + MAXIMUM
+    assert not schedule.is_due(podcast, now=WEEKLY[0] + 2 * HOUR)
+    assert schedule.is_due(podcast, now=WEEKLY[0] + HOUR + MAXIMUM)
+
+    config.auto.update.adaptive = False
+    assert schedule.is_due(podcast, now=WEEKLY[0] + 2 * HOUR)
+    db.close()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import time
+
+import pytest
+
+pytest.importorskip('gi')
+
+from gpodder import sync  # isort:skip
+from gpodder.jsonconfig import JsonConfig  # isort:skip
+
+
+class MyEpisode:
+    def __init__(self, title):
+        self.title = title
+
+
+def test_manifest(monkeypatch):
+    now = 1000000
+    monkeypatch.setattr(time, 'time', lambda: now)
+    manifest = sync.DeviceManifest()
+    files = [['episode.mp3', 1000, now - 100]]
+    manifest.put('podcast', now - 10, files)
+    assert manifest.changed
+
+    manifest = sync.DeviceManifest.from_json(manifest.to_json())
+    assert manifest.get('podcast', now - 10) == files
+    # The folder has changed since it was listed
+    assert manifest.get('podcast', now - 5) is None
+    assert manifest.get('podcast', None) is None
+    assert manifest.get('other', now - 10) is None
+    assert not manifest.changed
+
+    manifest.retain(['podcast'])
+    assert not manifest.changed
+    manifest.retain([])
+    assert manifest.changed
+    assert manifest.get('podcast', now - 10) is None
+
+
+def test_manifest_racy_folder(monkeypatch):
+    now = 1000000
+    monkeypatch.setattr(time, 'time', lambda: now)
+    manifest = sync.DeviceManifest()
+    # Files may be added in the same second (or FAT time slot) after listing
+    manifest.put('podcast', now - sync.DeviceManifest.RACY_SECONDS, [])
+    assert manifest.get('podcast', now - sync.DeviceManifest.RACY_SECONDS) is None
+    manifest.put('podcast', now - sync.DeviceManifest.RACY_SECONDS - 1, [])
+    assert manifest.get('podcast', now - sync.DeviceManifest.RACY_SECONDS - 1) == []
+
+    # Only the version of the manifest format that is known is used
+    assert sync.DeviceManifest.from_json('{"version": 0, "folders": {"podcast": {}}}').folders == {}
+
+
+def test_track_index_reset():
+    device = sync.Device(JsonConfig())
+    first = sync.SyncTrack('Episode', 1000, None, podcast='Podcast')
+    device.tracks_list = [first]
+    assert device.episode_on_device(MyEpisode('Episode')) is first
+    assert device._track_on_device('Other') is None
+
+    # A new track list replaces the index
+    second = sync.SyncTrack('Other', 1000, None, podcast='Podcast')
+    device.tracks_list = [second]
+    assert device._track_on_device('Episode') is None
+    assert device._track_on_device('Other') is second
+
+
+class MyTask:
+    def __init__(self, episode):
+        self.episode = episode
+
+
+class MyDatabase:
+    def __init__(self, tracks):
+        self.tracks = tracks
+
+    def find_track(self, url):
+        return self.tracks.get(url)
+
+
+def test_ipod_add_present_track():
+    device = sync.iPodDevice.__new__(sync.iPodDevice)
+    sync.Device.__init__(device, JsonConfig())
+    track = object()
+    device.ipod = MyDatabase({'http://example.com/episode.mp3': track})
+    updated = []
+    device.update_from_episode = lambda t, episode: updated.append(t)
+
+    episode = MyEpisode('Episode')
+    episode.url = 'http://example.com/episode.mp3'
+    assert device.add_track(MyTask(episode))
+    assert updated == [track]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import time
+
+import pytest
+
+import gpodder
+from gpodder import dbsqlite, model, timing
+
+
+def test_nested_spans():
+    # Not collecting: spans are no-ops
+    with timing.span('parse'):
+        pass
+    assert timing.current() is None
+
+    with timing.collect() as timer:
+        with timing.span('episodes'):
+            time.sleep(0.02)
+            with timing.span('youtube'):
+                time.sleep(0.05)
+        with timing.collect() as nested:
+            assert nested is timer
+            with timing.span('parse'):
+                time.sleep(0.01)
+    assert timing.current() is None
+
+    assert set(timer.phases) == {'other', 'episodes', 'youtube', 'parse'}
+    assert timer.phases['youtube'] >= 0.05
+    assert 0.02 <= timer.phases['episodes'] < 0.05
+    assert abs(timer.total - sum(timer.phases.values())) < 1e-9
+
+
+def test_move():
+    with timing.collect() as timer:
+        with timing.span('transfer'):
+            time.sleep(0.02)
+        timing.move('transfer', 'request', 0.01)
+    assert timer.phases['request'] == 0.01
+    assert timer.phases['transfer'] >= 0.01
+
+
+class MyPodcast:
+    def __init__(self, podcast_id, title):
+        self.id = podcast_id
+        self.title = title
+        self.url = 'http://example.com/%d.xml' % podcast_id
+
+
+def test_update_stats(tmp_path):
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    db.save_update_timing(1, {'parse': 1.0, 'total': 2.0})
+    db.save_update_timing(1, {'parse': 2.0, 'total': 3.0})
+    db.save_update_timing(2, {'request': 5.0, 'total': 5.0})
+
+    stats = timing.update_stats(db, [MyPodcast(1, 'Fast'), MyPodcast(2, 'Slow')])
+    assert [s['title'] for s in stats] == ['Slow', 'Fast']
+    parse = stats[1]['phases']['parse']
+    assert (parse['samples'], parse['last'], parse['maximum']) == (2, 2.0, 2.0)
+    assert 1.0 < parse['average'] < 2.0
+    db.close()
+
+
+class MyModel:
+    def __init__(self, db):
+        self.db = db
+
+
+class MyExtensions:
+    def on_podcast_update_failed(self, podcast, exception):
+        pass
+
+
+class MyFetcher:
+    def fetch_channel(self, channel, max_episodes):
+        raise ValueError('Offline')
+
+
+def test_failed_update_timing_is_committed(tmp_path, monkeypatch):
+    monkeypatch.setattr(gpodder, 'user_extensions', MyExtensions())
+    monkeypatch.setattr(model.PodcastChannel, 'feed_fetcher', MyFetcher())
+    db = dbsqlite.Database(str(tmp_path / 'Database'))
+    podcast = model.PodcastChannel(MyModel(db))
+    podcast.id = 1
+    with pytest.raises(ValueError):
+        podcast.update()
+
+    other = dbsqlite.Database(str(tmp_path / 'Database'))
+    assert 'total' in {row[1] for row in other.get_update_timing() if row[0] == 1}
+    other.close()
+    db.close()
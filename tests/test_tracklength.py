@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import struct
+
+import pytest
+
+from gpodder.tracklength import get_duration
+
+# MPEG-1 Layer III, 128 kbit/s, 44.1 kHz, joint stereo
+MP3_HEADER = b'\xff\xfb\x90\x64'
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def ogg_page(granule, serial, packet=b''):
+    return (b'OggS\x00\x02' + struct.pack('<qIII', granule, serial, 0, 0)
+            + bytes([1, len(packet)]) + packet)
+
+
+def test_mp3_constant_bitrate(tmp_path):
+    id3 = b'ID3\x03\x00\x00\x00\x00\x00\x64' + b'\x00' * 100
+    filename = write(tmp_path / 'cbr.mp3', id3 + MP3_HEADER + b'\x00' * 15996 + b'TAG' + b'\x00' * 125)
+    assert get_duration(filename) == pytest.approx(1.0)
+
+
+def test_mp3_xing(tmp_path):
+    frame = MP3_HEADER + b'\x00' * 32 + b'Xing' + struct.pack('>II', 1, 1000)
+    filename = write(tmp_path / 'vbr.mp3', frame + b'\x00' * 5000)
+    assert get_duration(filename) == pytest.approx(1000 * 1152 / 44100)
+
+
+def test_mp3_vbri(tmp_path):
+    frame = MP3_HEADER + b'\x00' * 32 + b'VBRI' + struct.pack('>HHHII', 1, 0, 0, 5000, 2000)
+    filename = write(tmp_path / 'vbri.mp3', frame + b'\x00' * 5000)
+    assert get_duration(filename) == pytest.approx(2000 * 1152 / 44100)
+
+
+def test_mp4(tmp_path):
+    ftyp = struct.pack('>I4s4sI', 16, b'ftyp', b'M4A ', 0)
+    mvhd = struct.pack('>I4sIIIII', 28, b'mvhd', 0, 0, 0, 1000, 90500)
+    free = struct.pack('>I4s', 12, b'free') + b'\x00' * 4
+    moov = struct.pack('>I4s', 8 + len(free) + len(mvhd), b'moov') + free + mvhd
+    mdat = struct.pack('>I4s', 1008, b'mdat') + b'\x00' * 1000
+    filename = write(tmp_path / 'episode.m4a', ftyp + mdat + moov)
+    assert get_duration(filename) == pytest.approx(90.5)
+
+
+def test_ogg_opus(tmp_path):
+    head = b'OpusHead\x01\x02' + struct.pack('<HIhB', 312, 44100, 0, 0)
+    data = ogg_page(0, 1234, head) + b'\x00' * 1000 + ogg_page(10 * 48000 + 312, 1234) + ogg_page(-1, 99)
+    assert get_duration(write(tmp_path / 'episode.opus', data)) == pytest.approx(10.0)
+
+
+def test_ogg_vorbis(tmp_path):
+    head = b'\x01vorbis' + struct.pack('<IBI', 0, 2, 44100) + b'\x00' * 14
+    data = ogg_page(0, 1, head) + b'\x00' * 1000 + ogg_page(44100 * 3, 1)
+    assert get_duration(write(tmp_path / 'episode.ogg', data)) == pytest.approx(3.0)
+
+
+def test_unknown(tmp_path):
+    assert get_duration(write(tmp_path / 'episode.webm', b'\xff\xfb\x90\x64' * 100)) is None
+    assert get_duration(str(tmp_path / 'missing.mp3')) is None
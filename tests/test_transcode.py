@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import os
+import sys
+import time
+
+import pytest
+
+from gpodder import transcode
+
+# Stands in for ffmpeg: "transcodes" by copying the input (after -i) to the output
+FAKE_FFMPEG = '''#!%s
+import shutil, sys
+with open(sys.argv[0] + '.calls', 'a') as fp:
+    fp.write('x')
+args = sys.argv[1:]
+source = args[args.index('-i') + 1]
+if source.endswith('.bad'):
+    sys.exit('invalid data')
+if source.endswith('.slow'):
+    import time
+    time.sleep(60)
+shutil.copyfile(source, args[-1])
+'''
+
+
+@pytest.fixture
+def ffmpeg(tmp_path):
+    command = tmp_path / 'ffmpeg'
+    command.write_text(FAKE_FFMPEG % sys.executable)
+    command.chmod(0o755)
+    return str(command)
+
+
+def calls(ffmpeg):
+    with open(ffmpeg + '.calls') as fp:
+        return len(fp.read())
+
+
+def make_source(tmp_path, name, size):
+    filename = tmp_path / name
+    filename.write_bytes(os.urandom(size))
+    return str(filename)
+
+
+def test_transcode_cached(tmp_path, ffmpeg):
+    source = make_source(tmp_path, 'episode.m4a', 1000)
+    cache = transcode.TranscodeCache(str(tmp_path / 'cache'), 10000)
+    transcoder = transcode.Transcoder(cache, ffmpeg)
+    output = transcoder.transcode(source, 'mp3')
+    assert output.endswith('.mp3')
+    assert transcoder.cached_size(source, 'mp3') == 1000
+
+    # A new cache (e.g. the next sync) finds the file by the hash of the source
+    transcoder = transcode.Transcoder(transcode.TranscodeCache(str(tmp_path / 'cache'), 10000), ffmpeg)
+    assert transcoder.transcode(source, 'mp3') == output
+    assert transcoder.transcode(source, 'ogg') != output
+    assert calls(ffmpeg) == 2
+
+
+def test_cache_evicts_least_recently_used(tmp_path, ffmpeg):
+    sources = [make_source(tmp_path, 'episode%d.m4a' % i, 1000) for i in range(3)]
+    cache = transcode.TranscodeCache(str(tmp_path / 'cache'), 2500)
+    transcoder = transcode.Transcoder(cache, ffmpeg)
+    first = transcoder.transcode(sources[0], 'mp3')
+    transcoder.transcode(sources[1], 'mp3')
+    # Using the first file again makes the second one the least recently used
+    assert transcoder.transcode(sources[0], 'mp3') == first
+    transcoder.transcode(sources[2], 'mp3')
+
+    assert transcoder.cached_size(sources[0], 'mp3') == 1000
+    assert transcoder.cached_size(sources[1], 'mp3') is None
+    assert transcoder.cached_size(sources[2], 'mp3') == 1000
+    assert len([f for f in os.listdir(cache.folder) if f.endswith('.mp3')]) == 2
+
+
+def test_transcode_error(tmp_path, ffmpeg):
+    source = make_source(tmp_path, 'episode.bad', 10)
+    transcoder = transcode.Transcoder(transcode.TranscodeCache(str(tmp_path / 'cache'), 10000), ffmpeg)
+    with pytest.raises(transcode.TranscodeError):
+        transcoder.transcode(source, 'mp3')
+    assert transcoder.cached_size(source, 'mp3') is None
+
+
+def test_source_hashes_saved(tmp_path, ffmpeg, monkeypatch):
+    source = make_source(tmp_path, 'episode.m4a', 1000)
+    transcoder = transcode.Transcoder(transcode.TranscodeCache(str(tmp_path / 'cache'), 10000), ffmpeg)
+    assert transcoder.cached_size(source, 'mp3') is None
+    transcoder.shutdown()
+
+    # The next sync doesn't hash the unchanged file again
+    monkeypatch.setattr(transcode, 'file_hash', None)
+    transcoder = transcode.Transcoder(transcode.TranscodeCache(str(tmp_path / 'cache'), 10000), ffmpeg)
+    assert transcoder.cached_size(source, 'mp3') is None
+
+
+def test_prefetched_not_evicted(tmp_path, ffmpeg):
+    sources = [make_source(tmp_path, 'episode%d.m4a' % i, 1000) for i in range(3)]
+    cache = transcode.TranscodeCache(str(tmp_path / 'cache'), 1500)
+    transcoder = transcode.Transcoder(cache, ffmpeg, workers=1)
+    key = transcoder.prefetch(sources[0], 'mp3')
+    transcoder.transcode(sources[1], 'mp3')
+    # Waiting to be copied, so it is kept although the cache is full
+    assert transcoder.cached_size(sources[0], 'mp3') == 1000
+    assert transcoder.cached_size(sources[1], 'mp3') == 1000
+
+    transcoder.release(key)
+    transcoder.transcode(sources[2], 'mp3')
+    assert transcoder.cached_size(sources[0], 'mp3') is None
+
+
+def test_shutdown_stops_transcoding(tmp_path, ffmpeg):
+    slow = make_source(tmp_path, 'episode.slow', 1000)
+    source = make_source(tmp_path, 'episode.m4a', 1000)
+    transcoder = transcode.Transcoder(transcode.TranscodeCache(str(tmp_path / 'cache'), 10000), ffmpeg, workers=1)
+    running = transcoder.submit(slow, 'mp3')
+    pending = transcoder.submit(source, 'mp3')
+    while not transcoder._processes:
+        time.sleep(0.01)
+
+    started = time.time()
+    transcoder.shutdown()
+    with pytest.raises(transcode.TranscodeError):
+        running.result(10)
+    assert time.time() - started < 10
+    assert pending.cancelled()
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+import errno
+import os
+import sys
+
+from gpodder import util
+
+
+def make_file(tmp_path, size):
+    filename = str(tmp_path / 'episode.mp3')
+    with open(filename, 'wb') as fp:
+        fp.write(os.urandom(size))
+    return filename
+
+
+def read(filename):
+    with open(filename, 'rb') as fp:
+        return fp.read()
+
+
+def test_copy_local_file(tmp_path):
+    source = make_file(tmp_path, 10 * 1024 * 1024)
+    target = str(tmp_path / 'copy.mp3')
+    progress = []
+    assert util.copy_local_file(source, target, lambda done, block, total: progress.append((done, total)))
+    assert read(target) == read(source)
+    assert progress[-1] == (10 * 1024 * 1024, 10 * 1024 * 1024)
+
+    # Cancelled after the first chunk
+    assert not util.copy_local_file(source, target, cancelled=lambda: True)
+    assert os.path.getsize(target) == 8 * 1024 * 1024
+
+
+def test_copy_local_file_fallback(tmp_path, monkeypatch):
+    def copy_file_range(src, dst, count):
+        raise OSError(errno.EXDEV, 'Invalid cross-device link')
+
+    def sendfile(out_fd, in_fd, offset, count):
+        raise TypeError('sendfile() only writes to sockets here')
+
+    # e.g. macOS: sendfile() is not used at all
+    monkeypatch.setattr(os, 'copy_file_range', copy_file_range, raising=False)
+    monkeypatch.setattr(os, 'sendfile', sendfile, raising=False)
+    monkeypatch.setattr(sys, 'platform', 'darwin')
+    source = make_file(tmp_path, 1000)
+    target = str(tmp_path / 'copy.mp3')
+    assert util.copy_local_file(source, target)
+    assert read(target) == read(source)
+
+
+def test_moved_indices():
+    assert util.moved_indices([]) == set()
+    assert util.moved_indices([0, 1, 2]) == set()
+    assert util.moved_indices([2, 1, 0]) in ({0, 1}, {0, 2}, {1, 2})
+    # Moving 4 to the end keeps the other rows in place
+    assert util.moved_indices([0, 4, 1, 2, 3]) == {1}
+
+    for sequence in ([3, 0, 4, 1, 5, 2], [5, 4, 0, 1, 2, 3], [1, 0, 3, 2, 5, 4]):
+        moved = util.moved_indices(sequence)
+        kept = [value for index, value in enumerate(sequence) if index not in moved]
+        assert kept == sorted(kept)
+    assert len(util.moved_indices([3, 0, 4, 1, 5, 2])) == 3
+    assert len(util.moved_indices([5, 4, 0, 1, 2, 3])) == 2
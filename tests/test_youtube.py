@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# gPodder - A media aggregator and podcast client
+# Copyright (c) 2005-2023 The gPodder Team
+#
+# gPodder is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 3 of the License, or
+# (at your option) any later version.
+#
+# gPodder is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+from gpodder import youtube
+
+
+class MyDB:
+    def __init__(self):
+        self.commits = 0
+
+    def commit(self):
+        self.commits += 1
+
+
+class MyEpisode:
+    def __init__(self, vid, db):
+        self.url = 'https://www.youtube.com/watch?v=' + vid
+        self.db = db
+        self.total_time = 0
+        self.saved = 0
+
+    def save(self):
+        self.saved += 1
+
+
+def test_duration_lookups(monkeypatch, tmp_path):
+    durations = {'a': 60, 'b': 0}
+    looked_up = []
+
+    def get_total_time(episode):
+        vid = youtube.get_youtube_id(episode.url)
+        looked_up.append(vid)
+        return durations[vid]
+
+    monkeypatch.setattr(youtube, 'get_total_time', get_total_time)
+    db = MyDB()
+    found = []
+    lookups = youtube.DurationLookups()
+    lookups.callbacks.append(found.extend)
+
+    a, b = MyEpisode('a', db), MyEpisode('b', db)
+    lookups.enqueue(a)
+    lookups.enqueue(b)
+    assert lookups.wait(5)
+    assert (a.total_time, a.saved) == (60, 1)
+    assert (b.total_time, b.saved) == (0, 0)
+    assert found == [a]
+    assert db.commits == 1
+
+    # No duration (e.g. live stream): not looked up again for a while
+    lookups.enqueue(MyEpisode('b', db))
+    assert lookups.wait(5)
+    assert sorted(looked_up) == ['a', 'b']
+
+    filename = str(tmp_path / 'lookups.json')
+    lookups.save(filename)
+    lookups = youtube.DurationLookups()
+    lookups.load(filename)
+    lookups.enqueue(MyEpisode('b', db))
+    assert lookups.wait(5)
+    assert sorted(looked_up) == ['a', 'b']
+
+
+def test_duration_lookups_batches(monkeypatch):
+    monkeypatch.setattr(youtube, 'get_total_time', lambda episode: 60)
+    monkeypatch.setattr(youtube.DurationLookups, 'BATCH_SIZE', 2)
+    db = MyDB()
+    found = []
+    lookups = youtube.DurationLookups()
+    lookups.callbacks.append(found.extend)
+
+    episodes = [MyEpisode(vid, db) for vid in 'abcde']
+    for episode in episodes:
+        lookups.enqueue(episode)
+    assert lookups.wait(5)
+    assert sorted(found, key=episodes.index) == episodes
+    # Saved and reported at least once per batch
+    assert db.commits >= 3
+
+
+def test_duration_lookups_save_error(monkeypatch):
+    monkeypatch.setattr(youtube, 'get_total_time', lambda episode: 60)
+    db = MyDB()
+    lookups = youtube.DurationLookups()
+
+    def save():
+        raise IOError('database is locked')
+
+    broken, episode = MyEpisode('a', db), MyEpisode('b', db)
+    broken.save = save
+    lookups.enqueue(broken)
+    lookups.enqueue(episode)
+    # The worker carries on, and wait() returns
+    assert lookups.wait(5)
+    assert episode.saved == 1
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# Benchmark parsing a corpus of (large) feed files in-thread vs. in processes
+#
+# Usage: PYTHONPATH=src tools/benchmark-feed-parsing.py [--threads N] FEED...
+#
+# Save some real-world back-catalog feeds (several MB each) to disk first.
+# Each feed is parsed by N threads at once (like concurrent feed updates),
+# first in the calling threads, then with parsepool and 1..N processes.
+
+import argparse
+import concurrent.futures
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, 'src')
+
+from gpodder import parsepool  # isort:skip
+from gpodder.jsonconfig import JsonConfig  # isort:skip
+
+
+def run(pool, feeds, threads):
+    def parse(filename, data):
+        return len(pool.parse('file://' + filename, io.BytesIO(data))['episodes'])
+
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        episodes = sum(executor.map(lambda f: parse(*f), feeds))
+    return time.perf_counter() - started, episodes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark feed parsing')
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 4)
+    parser.add_argument('--min-size', type=int, default=512, help='KiB')
+    parser.add_argument('feeds', nargs='+')
+    args = parser.parse_args()
+
+    feeds = []
+    for filename in args.feeds:
+        with open(filename, 'rb') as fp:
+            feeds.append((filename, fp.read()))
+    print('%d feeds, %.1f MiB, %d threads' % (len(feeds), sum(len(d) for _, d in feeds) / 1024 / 1024, args.threads))
+
+    for processes in [0] + list(range(1, args.threads + 1)):
+        config = JsonConfig(default={'limit': {'parse': {'processes': processes, 'min_size': args.min_size}}})
+        pool = parsepool.ParserPool()
+        pool.configure(config)
+        # Start the worker processes before measuring
+        pool.parse('warmup', io.BytesIO(b'<rss><channel></channel></rss>'.ljust(args.min_size * 1024)))
+        elapsed, episodes = run(pool, feeds, args.threads)
+        pool.shutdown()
+        print('%s: %.2fs (%d episodes)' % ('%d processes' % processes if processes else 'in-thread', elapsed, episodes))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# Benchmark the gpodder.net action queue (gpodder.minidb)
+#
+# Usage: PYTHONPATH=src tools/benchmark-minidb.py [COUNT]
+#
+# Queues COUNT synthetic episode actions, loads them and removes them
+# again, like MygPoClient does when flushing the queue.
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, 'src')
+
+from gpodder import minidb  # isort:skip
+from gpodder.my import EpisodeAction, SubscribeAction  # isort:skip
+
+
+def measure(label, func):
+    started = time.perf_counter()
+    result = func()
+    print('%-28s %8.3fs' % (label, time.perf_counter() - started))
+    return result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    with tempfile.TemporaryDirectory() as tmp:
+        store = minidb.Store(os.path.join(tmp, 'gpodder.net'))
+        print('%d episode actions' % count)
+
+        measure('save', lambda: store.save(
+            EpisodeAction('http://example.com/feed%d' % (i % 50), 'http://example.com/%d.mp3' % i,
+                          'device', 'play', 1600000000 + i, 0, i % 3600, 3600) for i in range(count)))
+        measure('commit', store.commit)
+        actions = measure('load', lambda: store.load(EpisodeAction))
+        assert len(actions) == count
+        measure('remove (flush queue)', lambda: store.remove(actions))
+        measure('commit', store.commit)
+        assert not store.load(EpisodeAction)
+
+        store.save(SubscribeAction.add('http://example.com/feed%d' % i) for i in range(count // 10))
+        measure('remove by value (%d)' % (count // 10), lambda: store.remove(
+            SubscribeAction.add('http://example.com/feed%d' % i) for i in range(count // 10)))
+        assert not store.load(SubscribeAction)
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
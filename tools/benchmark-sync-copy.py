@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# Benchmark copying episodes to a local sync target (gpodder.util.copy_local_file)
+#
+# Usage: PYTHONPATH=src tools/benchmark-sync-copy.py TARGET_FOLDER [FILES] [MIB] [STREAMS]
+#
+# Copies FILES files of MIB MiB each to TARGET_FOLDER (e.g. a mounted SD
+# card) with 1 to STREAMS concurrent copies, with copy_local_file() and
+# with plain read() and write() calls.
+
+import concurrent.futures
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, 'src')
+
+from gpodder import util  # isort:skip
+
+
+def plain_copy(from_path, to_path):
+    with open(from_path, 'rb') as src, open(to_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst, 1024 * 1024)
+
+
+def measure(label, copy, files, target, streams):
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(streams) as executor:
+        for future in [executor.submit(copy, f, os.path.join(target, os.path.basename(f))) for f in files]:
+            future.result()
+    os.sync()
+    elapsed = time.perf_counter() - started
+    size = sum(os.path.getsize(f) for f in files)
+    print('%-16s %d streams: %6.2fs %8.1f MiB/s' % (label, streams, elapsed, size / elapsed / 1024 / 1024))
+    for f in files:
+        os.remove(os.path.join(target, os.path.basename(f)))
+
+
+def main():
+    target = sys.argv[1]
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    mib = int(sys.argv[3]) if len(sys.argv) > 3 else 32
+    max_streams = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+
+    with tempfile.TemporaryDirectory() as tmp:
+        files = []
+        for i in range(count):
+            filename = os.path.join(tmp, 'episode%d.mp3' % i)
+            with open(filename, 'wb') as fp:
+                fp.write(os.urandom(mib * 1024 * 1024))
+            files.append(filename)
+
+        for streams in range(1, max_streams + 1):
+            measure('read/write', plain_copy, files, target, streams)
+            measure('copy_local_file', util.copy_local_file, files, target, streams)
+
+
+if __name__ == '__main__':
+    main()